@@ -0,0 +1,161 @@
+"""Synthetic ROMS-like grid and forcing for benchmarking LADiM
+
+A coastal ocean on a ROMS type grid, without any input files:
+
+  Grid: rectangular grid with s-coordinates, a shelf and slope
+        bathymetry, and a land mask with a coast and a peninsula.
+  Forcing: analytic 3D velocity, a sheared along-shelf current with a
+        tidal oscillation, on the staggered u- and v-points,
+        and an analytic temperature field for ibm_forcing.
+
+The classes derive from the ROMS gridforce module, so the particle
+tracking uses the same sampling code (z2s, sample3DUV) as with real
+ROMS forcing. New "forcing frames" are computed analytically at the
+forcing period, instead of read from file.
+
+Grid arguments in the gridforce section of the configuration, with
+defaults: imax = 400, jmax = 300, N = 32, dx = 800 [m],
+forcing_period = 3600 [s], and an optional subgrid = [i0, i1, j0, j1]
+"""
+
+# ----------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ----------------------------------
+
+import logging
+
+import numpy as np
+
+from ladim.gridforce import ROMS
+
+
+class Grid(ROMS.Grid):
+    """Synthetic ROMS grid"""
+
+    def __init__(self, config):
+
+        logging.info("Initializing synthetic ROMS-type grid object")
+        gconf = config["gridforce"]
+        imax = gconf.get("imax", 400)
+        jmax = gconf.get("jmax", 300)
+
+        # Optional subgrid, as for ROMS, None for no limitation
+        whole_grid = [1, imax - 1, 1, jmax - 1]
+        limits = list(gconf.get("subgrid", whole_grid))
+        for ind, val in enumerate(limits):
+            if val is None:
+                limits[ind] = whole_grid[ind]
+        self.i0, self.i1, self.j0, self.j1 = limits
+        self.imax = self.i1 - self.i0
+        self.jmax = self.j1 - self.j0
+        self.xmin = float(self.i0)
+        self.xmax = float(self.i1 - 1)
+        self.ymin = float(self.j0)
+        self.ymax = float(self.j1 - 1)
+
+        # Vertical grid
+        self.N = gconf.get("N", 32)
+        self.hc = 20.0
+        self.Vtransform = 2
+        self.Cs_r = ROMS.s_stretch(self.N, 6.0, 2.0, stagger="rho", Vstretching=4)
+        self.Cs_w = ROMS.s_stretch(self.N, 6.0, 2.0, stagger="w", Vstretching=4)
+
+        # Coast along the western boundary, peninsula at mid-grid
+        # Shelf with slope, from 20 m at the coast to 3000 m
+        jj, ii = np.mgrid[self.j0 : self.j1, self.i0 : self.i1].astype(float)
+        coast = 0.1 * imax + 0.15 * imax * np.exp(-(((jj - 0.5 * jmax) / (0.1 * jmax)) ** 2))
+        dist = (ii - coast) / imax  # Relative distance from coast
+        self.M = (dist > 0).astype(int)
+        self.H = 20 + 2980 / (1 + np.exp(-20 * (dist - 0.3)))
+        self.H[self.M == 0] = 20.0
+
+        dx = float(gconf.get("dx", 800.0))
+        self.dx = dx + np.zeros(self.H.shape)
+        self.dy = self.dx
+        self.lon = 5.0 + ii * dx / 60000.0
+        self.lat = 60.0 + jj * dx / 111000.0
+        self.angle = np.zeros(self.H.shape)
+
+        self.z_r = ROMS.sdepth(self.H, self.hc, self.Cs_r, stagger="rho", Vtransform=2)
+        self.z_w = ROMS.sdepth(self.H, self.hc, self.Cs_w, stagger="w", Vtransform=2)
+
+        # Land masks at u- and v-points
+        M = self.M
+        Mu = np.zeros((self.jmax, self.imax + 1), dtype=int)
+        Mu[:, 1:-1] = M[:, :-1] * M[:, 1:]
+        Mu[:, 0] = M[:, 0]
+        Mu[:, -1] = M[:, -1]
+        self.Mu = Mu
+        Mv = np.zeros((self.jmax + 1, self.imax), dtype=int)
+        Mv[1:-1, :] = M[:-1, :] * M[1:, :]
+        Mv[0, :] = M[0, :]
+        Mv[-1, :] = M[-1, :]
+        self.Mv = Mv
+
+
+class Forcing(ROMS.Forcing):
+    """Analytic forcing on the synthetic grid"""
+
+    def __init__(self, config, grid):
+
+        logging.info("Initiating synthetic forcing")
+        self._grid = grid
+        self.ibm_forcing = config["ibm_forcing"]
+        period = config["gridforce"].get("forcing_period", 3600)
+        stepdiff = max(period // config["dt"], 1)
+        self.dt = config["dt"]
+        # Forcing frames at whole forcing periods since 2000-01-01,
+        # also when starting between frames
+        self.time0 = int(
+            (np.datetime64(config["start_time"], "s") - np.datetime64("2000-01-01", "s"))
+            / np.timedelta64(1, "s")
+        )
+        first = -((self.time0 // self.dt) % stepdiff)
+        self.steps = list(range(first, config["numsteps"] + stepdiff + 1, stepdiff))
+        self.stepdiff = np.diff(self.steps)
+
+        # Vertical structure at u- and v-points
+        z_r = grid.z_r / grid.H  # -1 at bottom, 0 at surface
+        self._shear_u = np.concatenate((z_r[:, :, :1], z_r), axis=2)
+        self._shear_v = np.concatenate((z_r[:, :1, :], z_r), axis=1)
+
+        # Interpolate to time step -1, as in ROMS.Forcing
+        prestep, nextstep = self.steps[0], self.steps[1]
+        stepdiff = nextstep - prestep
+        self.U, self.V = self._read_velocity(prestep)
+        self.Unew, self.Vnew = self._read_velocity(nextstep)
+        self.dU = (self.Unew - self.U) / stepdiff
+        self.dV = (self.Vnew - self.V) / stepdiff
+        if prestep == 0:  # Start at a forcing time
+            self.Unew = self.U
+            self.Vnew = self.V
+        self.U = self.U - (prestep + 1) * self.dU
+        self.V = self.V - (prestep + 1) * self.dV
+        for name in self.ibm_forcing:
+            self[name] = self._read_field(name, prestep)
+            self[name + "new"] = self._read_field(name, nextstep)
+            self["d" + name] = (self[name + "new"] - self[name]) / stepdiff
+            self[name] = self[name] - (prestep + 1) * self["d" + name]
+
+    def _read_velocity(self, n):
+        """Compute the velocity at time step n"""
+        seconds = self.time0 + n * self.dt
+        tide = 0.3 * np.cos(2 * np.pi * seconds / 44712.0)  # M2 period
+        # Along-shelf jet, decaying with depth, plus cross-shelf tide
+        U = (0.1 * tide * (1 + self._shear_u)).astype("f4")
+        V = (0.5 + 0.4 * self._shear_u[:, :, :-1]).astype("f4")
+        V = np.concatenate((V[:, :1, :], V), axis=1)
+        V *= (1 + 0.2 * tide) * (1 + self._shear_v)
+        np.multiply(U, self._grid.Mu, out=U)
+        np.multiply(V, self._grid.Mv, out=V)
+        return U, V
+
+    def _read_field(self, name, n):
+        """Compute a scalar field, temperature, at time step n"""
+        seconds = self.time0 + n * self.dt
+        return (8.0 + 4.0 * np.exp(self._grid.z_r / 200.0)
+                + 0.5 * np.sin(2 * np.pi * seconds / 86400.0)).astype("f4")
+
+    def close(self):
+        pass
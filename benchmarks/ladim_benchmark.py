@@ -0,0 +1,229 @@
+"""Benchmark suite for LADiM with synthetic forcing
+
+Runs LADiM on the synthetic ROMS-like grid and forcing in
+gridforce_synthetic.py, sweeping the number of particles, the
+advection scheme, diffusion, the output period and the number of
+parallel workers and threads. Each case runs in a fresh python
+process, and the results (time steps per second, particle steps per
+second and peak memory) are written as JSON lines for plotting
+scaling curves or regression tracking.
+
+The peak memory of a case is the peak of the main process plus the
+number of workers times the peak of the largest worker process, an
+upper estimate as the peaks need not coincide.
+
+Usage examples:
+
+  python ladim_benchmark.py
+  python ladim_benchmark.py --particles 1000 100000 10000000 --advection RK4
+  python ladim_benchmark.py --diffusion 0 1 --output_period 0 3600 --steps 48
+  python ladim_benchmark.py --particles 1000000 --workers 1 2 4 8
+  python ladim_benchmark.py --particles 1000000 --threads 1 2 4 8
+
+Output period 0 means no particle output. Run from this directory.
+
+"""
+
+# ----------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ----------------------------------
+
+import os
+import sys
+import json
+import argparse
+import itertools
+import subprocess
+import tempfile
+from io import StringIO
+
+import numpy as np
+import yaml
+
+# Number of distinct release positions, the particles are
+# multiplied up by the mult column in the release file
+RELEASE_POINTS = 1000
+
+
+def make_release(filename, grid_args, num_particles):
+    """Release file with the particles spread over the sea area"""
+    from gridforce_synthetic import Grid
+
+    grid = Grid(dict(gridforce=grid_args))
+    rng = np.random.default_rng(0)
+    points = min(RELEASE_POINTS, num_particles)
+    X = []
+    Y = []
+    while len(X) < points:
+        x = rng.uniform(grid.xmin + 2, grid.xmax - 2)
+        y = rng.uniform(grid.ymin + 2, grid.ymax - 2)
+        if grid.atsea(np.array([x]), np.array([y]))[0]:
+            X.append(x)
+            Y.append(y)
+    mult = np.full(points, num_particles // points)
+    mult[: num_particles % points] += 1
+    Z = rng.uniform(0, 50, points)
+    with open(filename, mode="w") as fid:
+        for m, x, y, z in zip(mult, X, Y, Z):
+            fid.write(f"{m} 2000-01-01T00 {x:.3f} {y:.3f} {z:.2f}\n")
+
+
+def make_config(case, workdir):
+    """Configuration for a benchmark case"""
+    hours = case["steps"] * case["dt"] / 3600
+    conf = dict(
+        time_control=dict(
+            start_time="2000-01-01 00:00:00",
+            stop_time=str(
+                np.datetime64("2000-01-01T00") + np.timedelta64(int(hours * 3600), "s")
+            ).replace("T", " "),
+        ),
+        files=dict(particle_release_file=os.path.join(workdir, "bench.rls")),
+        particle_release=dict(
+            variables=["mult", "release_time", "X", "Y", "Z"],
+            mult="int",
+            release_time="time",
+            particle_variables=["release_time"],
+        ),
+        gridforce=dict(module="gridforce_synthetic", **case["grid"]),
+        numerics=dict(
+            dt=[case["dt"], "s"],
+            advection=case["advection"],
+            diffusion=case["diffusion"],
+        ),
+        progress=dict(interval=0),
+        parallel=dict(
+            workers=case.get("workers", 1), threads=case.get("threads", 1), seed=0
+        ),
+    )
+    if case["output_period"]:
+        conf["files"]["output_file"] = os.path.join(workdir, "bench.nc")
+        conf["output_variables"] = dict(
+            outper=[case["output_period"], "s"],
+            format="NETCDF4",
+            particle=["release_time"],
+            instance=["pid", "X", "Y", "Z"],
+            release_time=dict(ncformat="f8", units="seconds since reference_time"),
+            pid=dict(ncformat="i4"),
+            X=dict(ncformat="f4"),
+            Y=dict(ncformat="f4"),
+            Z=dict(ncformat="f4"),
+        )
+    return yaml.safe_dump(conf)
+
+
+def run_case(case):
+    """Run a single case in this process, return the results"""
+    import logging
+    import ladim
+    from ladim.timing import timer
+    from ladim.memory import peak_rss
+
+    with tempfile.TemporaryDirectory() as workdir:
+        make_release(os.path.join(workdir, "bench.rls"), case["grid"], case["particles"])
+        config = make_config(case, workdir)
+        ladim.main(StringIO(config), loglevel=logging.WARNING)
+        output_size = (
+            os.path.getsize(os.path.join(workdir, "bench.nc"))
+            if case["output_period"]
+            else 0
+        )
+
+    seconds = timer.total["time loop"]
+    steps = case["steps"] + 1
+    workers = case.get("workers", 1)
+    main_rss = peak_rss()
+    worker_rss = peak_rss(children=True) if workers > 1 else 0
+    return dict(
+        case,
+        seconds=seconds,
+        steps_per_second=steps / seconds,
+        particle_steps_per_second=case["particles"] * steps / seconds,
+        peak_rss_MB=(main_rss + workers * worker_rss) / 2 ** 20,
+        main_rss_MB=main_rss / 2 ** 20,
+        worker_rss_MB=worker_rss / 2 ** 20,
+        output_MB=output_size / 2 ** 20,
+        phases={name: timer.total[name] for name in sorted(timer.total)},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LADiM benchmark suite")
+    parser.add_argument(
+        "--particles", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+    )
+    parser.add_argument(
+        "--advection", nargs="+", default=["EF", "RK2", "RK4"], choices=["EF", "RK2", "RK4"]
+    )
+    parser.add_argument("--diffusion", type=float, nargs="+", default=[0.0, 1.0])
+    parser.add_argument(
+        "--output_period", type=int, nargs="+", default=[0, 3600],
+        help="Seconds between output, 0 for no output",
+    )
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1],
+        help="Number of parallel worker processes",
+    )
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1],
+        help="Number of threads for the sampling",
+    )
+    parser.add_argument("--steps", type=int, default=24, help="Number of time steps")
+    parser.add_argument("--dt", type=int, default=600, help="Time step [s]")
+    parser.add_argument("--imax", type=int, default=400)
+    parser.add_argument("--jmax", type=int, default=300)
+    parser.add_argument("--N", type=int, default=32, help="Number of s-levels")
+    parser.add_argument("--results", default="benchmark_results.jsonl")
+    parser.add_argument("--case", help=argparse.SUPPRESS)  # Internal, single case
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    grid = dict(imax=args.imax, jmax=args.jmax, N=args.N)
+    print(f"{'particles':>10s} {'adv':>4s} {'diff':>5s} {'outper':>7s} {'wrk':>3s} {'thr':>3s}"
+          f" {'steps/s':>9s} {'part.steps/s':>13s} {'peak MB':>9s}")
+    with open(args.results, mode="a") as fid:
+        for particles, advection, diffusion, output_period, workers, threads in (
+            itertools.product(
+                args.particles,
+                args.advection,
+                args.diffusion,
+                args.output_period,
+                args.workers,
+                args.threads,
+            )
+        ):
+            case = dict(
+                particles=particles,
+                advection=advection,
+                diffusion=diffusion,
+                output_period=output_period,
+                workers=workers,
+                threads=threads,
+                steps=args.steps,
+                dt=args.dt,
+                grid=grid,
+            )
+            result = subprocess.run(
+                [sys.executable, __file__, "--case", json.dumps(case)],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                print(result.stderr)
+                raise SystemExit(result.returncode)
+            R = json.loads(result.stdout.split("\n")[-2])
+            fid.write(json.dumps(R) + "\n")
+            print(
+                f"{particles:10d} {advection:>4s} {diffusion:5.1f}"
+                f" {output_period:7d} {workers:3d} {threads:3d}"
+                f" {R['steps_per_second']:9.2f} {R['particle_steps_per_second']:13.3g}"
+                f" {R['peak_rss_MB']:9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Benchmark the LADiM NetCDF output
+
+Writes synthetic particle distributions through ladim.output.OutPut
+and reports write throughput and file size for different storage
+settings.
+
+Usage examples:
+
+  python output_benchmark.py --particles 1000000 --records 10
+  python output_benchmark.py --format NETCDF4 --complevel 1 --chunksize 262144
+  python output_benchmark.py --sweep --particles 100000
+
+"""
+
+# ----------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ----------------------------------
+
+import os
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from ladim.output import OutPut
+
+
+class Release:
+    """Stand-in for the particle releaser"""
+
+    def __init__(self, num_particles):
+        self.total_particle_count = num_particles
+        self.particle_variables = dict(
+            release_time=np.zeros(num_particles, dtype="f8")
+        )
+
+
+class State:
+    """Synthetic model state, a slowly dying random walk"""
+
+    def __init__(self, num_particles, seed=0):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        self.pid = np.arange(num_particles)
+        self.X = rng.uniform(10, 500, num_particles)
+        self.Y = rng.uniform(10, 500, num_particles)
+        self.Z = rng.uniform(0, 50, num_particles)
+        self.timestep = 0
+        self.timestamp = np.datetime64("2000-01-01", "s")
+
+    def step(self, dt):
+        n = len(self)
+        self.X += self.rng.normal(0, 0.5, n)
+        self.Y += self.rng.normal(0, 0.5, n)
+        self.Z = np.abs(self.Z + self.rng.normal(0, 1, n))
+        # Kill 1 percent of the particles
+        alive = self.rng.random(n) > 0.01
+        for name in ["pid", "X", "Y", "Z"]:
+            setattr(self, name, getattr(self, name)[alive])
+        self.timestep += 1
+        self.timestamp += np.timedelta64(dt, "s")
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __len__(self):
+        return len(self.pid)
+
+
+def make_config(args, output_format, encoding):
+    return dict(
+        output_file=args.output_file,
+        output_instance=["pid", "X", "Y", "Z"],
+        output_particle=["release_time"],
+        output_format=output_format,
+        output_numrec=0,
+        output_encoding=encoding,
+        nc_encoding=dict(),
+        skip_initial=False,
+        dt=3600,
+        num_output=args.records,
+        reference_time=np.datetime64("2000-01-01", "s"),
+        nc_attributes=dict(
+            release_time=dict(ncformat="f8"),
+            pid=dict(ncformat="i4"),
+            X=dict(ncformat="f4"),
+            Y=dict(ncformat="f4"),
+            Z=dict(ncformat="f4"),
+        ),
+    )
+
+
+def run(args, output_format, encoding):
+    """Write the output, return (seconds, raw bytes, file bytes)"""
+    config = make_config(args, output_format, encoding)
+    out = OutPut(config, Release(args.particles))
+    state = State(args.particles)
+    elapsed = 0.0
+    nbytes = 0
+    for _ in range(args.records):
+        tic = time.perf_counter()
+        out.write(state, grid=None)
+        elapsed += time.perf_counter() - tic
+        nbytes += 16 * len(state)  # pid, X, Y, Z, 4 bytes each
+        state.step(config["dt"])
+    filesize = os.path.getsize(args.output_file)
+    os.remove(args.output_file)
+    return elapsed, nbytes, filesize
+
+
+def report(label, elapsed, nbytes, filesize):
+    MB = 1024 * 1024
+    print(
+        f"{label:48s} {elapsed:8.3f} s {nbytes / MB / elapsed:9.1f} MB/s"
+        f" {filesize / MB:9.1f} MB  ratio {nbytes / filesize:5.2f}"
+    )
+
+
+def settings(args):
+    """Generate (label, format, encoding) for the runs"""
+    if not args.sweep:
+        encoding = dict()
+        if args.complevel is not None:
+            encoding["zlib"] = args.complevel > 0
+            encoding["complevel"] = args.complevel
+        if args.shuffle is not None:
+            encoding["shuffle"] = args.shuffle == "on"
+        if args.chunksize:
+            encoding["chunksizes"] = [args.chunksize]
+        if args.lsd is not None:
+            encoding["least_significant_digit"] = args.lsd
+        label = f"{args.format} {encoding}"
+        yield label, args.format, encoding
+        return
+
+    yield "NETCDF3_64BIT_OFFSET", "NETCDF3_64BIT_OFFSET", dict()
+    for complevel, shuffle, chunk, lsd in itertools.product(
+        [0, 1, 4], [False, True], [2 ** 14, 2 ** 18], [None, 3]
+    ):
+        encoding = dict(
+            zlib=complevel > 0, complevel=complevel, shuffle=shuffle, chunksizes=[chunk]
+        )
+        if lsd is not None:
+            encoding["least_significant_digit"] = lsd
+        label = f"NETCDF4 z{complevel} s{int(shuffle)} c{chunk} lsd={lsd}"
+        yield label, "NETCDF4", encoding
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LADiM output")
+    parser.add_argument("--particles", type=int, default=100000)
+    parser.add_argument("--records", type=int, default=10)
+    parser.add_argument("--format", default="NETCDF4")
+    parser.add_argument("--complevel", type=int, default=None)
+    parser.add_argument("--shuffle", choices=["on", "off"], default=None)
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--lsd", type=int, default=None,
+                        help="least_significant_digit")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Run a predefined set of settings")
+    parser.add_argument("--output_file", default="bench_output.nc")
+    args = parser.parse_args()
+
+    print(f"particles = {args.particles}, records = {args.records}")
+    for label, output_format, encoding in settings(args):
+        report(label, *run(args, output_format, encoding))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark per-time reading of LADiM output with postladim
+
+Writes a synthetic particle file and reads the particle distribution
+at every time frame, as done by the animation scripts in the
+examples, by three paths:
+
+  position   pf.position(t), xarray DataArrays with time and pid
+  raw        pf.raw("X", t), pf.raw("Y", t), numpy arrays
+  positions  pf.positions(), one read of the whole time range
+
+and reports the time per frame and the speedup relative to
+pf.position.
+
+Usage examples:
+
+  python postladim_benchmark.py --particles 10000 --frames 200
+  python postladim_benchmark.py --particles 1000000 --frames 20
+
+"""
+
+# ----------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ----------------------------------
+
+import os
+import time
+import argparse
+
+import numpy as np
+from netCDF4 import Dataset
+
+from postladim import ParticleFile
+
+
+def make_file(filename, num_particles, num_frames, seed=0):
+    """Particle file with a slowly dying set of particles"""
+    rng = np.random.default_rng(seed)
+    alive = num_particles - np.arange(num_frames) * num_particles // (2 * num_frames)
+    with Dataset(filename, mode="w") as nc:
+        nc.createDimension("particle", num_particles)
+        nc.createDimension("particle_instance", None)
+        nc.createDimension("time", num_frames)
+        v = nc.createVariable("time", "f8", ("time",))
+        v.units = "seconds since 2000-01-01 00:00:00"
+        nc.createVariable("particle_count", "i4", ("time",))
+        nc.createVariable("pid", "i4", ("particle_instance",))
+        nc.createVariable("X", "f4", ("particle_instance",))
+        nc.createVariable("Y", "f4", ("particle_instance",))
+        nc.variables["time"][:] = 3600 * np.arange(num_frames)
+        nc.variables["particle_count"][:] = alive
+        start = 0
+        for count in alive:
+            end = start + count
+            pid = np.arange(num_particles - count, num_particles)
+            nc.variables["pid"][start:end] = pid
+            nc.variables["X"][start:end] = rng.uniform(0, 500, count)
+            nc.variables["Y"][start:end] = rng.uniform(0, 500, count)
+            start = end
+
+
+def read_position(pf):
+    for t in range(pf.num_times):
+        X, Y = pf.position(t)
+        np.asarray(X), np.asarray(Y)
+
+
+def read_raw(pf):
+    for t in range(pf.num_times):
+        pf.raw("X", t), pf.raw("Y", t)
+
+
+def read_positions(pf):
+    for X, Y in pf.positions():
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark postladim reading")
+    parser.add_argument("--particles", type=int, default=10000)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of repeats")
+    parser.add_argument("--particle_file", default="bench_particles.nc")
+    args = parser.parse_args()
+
+    print(f"particles = {args.particles}, frames = {args.frames}")
+    make_file(args.particle_file, args.particles, args.frames)
+    cases = [
+        ("position", read_position),
+        ("raw", read_raw),
+        ("positions", read_positions),
+    ]
+    try:
+        best = {}
+        for label, func in cases:
+            times = []
+            for _ in range(args.repeat):
+                with ParticleFile(args.particle_file) as pf:
+                    tic = time.perf_counter()
+                    func(pf)
+                    times.append(time.perf_counter() - tic)
+            best[label] = min(times) / args.frames
+        for label, _ in cases:
+            speedup = best["position"] / best[label]
+            ms = 1000 * best[label]
+            print(f"{label:10s} {ms:9.3f} ms/frame  speedup {speedup:6.1f}")
+    finally:
+        os.remove(args.particle_file)
+
+
+if __name__ == "__main__":
+    main()
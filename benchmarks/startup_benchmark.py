@@ -0,0 +1,70 @@
+"""Benchmark the LADiM startup time
+
+Measures cold import of ladim and configuration in fresh
+interpreters, the fixed cost of every (short) LADiM run, and lists
+the heavy modules loaded at that point.
+
+Usage examples:
+
+  python startup_benchmark.py
+  python startup_benchmark.py --repeat 20 ../examples/streak/ladim.yaml
+
+"""
+
+# ----------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ----------------------------------
+
+import sys
+import argparse
+import subprocess
+
+import numpy as np
+
+SCRIPT = """
+import sys, time, logging
+tic = time.perf_counter()
+import ladim
+toc = time.perf_counter()
+from ladim.configuration import configure
+logging.disable()
+with open({config!r}) as fid:
+    configure(fid)
+print(toc - tic, time.perf_counter() - tic)
+print(*[m for m in {modules!r} if m in sys.modules])
+"""
+
+HEAVY_MODULES = ["numpy", "pandas", "netCDF4", "xarray", "yaml", "zarr"]
+
+
+def run(config, repeat):
+    """Return import and import+configure times, and loaded modules"""
+    script = SCRIPT.format(config=config, modules=HEAVY_MODULES)
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        line1, line2 = result.stdout.split("\n")[:2]
+        times.append([float(t) for t in line1.split()])
+    return np.array(times), line2.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LADiM startup")
+    parser.add_argument(
+        "config_file", nargs="?", default="../examples/obstacle/ladim.yaml"
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    times, modules = run(args.config_file, args.repeat)
+    median = np.median(times, axis=0)
+    print(f"import ladim             {1000 * median[0]:8.1f} ms")
+    print(f"import and configure     {1000 * median[1]:8.1f} ms")
+    print(f"heavy modules loaded     {' '.join(modules)}")
+
+
+if __name__ == "__main__":
+    main()
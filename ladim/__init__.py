@@ -1,3 +1,13 @@
-from .main import main
+from typing import Any
 
 __version__ = "1.2"
+
+
+def __getattr__(name: str) -> Any:
+    """Import the main function on first use, keeping "import ladim" fast"""
+    if name == "main":
+        from .main import main
+
+        globals()["main"] = main  # Replaces the submodule attribute
+        return main
+    raise AttributeError(f"module 'ladim' has no attribute '{name}'")
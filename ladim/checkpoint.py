@@ -0,0 +1,126 @@
+"""Checkpoint files for restarting LADiM
+
+A checkpoint holds the full model state at a time step: all instance
+variables of the live particles, the particle variables of the
+particles released so far, the position of the particle releaser and
+the state of the random number generator. A restart from a checkpoint
+reads O(live particles) data and continues the run exactly as the
+original, independent of the particle output file.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import os
+import logging
+from typing import Any, Dict
+
+import numpy as np
+from netCDF4 import Dataset
+
+from .state import State  # For mypy
+from .release import ParticleReleaser  # For mypy
+from .output import global_attributes
+
+CHECKPOINT_TYPE = "LADiM checkpoint"
+
+
+class Checkpoint:
+    """Periodic writer of checkpoint files
+
+    Configuration items, see configure_checkpoint:
+      file, period
+    """
+
+    def __init__(self, config: Dict[str, Any], release: ParticleReleaser) -> None:
+
+        logging.info("Initializing checkpoint output")
+        conf = config["checkpoint"]
+        self.filename = conf["file"]
+        self.period = conf["period"]  # Time steps
+        self.dt = config["dt"]
+        self.release = release
+
+    def write(self, state: State, step: int) -> None:
+        """Write checkpoint if at the end of a period
+
+        The file is overwritten, keeping only the latest checkpoint.
+        It is written under a temporary name and renamed in place, so
+        an interrupted run leaves a complete checkpoint.
+        """
+        if step == 0 or step % self.period != 0:
+            return
+        tmpname = self.filename + ".tmp"
+        with Dataset(tmpname, mode="w", format="NETCDF4") as nc:
+            self._write_netcdf(nc, state)
+        os.replace(tmpname, self.filename)
+        logging.info(f"Checkpoint written at {state.timestamp}")
+
+    def _write_netcdf(self, nc: Dataset, state: State) -> None:
+        released = self.release._particle_count
+        nc.createDimension("particle_instance", len(state))
+        nc.createDimension("particle", released)
+
+        v = nc.createVariable("pid", "i8", ("particle_instance",))
+        v[:] = state.pid
+        for name in state.instance_variables:
+            value = np.asarray(state[name])
+            v = nc.createVariable(name, value.dtype, ("particle_instance",))
+            v[:] = value
+
+        for name, values in self.release.particle_variables.items():
+            value = np.asarray(values[:released])
+            dtype = str if value.dtype.kind in "OU" else value.dtype
+            v = nc.createVariable(name, dtype, ("particle",))
+            v[:] = value
+
+        # Legacy numpy global generator, used by the diffusion
+        rng_name, key, pos, has_gauss, cached_gaussian = np.random.get_state()
+        nc.createDimension("rng_key", len(key))
+        v = nc.createVariable("rng_key", "u4", ("rng_key",))
+        v.generator = rng_name
+        v.pos = pos
+        v.has_gauss = has_gauss
+        v.cached_gaussian = cached_gaussian
+        v[:] = key
+
+        attrs = global_attributes()
+        attrs["type"] = CHECKPOINT_TYPE
+        attrs.update(
+            time=str(state.timestamp),
+            dt=self.dt,
+            particle_count=released,
+            release_index=self.release._index,
+        )
+        nc.setncatts(attrs)
+
+
+def is_checkpoint(nc: Dataset) -> bool:
+    """Check if an open NetCDF file is a checkpoint"""
+    return getattr(nc, "type", "") == CHECKPOINT_TYPE
+
+
+def checkpoint_time(nc: Dataset) -> np.datetime64:
+    """Model time of a checkpoint"""
+    return np.datetime64(nc.time).astype("M8[s]")
+
+
+def read_checkpoint(state: State, nc: Dataset, config: Dict[str, Any]) -> None:
+    """Restore the model state from a checkpoint"""
+    if nc.dt != config["dt"]:
+        logging.warning("Time step differs from the checkpoint, restart not exact")
+    nc.set_auto_mask(False)
+    state.pid = nc.variables["pid"][:]
+    for name in state.instance_variables:
+        try:
+            state[name] = nc.variables[name][:]
+        except KeyError:
+            logging.critical(f"Variable {name} not in checkpoint file")
+            raise SystemExit(1)
+
+    v = nc.variables["rng_key"]
+    np.random.set_state(
+        (v.generator, v[:], int(v.pos), int(v.has_gauss), float(v.cached_gaussian))
+    )
@@ -0,0 +1,159 @@
+"""Gridded concentration output for LADiM
+
+Accumulates (weighted) particle counts in grid cells during the run,
+and writes the aggregated concentration fields to NetCDF.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+from netCDF4 import Dataset
+
+from .gridforce import Grid  # For mypy
+from .state import State  # For mypy
+from .output import global_attributes
+
+
+class Concentration:
+    """Concentration of particles in grid cells
+
+    The particles are counted at every sample period, and the
+    counts are aggregated (summed or averaged) over the aggregation
+    period, giving one record per period in the output file.
+
+    Configuration items, see configure_concentration:
+      output_file, period, sample_period, weight, filters,
+      subgrid, statistic, format
+    """
+
+    def __init__(self, config: Dict[str, Any], grid: Grid) -> None:
+
+        logging.info("Initializing concentration output")
+
+        conf = config["concentration"]
+        self.filename = conf["output_file"]
+        self.period = conf["period"]  # Time steps
+        self.sample_period = conf["sample_period"]  # Time steps
+        self.weight = conf["weight"]
+        # Filters, name -> [min, max), None for no limit
+        self.filters = conf["filters"]
+        self.statistic = conf["statistic"]
+        self.format = conf["format"]
+        self.reference_time = config["reference_time"]
+
+        # Grid cells, default = the whole (sub)grid
+        if "subgrid" in conf:
+            self.i0, self.i1, self.j0, self.j1 = conf["subgrid"]
+        else:
+            self.i0 = int(round(grid.xmin))
+            self.i1 = int(round(grid.xmax)) + 1
+            self.j0 = int(round(grid.ymin))
+            self.j1 = int(round(grid.ymax)) + 1
+        self.shape = (self.j1 - self.j0, self.i1 - self.i0)
+
+        # Accumulators for the present period
+        self.C = np.zeros(self.shape)
+        self.record = -1  # Aggregation period in the accumulator
+        self.times: List[float] = []  # Sample times in the period
+        self.outcount = 0  # Number of records written
+        self.nc = self._define_netcdf()
+
+    def write(self, state: State, grid: Grid) -> None:
+        """Count the particles, write record if finished period"""
+
+        step = state.timestep
+        if step % self.sample_period != 0:
+            return
+
+        record = step // self.period
+        if record != self.record:
+            self._flush()
+            self.record = record
+
+        # Particles in the grid cells, satisfying the filters
+        I = np.round(state.X).astype(int) - self.i0
+        J = np.round(state.Y).astype(int) - self.j0
+        jmax, imax = self.shape
+        keep = (0 <= I) & (I < imax) & (0 <= J) & (J < jmax)
+        for name, (vmin, vmax) in self.filters.items():
+            if vmin is not None:
+                keep &= state[name] >= vmin
+            if vmax is not None:
+                keep &= state[name] < vmax
+
+        if self.weight:
+            weights = np.asarray(state[self.weight])[keep]
+        else:
+            weights = None
+        self.C += np.bincount(
+            J[keep] * imax + I[keep], weights=weights, minlength=imax * jmax
+        ).reshape(self.shape)
+
+        tdelta = state.timestamp - self.reference_time
+        self.times.append(float(tdelta.astype("m8[s]").astype("int")))
+
+    def _flush(self) -> None:
+        """Write the accumulated period to file"""
+        if not self.times:  # Nothing accumulated
+            return
+        C = self.C
+        if self.statistic == "mean":
+            C = C / len(self.times)
+        t = self.outcount
+        self.nc.variables["time"][t] = np.mean(self.times)
+        self.nc.variables["conc"][t, :, :] = C
+        self.nc.sync()
+        logging.debug(f"Concentration record {t} written")
+        self.outcount += 1
+        self.C = np.zeros(self.shape)
+        self.times = []
+
+    def close(self) -> None:
+        """Write the last period and close the file"""
+        self._flush()
+        self.nc.close()
+
+    def _define_netcdf(self) -> Dataset:
+        """Define the concentration NetCDF file"""
+        logging.debug(f"Defining concentration file: {self.filename}")
+        nc = Dataset(self.filename, mode="w", format=self.format)
+        jmax, imax = self.shape
+        nc.createDimension("time", None)
+        nc.createDimension("Y", jmax)
+        nc.createDimension("X", imax)
+
+        v = nc.createVariable("time", "f8", ("time",))
+        v.long_name = "mean time of aggregation period"
+        v.standard_name = "time"
+        timeref = str(self.reference_time).replace("T", " ")
+        v.units = f"seconds since {timeref}"
+
+        v = nc.createVariable("X", "i4", ("X",))
+        v.long_name = "grid X-coordinate of cell centre"
+        v[:] = np.arange(self.i0, self.i1)
+        v = nc.createVariable("Y", "i4", ("Y",))
+        v.long_name = "grid Y-coordinate of cell centre"
+        v[:] = np.arange(self.j0, self.j1)
+
+        v = nc.createVariable(
+            "conc", "f4", ("time", "Y", "X"), zlib=True, chunksizes=(1, jmax, imax)
+        )
+        v.long_name = "particle concentration"
+        if self.weight:
+            v.units = f"{self.weight} per grid cell"
+        else:
+            v.units = "particles per grid cell"
+        v.cell_methods = f"time: {self.statistic}"
+        v.sample_period = f"{self.sample_period} time steps"
+        v.aggregation_period = f"{self.period} time steps"
+        for name, (vmin, vmax) in self.filters.items():
+            setattr(v, f"filter_{name}", f"[{vmin}, {vmax})")
+
+        nc.setncatts(global_attributes())
+        return nc
@@ -14,10 +14,23 @@ from typing import Dict, Any
 import numpy as np
 import yaml
 import yaml.parser
-from netCDF4 import Dataset, num2date
 
 Config = Dict[str, Any]  # type of the config dictionary
 
+# Keywords in output_variables controlling NetCDF4 storage
+# These are passed on to netCDF4.createVariable, not written as attributes
+ENCODING_KEYS = [
+    "zlib",
+    "complevel",
+    "shuffle",
+    "chunksizes",
+    "chunksize",  # Alias for chunksizes
+    "fletcher32",
+    "least_significant_digit",
+    "significant_digits",
+    "quantize_mode",
+]
+
 
 def configure_ibm(conf: Dict[str, Any]) -> Config:
     """Configure the IBM module
@@ -106,6 +119,383 @@ def configure_gridforce(conf: Dict[str, Any]) -> Config:
     return D
 
 
+def check_encoding(name: str, encoding: Any) -> Dict[str, Any]:
+    """Check and normalize NetCDF4 storage options
+
+    Input: name of the variable (or section), dictionary of options
+
+    Return: dictionary of options to netCDF4.createVariable
+
+    A single integer chunksize is accepted for the
+    one-dimensional output variables.
+    """
+    if not encoding:
+        return {}
+    if not isinstance(encoding, dict):
+        logging.error(f"Output encoding for {name} must be a mapping")
+        raise SystemExit(1)
+    encoding = dict(encoding)
+    if "chunksize" in encoding:
+        encoding["chunksizes"] = encoding.pop("chunksize")
+    for key in encoding:
+        if key not in ENCODING_KEYS:
+            logging.error(f"Unknown output encoding for {name}: {key}")
+            raise SystemExit(1)
+    if isinstance(encoding.get("chunksizes"), int):
+        encoding["chunksizes"] = [encoding["chunksizes"]]
+    return encoding
+
+
+def configure_hooks(conf: Dict[str, Any]) -> Config:
+    """Configure the hooks into the time loop
+
+    Input: raw conf dictionary from configuration file
+
+    Return: dictionary with list of hook modules,
+            other items are stored for the hook modules
+    """
+    D = conf.get("hooks")
+    if not D:
+        return {}
+    logging.info("Configuration: Hooks")
+    D = dict(D)
+    modules = D.pop("module", [])
+    if isinstance(modules, str):
+        modules = [modules]
+    D["modules"] = modules
+    for key, value in D.items():
+        logging.info(f"    {key:15s}: {value}")
+    return D
+
+
+def configure_output(conf: Dict[str, Any], config: Config) -> None:
+    """Configure the particle output
+
+    Input: raw conf dictionary from configuration file,
+           configuration dictionary with time control and numerics
+
+    The output items are added to the configuration dictionary
+    """
+    logging.info("Configuration: Output Control")
+    try:
+        output_format = conf["output_variables"]["format"]
+    except KeyError:
+        output_format = "NETCDF3_64BIT_OFFSET"
+    config["output_format"] = output_format
+    logging.info(f'    {"output_format":15s}: {config["output_format"]}')
+
+    # Default storage options for all output variables, NetCDF4 only
+    try:
+        encoding = conf["output_variables"]["encoding"]
+    except KeyError:
+        encoding = None
+    config["output_encoding"] = check_encoding("encoding", encoding)
+    if config["output_encoding"]:
+        logging.info(f'    {"output_encoding":15s}: {config["output_encoding"]}')
+        if not output_format.startswith("NETCDF4") and output_format != "zarr":
+            logging.warning("Output encoding ignored for format " + output_format)
+
+    # Subsampling of the particles written
+    try:
+        subsample = conf["output_variables"]["subsample"]
+    except KeyError:
+        subsample = None
+    config["output_subsample"] = subsample or {}
+    for key in config["output_subsample"]:
+        if key not in ["every", "fraction", "seed", "bbox", "polygon"]:
+            logging.error(f"Unknown output subsample option: {key}")
+            raise SystemExit(1)
+    if subsample:
+        logging.info(f'    {"subsample":15s}: {subsample}')
+
+    # Skip output of initial state, useful for restart
+    # with cold start the default is False
+    # with warm start, the default is true
+    try:
+        skip_initial = conf["output_variables"]["skip_initial_output"]
+    except KeyError:
+        skip_initial = config["start"] == "warm"
+    config["skip_initial"] = skip_initial
+    logging.info(f"    {'Skip inital output':15s}: {skip_initial}")
+
+    try:
+        numrec = conf["output_variables"]["numrec"]
+    except KeyError:
+        numrec = 0
+    config["output_numrec"] = numrec
+    logging.info(f'    {"output_numrec":15s}: {config["output_numrec"]}')
+
+    outper = np.timedelta64(*tuple(conf["output_variables"]["outper"]))
+    outper = outper.astype("m8[s]").astype("int") // config["dt"]
+    config["output_period"] = outper
+    logging.info(f'    {"output_period":15s}: {config["output_period"]} timesteps')
+    config["num_output"] = 1 + config["numsteps"] // config["output_period"]
+    logging.info(f'    {"numsteps":15s}: {config["numsteps"]}')
+    config["output_particle"] = conf["output_variables"]["particle"]
+    config["output_instance"] = conf["output_variables"]["instance"]
+    config["nc_attributes"] = dict()
+    config["nc_encoding"] = dict()
+    for name in config["output_particle"] + config["output_instance"]:
+        value = conf["output_variables"][name]
+        if "units" in value:
+            if value["units"] == "seconds since reference_time":
+                timeref = str(config["reference_time"]).replace("T", " ")
+                value["units"] = f"seconds since {timeref}"
+        # Separate storage options from the attributes
+        config["nc_attributes"][name] = {
+            key: val for key, val in value.items() if key not in ENCODING_KEYS
+        }
+        config["nc_encoding"][name] = check_encoding(
+            name, {key: val for key, val in value.items() if key in ENCODING_KEYS}
+        )
+    logging.info("    particle variables")
+    for name in config["output_particle"]:
+        logging.info(8 * " " + name)
+        for item in config["nc_attributes"][name].items():
+            logging.info(12 * " " + "{:11s}: {}".format(*item))
+    logging.info("    particle instance variables")
+    for name in config["output_instance"]:
+        logging.info(8 * " " + name)
+        for item in config["nc_attributes"][name].items():
+            logging.info(12 * " " + "{:11s}: {}".format(*item))
+    for name, value in config["nc_encoding"].items():
+        if value:
+            logging.info(f"    {name} encoding: {value}")
+
+
+def configure_concentration(conf: Dict[str, Any], config: Config) -> Config:
+    """Configure gridded concentration output
+
+    Input: raw conf dictionary from configuration file,
+           configuration dictionary with time control
+
+    Return: dictionary with concentration configuration,
+            empty if no concentration output
+
+    Periods are converted to number of time steps
+    """
+    D = conf.get("concentration")
+    if not D:
+        return {}
+    logging.info("Configuration: Concentration output")
+    if "output_file" not in D:
+        logging.error("No output_file for concentration output")
+        raise SystemExit(1)
+    D = dict(D)
+    # Sampling and aggregation periods, default every time step
+    # and the whole simulation
+    for key, default in [
+        ("sample_period", 1),
+        ("period", config["numsteps"] + 1),
+    ]:
+        if key in D:
+            value = np.timedelta64(*tuple(D[key]))
+            D[key] = int(value.astype("m8[s]").astype("int")) // config["dt"]
+        else:
+            D[key] = default
+    if D["period"] % D["sample_period"] != 0:
+        logging.warning("Concentration period is not a multiple of sample period")
+    D.setdefault("weight", None)
+    D.setdefault("filters", {})
+    D.setdefault("statistic", "mean")
+    if D["statistic"] not in ["mean", "sum"]:
+        logging.error("Concentration statistic must be mean or sum")
+        raise SystemExit(1)
+    D.setdefault("format", "NETCDF4")
+    for key, value in D.items():
+        logging.info(f"    {key:15s}: {value}")
+    return D
+
+
+def configure_checkpoint(conf: Dict[str, Any], config: Config) -> Config:
+    """Configure checkpoint files for restart
+
+    Input: raw conf dictionary from configuration file,
+           configuration dictionary with time control
+
+    Return: dictionary with checkpoint configuration,
+            empty if no checkpoints
+
+    The period is converted to number of time steps
+    """
+    D = conf.get("checkpoint")
+    if not D:
+        return {}
+    logging.info("Configuration: Checkpoint")
+    if "file" not in D or "period" not in D:
+        logging.error("Checkpoint needs file and period")
+        raise SystemExit(1)
+    D = dict(D)
+    value = np.timedelta64(*tuple(D["period"]))
+    D["period"] = int(value.astype("m8[s]").astype("int")) // config["dt"]
+    if D["period"] < 1:
+        logging.error("Checkpoint period shorter than time step")
+        raise SystemExit(1)
+    for key, value in D.items():
+        logging.info(f"    {key:15s}: {value}")
+    return D
+
+
+def configure_timing(conf: Dict[str, Any]) -> Config:
+    """Configure the timing reports
+
+    Input: raw conf dictionary from configuration file
+
+    Return: dictionary with optional json_file and step_file,
+            empty if only the summary is wanted
+    """
+    D = conf.get("timing")
+    if not D:
+        return {}
+    logging.info("Configuration: Timing")
+    for key, value in D.items():
+        if key not in ["json_file", "step_file"]:
+            logging.error(f"Unknown timing option: {key}")
+            raise SystemExit(1)
+        logging.info(f"    {key:15s}: {value}")
+    return dict(D)
+
+
+def configure_progress(conf: Dict[str, Any]) -> Config:
+    """Configure the progress reports
+
+    Input: raw conf dictionary from configuration file
+
+    Return: dictionary with the interval in wall clock seconds,
+            zero for no progress reports
+    """
+    D = conf.get("progress") or {}
+    interval = D.get("interval", 60)
+    if interval < 0:
+        logging.error("Progress interval must be non-negative")
+        raise SystemExit(1)
+    logging.info("Configuration: Progress")
+    logging.info(f'    {"interval":15s}: {interval} s')
+    return dict(interval=interval)
+
+
+def configure_memory(conf: Dict[str, Any]) -> Config:
+    """Configure the memory accounting
+
+    Input: raw conf dictionary from configuration file
+
+    Return: dictionary with log interval in wall clock seconds and
+            budget in bytes, empty if no memory accounting
+    """
+    if "memory" not in conf:
+        return {}
+    D = conf["memory"] or {}  # Accept empty section
+    logging.info("Configuration: Memory")
+    interval = D.get("interval", 60)
+    budget = D.get("budget")  # MB
+    logging.info(f'    {"interval":15s}: {interval} s')
+    logging.info(f'    {"budget":15s}: {budget} MB')
+    if budget is not None:
+        budget = int(budget * 1024 * 1024)
+    return dict(interval=interval, budget=budget)
+
+
+def configure_parallel(conf: Dict[str, Any]) -> Config:
+    """Configure the parallel execution
+
+    Input: raw conf dictionary from configuration file
+
+    Return: dictionary with number of worker processes, one for a
+            serial run, the random seed of the first worker, and the
+            number of threads and particles per chunk for the sampling
+    """
+    D = conf.get("parallel") or {}
+    workers = D.get("workers", 1)
+    seed = D.get("seed")
+    threads = D.get("threads", 1)
+    chunk_size = D.get("chunk_size", 65536)
+    for name, value in [
+        ("workers", workers),
+        ("threads", threads),
+        ("chunk_size", chunk_size),
+    ]:
+        if not isinstance(value, int) or value < 1:
+            logging.error(f"Parallel {name} must be a positive integer")
+            raise SystemExit(1)
+    if workers > 1 or threads > 1:
+        logging.info("Configuration: Parallel")
+        logging.info(f'    {"workers":15s}: {workers}')
+        logging.info(f'    {"seed":15s}: {seed}')
+        logging.info(f'    {"threads":15s}: {threads}')
+        logging.info(f'    {"chunk_size":15s}: {chunk_size}')
+    return dict(workers=workers, seed=seed, threads=threads, chunk_size=chunk_size)
+
+
+def configure_segments(conf: Dict[str, Any], config: Config) -> Config:
+    """Configure time-segmented runs
+
+    Input: raw conf dictionary from configuration file,
+           configuration dictionary with time control and output
+
+    Return: dictionary with release window length and maximum particle
+            lifetime in seconds, and number of processes,
+            empty if no segments section
+    """
+    D = conf.get("segments")
+    if not D:
+        return {}
+    logging.info("Configuration: Segments")
+    if "length" not in D or "lifetime" not in D:
+        logging.error("Segments need length and lifetime")
+        raise SystemExit(1)
+    length, lifetime = (
+        int(np.timedelta64(*tuple(D[key])).astype("m8[s]").astype("int"))
+        for key in ["length", "lifetime"]
+    )
+    processes = D.get("processes", 1)
+    logging.info(f'    {"length":15s}: {length} s')
+    logging.info(f'    {"lifetime":15s}: {lifetime} s')
+    logging.info(f'    {"processes":15s}: {processes}')
+    period = config["dt"]
+    if config["output_file"]:
+        period *= config["output_period"]
+    if length % period:
+        logging.error("Segment length must be a multiple of the output period")
+        raise SystemExit(1)
+    if length <= 0 or lifetime < 0 or processes < 1:
+        logging.error("Segment length, lifetime or processes out of range")
+        raise SystemExit(1)
+    return dict(length=length, lifetime=lifetime, processes=processes)
+
+
+def configure_decomposition(conf: Dict[str, Any], config: Config) -> Config:
+    """Configure the spatial domain decomposition
+
+    Input: raw conf dictionary from configuration file,
+           configuration dictionary with time step and parallel
+
+    Return: dictionary with number of tiles, halo width in grid cells
+            and time steps between rebalancing (zero for never),
+            empty if no decomposition
+    """
+    D = conf.get("decomposition")
+    if not D:
+        return {}
+    logging.info("Configuration: Decomposition")
+    tiles = D.get("tiles", 2)
+    halo = D.get("halo", 10)
+    if "rebalance" in D:
+        value = np.timedelta64(*tuple(D["rebalance"]))
+        rebalance = int(value.astype("m8[s]").astype("int")) // config["dt"]
+    else:
+        rebalance = 0
+    logging.info(f'    {"tiles":15s}: {tiles}')
+    logging.info(f'    {"halo":15s}: {halo}')
+    logging.info(f'    {"rebalance":15s}: {rebalance} timesteps')
+    if not isinstance(tiles, int) or tiles < 1 or not isinstance(halo, int) or halo < 2:
+        logging.error("Decomposition needs positive tiles and a halo of at least 2")
+        raise SystemExit(1)
+    if config["parallel"]["workers"] > 1:
+        logging.error("Decomposition can not be combined with parallel workers")
+        raise SystemExit(1)
+    return dict(tiles=tiles, halo=halo, rebalance=rebalance)
+
+
 # ---------------------------------------
 
 
@@ -139,14 +529,23 @@ def configure(config_stream) -> Config:
         conf["time_control"].get("reference_time", config["start_time"])
     ).astype("M8[s]")
     logging.info(f'    {"reference time":15s}: {config["reference_time"]}')
+    # release_stop_time, optional, no release at or after this time
+    config["release_stop_time"] = conf["time_control"].get("release_stop_time")
+    if config["release_stop_time"] is not None:
+        config["release_stop_time"] = np.datetime64(
+            config["release_stop_time"]
+        ).astype("M8[s]")
+        logging.info(f'    {"release stop":15s}: {config["release_stop_time"]}')
 
     # -------------
     # Files
     # -------------
     logging.info("Configuration: Files")
     logging.info(f'    {"config_stream":15s}: {config_stream}')
+    config["particle_release_file"] = conf["files"]["particle_release_file"]
+    # No particle output, if only gridded concentration is wanted
+    config["output_file"] = conf["files"].get("output_file")
     for name in ["particle_release_file", "output_file"]:
-        config[name] = conf["files"][name]
         logging.info(f"    {name:15s}: {config[name]}")
 
     try:
@@ -159,15 +558,22 @@ def configure(config_stream) -> Config:
 
     # Override start time for warm start
     if config["start"] == "warm":
+        from netCDF4 import Dataset, num2date
+        from .checkpoint import is_checkpoint, checkpoint_time
+
         try:
             nc = Dataset(config["warm_start_file"])
         except (FileNotFoundError, OSError):
             logging.error(f"Could not open warm start file,{config['warm_start_file']}")
             raise SystemExit(1)
-        tvar = nc.variables["time"]
-        # Use last record in restart file
-        warm_start_time = np.datetime64(num2date(tvar[-1], tvar.units))
-        warm_start_time = warm_start_time.astype("M8[s]")
+        if is_checkpoint(nc):
+            warm_start_time = checkpoint_time(nc)
+        else:
+            tvar = nc.variables["time"]
+            # Use last record in restart file
+            warm_start_time = np.datetime64(num2date(tvar[-1], tvar.units))
+            warm_start_time = warm_start_time.astype("M8[s]")
+        nc.close()
         config["start_time"] = warm_start_time
         logging.info(f"    Warm start at {warm_start_time}")
 
@@ -246,57 +652,37 @@ def configure(config_stream) -> Config:
     # -----------------
     # Output control
     # -----------------
-    logging.info("Configuration: Output Control")
-    try:
-        output_format = conf["output_variables"]["format"]
-    except KeyError:
-        output_format = "NETCDF3_64BIT_OFFSET"
-    config["output_format"] = output_format
-    logging.info(f'    {"output_format":15s}: {config["output_format"]}')
+    if config["output_file"]:
+        configure_output(conf, config)
+    else:
+        logging.info("Configuration: No particle output")
 
-    # Skip output of initial state, useful for restart
-    # with cold start the default is False
-    # with warm start, the default is true
-    try:
-        skip_initial = conf["output_variables"]["skip_initial_output"]
-    except KeyError:
-        skip_initial = config["start"] == "warm"
-    config["skip_initial"] = skip_initial
-    logging.info(f"    {'Skip inital output':15s}: {skip_initial}")
+    # --- Concentration output ---
+    config["concentration"] = configure_concentration(conf, config)
 
-    try:
-        numrec = conf["output_variables"]["numrec"]
-    except KeyError:
-        numrec = 0
-    config["output_numrec"] = numrec
-    logging.info(f'    {"output_numrec":15s}: {config["output_numrec"]}')
+    # --- Checkpoints for restart ---
+    config["checkpoint"] = configure_checkpoint(conf, config)
 
-    outper = np.timedelta64(*tuple(conf["output_variables"]["outper"]))
-    outper = outper.astype("m8[s]").astype("int") // config["dt"]
-    config["output_period"] = outper
-    logging.info(f'    {"output_period":15s}: {config["output_period"]} timesteps')
-    config["num_output"] = 1 + config["numsteps"] // config["output_period"]
-    logging.info(f'    {"numsteps":15s}: {config["numsteps"]}')
-    config["output_particle"] = conf["output_variables"]["particle"]
-    config["output_instance"] = conf["output_variables"]["instance"]
-    config["nc_attributes"] = dict()
-    for name in config["output_particle"] + config["output_instance"]:
-        value = conf["output_variables"][name]
-        if "units" in value:
-            if value["units"] == "seconds since reference_time":
-                timeref = str(config["reference_time"]).replace("T", " ")
-                value["units"] = f"seconds since {timeref}"
-        config["nc_attributes"][name] = conf["output_variables"][name]
-    logging.info("    particle variables")
-    for name in config["output_particle"]:
-        logging.info(8 * " " + name)
-        for item in config["nc_attributes"][name].items():
-            logging.info(12 * " " + "{:11s}: {:s}".format(*item))
-    logging.info("    particle instance variables")
-    for name in config["output_instance"]:
-        logging.info(8 * " " + name)
-        for item in config["nc_attributes"][name].items():
-            logging.info(12 * " " + "{:11s}: {:s}".format(*item))
+    # --- Timing reports ---
+    config["timing"] = configure_timing(conf)
+
+    # --- Hooks into the time loop ---
+    config["hooks"] = configure_hooks(conf)
+
+    # --- Progress reports ---
+    config["progress"] = configure_progress(conf)
+
+    # --- Memory accounting ---
+    config["memory"] = configure_memory(conf)
+
+    # --- Parallel execution ---
+    config["parallel"] = configure_parallel(conf)
+
+    # --- Spatial domain decomposition ---
+    config["decomposition"] = configure_decomposition(conf, config)
+
+    # --- Time-segmented runs ---
+    config["segments"] = configure_segments(conf, config)
 
     # --- Numerics ---
 
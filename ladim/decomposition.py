@@ -0,0 +1,353 @@
+"""Spatial domain decomposition of LADiM
+
+For the largest runs, not even one copy of the forcing fits in the
+memory of the machine. With a decomposition section in the
+configuration, the grid is split in tiles, strips along the X axis,
+each with a halo of extra grid cells. A tile worker process has its
+own gridforce Grid and Forcing on the subgrid of its tile and halo,
+reading and interpolating only that part of the forcing.
+
+The main process keeps the model state, particle release and output.
+At every time step, the particles are sent to the worker owning their
+position, moved there, and sent back. A particle leaving a tile is
+thereby taken over by the neighbour tile at the next step.
+
+The tile boundaries are placed to give the same number of particles
+per tile, initially from the release positions. Optionally, the tiles
+are rebalanced at a fixed interval, from the present particle
+distribution. The tile workers then build their grid and forcing anew.
+
+Requirements:
+  A ROMS-type gridforce module, with subgrid limits i0, i1, j0, j1
+  The halo, in grid cells, must exceed the largest particle
+  displacement in a time step, with a margin for the interpolation.
+  This is checked at every time step, stopping the run if not.
+
+Apart from the random numbers in the diffusion, the results are
+identical to a serial run. Rebalancing restarts the time
+interpolation of the forcing, which may give small differences.
+The main process keeps a grid object for the whole domain, for the
+release, output and the boundary positions.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import os
+import sys
+import atexit
+import logging
+import traceback
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .gridforce import Grid, Forcing
+from .state import State
+
+Config = Dict[str, Any]
+
+
+def balanced_bounds(X: np.ndarray, tiles: int, i0: int, i1: int) -> np.ndarray:
+    """Tile boundaries in X with equal number of particles per tile
+
+    Returns tiles + 1 increasing integer boundaries from i0 to i1,
+    the tiles are at least one grid cell wide.
+    """
+    if len(X) == 0:
+        bounds = np.linspace(i0, i1, tiles + 1)
+    else:
+        bounds = np.quantile(X, np.linspace(0, 1, tiles + 1))
+    bounds = np.round(bounds).astype(int)
+    bounds[0], bounds[-1] = i0, i1
+    # At least one cell wide, from the left then from the right
+    for k in range(1, tiles):
+        bounds[k] = max(bounds[k], bounds[k - 1] + 1)
+    for k in range(tiles - 1, 0, -1):
+        bounds[k] = min(bounds[k], bounds[k + 1] - 1)
+    return bounds
+
+
+def tile_limits(bounds: np.ndarray, halo: int, limits: List[int]) -> List[List[int]]:
+    """Subgrid limits [i0, i1, j0, j1] of the tiles, with halo"""
+    i0, i1, j0, j1 = limits
+    return [
+        [max(i0, int(b0) - halo), min(i1, int(b1) + halo), j0, j1]
+        for b0, b1 in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def owner(X: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """Index of the tile owning the positions"""
+    return np.searchsorted(bounds[1:-1], X, side="right")
+
+
+class TileGrid:
+    """Grid of a tile, counting positions outside the halo
+
+    The tracker kills particles moving out of the grid. At the tile
+    edges inside the domain, this means the halo is too narrow.
+    Otherwise the same as the grid of the tile.
+    """
+
+    def __init__(self, grid: Grid, limits: List[int], domain: List[int]) -> None:
+        self._grid = grid
+        self.lower = limits[0] > domain[0]  # Internal edges
+        self.upper = limits[1] < domain[1]
+        self.outside = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._grid, name)
+
+    def ingrid(self, X: np.ndarray, Y: np.ndarray) -> np.ndarray:
+        X = np.asarray(X)
+        g = self._grid
+        # Out of the grid in X, tested at the middle in Y
+        xmid, ymid = 0.5 * (g.xmin + g.xmax), 0.5 * (g.ymin + g.ymax)
+        outside = ~g.ingrid(X, np.full(len(X), ymid))
+        outside &= (self.lower & (X < xmid)) | (self.upper & (X > xmid))
+        self.outside += int(outside.sum())
+        return g.ingrid(X, Y)
+
+
+def tile_worker(
+    conn: Any, config: Config, limits: List[int], domain: List[int]
+) -> None:
+    """Tile worker process
+
+    Messages and replies:
+      ("update", step): forcing update, reply None
+      ("field", X, Y, Z, name): sampled field
+      ("move", arrays, step, timestep, timestamp): moved arrays with alive,
+          and the number of particles moved out of the halo
+      ("retile", limits, step, start_time): new subgrid from step, reply None
+      None: stop the worker, no reply
+    Errors are replied as ("error", text), else as ("ok", value).
+    """
+    # Allow gridforce and IBM modules in current directory
+    sys.path.insert(0, os.getcwd())
+
+    def build(limits, step0, start_time):
+        tile_config = dict(
+            config,
+            gridforce=dict(config["gridforce"], subgrid=list(limits)),
+            start_time=start_time,
+            numsteps=config["numsteps"] - step0,
+        )
+        grid = Grid(tile_config)
+        return grid, Forcing(tile_config, grid), TileGrid(grid, limits, domain)
+
+    step0 = 0
+    try:
+        grid, forcing, tile_grid = build(limits, step0, config["start_time"])
+        state = State(config, grid)
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+        return
+    conn.send(("ok", None))
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        try:
+            if message[0] == "update":
+                forcing.update(message[1] - step0)
+                value = None
+            elif message[0] == "field":
+                value = forcing.field(*message[1:])
+            elif message[0] == "move":
+                arrays, step, state.timestep, state.timestamp = message[1:]
+                for name, values in arrays.items():
+                    state[name] = values
+                tile_grid.outside = 0
+                state.move(tile_grid, forcing, step)
+                value = {name: state[name] for name in state.instance_variables}
+                value["alive"] = state.alive
+                value["outside"] = tile_grid.outside
+            elif message[0] == "retile":
+                limits, step0, start_time = message[1:]
+                forcing.close()
+                grid, forcing, tile_grid = build(limits, step0, start_time)
+                value = None
+            conn.send(("ok", value))
+        except BaseException:
+            conn.send(("error", traceback.format_exc()))
+    forcing.close()
+
+
+class TileForcing:
+    """The forcing of the tiles, seen from the main process"""
+
+    def __init__(self, decomposition: "Decomposition") -> None:
+        self.decomposition = decomposition
+        self.forcing = None  # No forcing arrays in the main process
+
+    def update(self, step: int) -> None:
+        self.decomposition.request([("update", step)] * self.decomposition.tiles)
+
+    def field(self, X: Any, Y: Any, Z: Any, name: str) -> np.ndarray:
+        return self.decomposition.field(X, Y, Z, name)
+
+    def close(self) -> None:
+        self.decomposition.close()
+
+
+class Decomposition:
+    """Tile workers moving the particles in their part of the grid
+
+    Configuration items, see configure_decomposition:
+      tiles: number of tiles and worker processes
+      halo: extra grid cells around each tile
+      rebalance: time steps between rebalancing, zero for never
+
+    Usage, in place of the forcing and the parallel update:
+      decomposition = Decomposition(config, grid, releaser)
+      forcing = decomposition.forcing
+      state.parallel = decomposition
+    """
+
+    def __init__(self, config: Config, grid: Grid, releaser: Any) -> None:
+        D = config["decomposition"]
+        self.tiles = D["tiles"]
+        self.halo = D["halo"]
+        self.rebalance = D["rebalance"]
+        try:
+            g = grid.grid
+            self.limits = [g.i0, g.i1, g.j0, g.j1]
+        except AttributeError:
+            logging.critical("Domain decomposition needs a ROMS-type grid")
+            raise SystemExit(1)
+
+        # Initial balance from the release positions
+        X = [np.repeat(np.asarray(df["X"]), np.asarray(df["mult"])) for df in releaser._B]
+        X = np.concatenate(X) if X else np.array([])
+        self.bounds = balanced_bounds(X, self.tiles, self.limits[0], self.limits[1])
+        logging.info(f"Tile boundaries in X: {list(self.bounds)}")
+
+        worker_config = dict(config, warm_start_file="", hooks={})
+        # Fork when available, the ladim script can not be re-imported
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.connections = []
+        self.processes = []
+        for limits in tile_limits(self.bounds, self.halo, self.limits):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=tile_worker,
+                args=(child_conn, worker_config, limits, self.limits),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        atexit.register(self.close)
+        self.receive(self.connections)  # Workers are ready
+
+        self.forcing = TileForcing(self)
+
+    def receive(self, connections: List[Any]) -> List[Any]:
+        """Replies from the workers, stop on error"""
+        replies = [conn.recv() for conn in connections]
+        for status, value in replies:
+            if status == "error":
+                logging.critical("Error in tile worker\n" + value)
+                raise SystemExit(1)
+        return [value for status, value in replies]
+
+    def request(self, messages: List[Any]) -> List[Any]:
+        """Send a message to each worker, None for no message, and reply"""
+        busy = []
+        for conn, message in zip(self.connections, messages):
+            if message is not None:
+                conn.send(message)
+                busy.append(conn)
+        replies = iter(self.receive(busy))
+        return [None if message is None else next(replies) for message in messages]
+
+    def partition(self, X: np.ndarray) -> List[np.ndarray]:
+        """Indices of the particles owned by each tile"""
+        tile = owner(X, self.bounds)
+        return [np.nonzero(tile == k)[0] for k in range(self.tiles)]
+
+    def field(self, X: Any, Y: Any, Z: Any, name: str) -> np.ndarray:
+        """Sample a forcing field by the tile workers"""
+        X, Y, Z = np.asarray(X), np.asarray(Y), np.asarray(Z)
+        parts = self.partition(X)
+        replies = self.request(
+            [("field", X[I], Y[I], Z[I], name) if len(I) else None for I in parts]
+        )
+        F = np.zeros(len(X))
+        for I, values in zip(parts, replies):
+            if len(I):
+                F[I] = values
+        return F
+
+    def update(self, state: State, step: int) -> None:
+        """Move the particles, each by the worker of its tile
+
+        state.timestep and state.timestamp should be advanced
+        """
+        names = ["pid"] + state.instance_variables
+        parts = self.partition(state.X)
+        messages: List[Optional[Any]] = []
+        for I in parts:
+            if len(I):
+                arrays = {name: state[name][I] for name in names}
+                messages.append(("move", arrays, step, state.timestep, state.timestamp))
+            else:
+                messages.append(None)
+        replies = self.request(messages)
+
+        moved = {name: np.array(state[name]) for name in state.instance_variables}
+        alive = np.ones(len(state), dtype=bool)
+        for k, (I, reply) in enumerate(zip(parts, replies)):
+            if len(I):
+                if reply["outside"]:
+                    logging.critical(
+                        f"{reply['outside']} particles moved out of the halo of "
+                        f"tile {k}, increase the halo of {self.halo} grid cells"
+                    )
+                    raise SystemExit(1)
+                for name in state.instance_variables:
+                    moved[name][I] = reply[name]
+                alive[I] = reply["alive"]
+        for name, values in moved.items():
+            state[name] = values
+        state.alive = alive
+
+        if self.rebalance and (step + 1) % self.rebalance == 0:
+            self.retile(state.X[alive], step + 1, state.timestamp)
+
+    def retile(self, X: np.ndarray, step: int, start_time: np.datetime64) -> None:
+        """New tile boundaries from the particle positions"""
+        bounds = balanced_bounds(X, self.tiles, self.limits[0], self.limits[1])
+        if np.all(bounds == self.bounds):
+            return
+        logging.info(f"Rebalanced tile boundaries in X: {list(bounds)}")
+        self.bounds = bounds
+        self.request(
+            [
+                ("retile", limits, step, start_time)
+                for limits in tile_limits(bounds, self.halo, self.limits)
+            ]
+        )
+
+    def close(self) -> None:
+        """Stop the tile workers"""
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
@@ -0,0 +1,251 @@
+"""Ensemble runs of LADiM
+
+Runs several release scenarios, the ensemble members, over the same
+period with the same grid and forcing. The forcing is read and
+interpolated once per time step, and drives the model state,
+particle releaser and output of every member.
+
+Each member is a configuration overlay, merged into a common base
+configuration. Example ensemble file
+
+  # Base configuration, common to all members
+  base: ladim.yaml
+  members:
+    - name: farm1
+      files:
+        particle_release_file: farm1.rls
+        output_file: farm1.nc
+    - name: deep
+      # Overlay in a file, merged with the items below
+      file: deep.yaml
+      files:
+        output_file: deep.nc
+
+The members must agree on the time control, time step, gridforce and
+ibm_forcing, and have different output files. They must also agree on
+the timing, progress and memory settings, which apply to the ensemble
+as a whole. The memory budget is for the sum of all members.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import time
+import logging
+from io import StringIO
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+from .configuration import configure
+from .gridforce import Grid, Forcing
+from .release import ParticleReleaser
+from .state import State
+from .timing import timer
+from .progress import Progress
+from .memory import Memory
+
+Config = Dict[str, Any]
+
+# Configuration items that must be common to all members
+SHARED_ITEMS = ["start_time", "stop_time", "dt", "gridforce", "ibm_forcing"]
+# Run settings for the whole ensemble, must also be common
+RUN_ITEMS = ["timing", "progress", "memory"]
+
+
+def merge(base: Dict[str, Any], overlay: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge an overlay into a base configuration, recursively
+
+    Dictionaries are merged, other values from the overlay replace
+    those in the base. The base is not changed.
+    """
+    merged = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def member_confs(ensemble_stream) -> List[Tuple[str, Dict[str, Any]]]:
+    """Raw configuration of the members, with names"""
+    ens = yaml.safe_load(ensemble_stream)
+    base: Dict[str, Any] = {}
+    if ens.get("base"):
+        with open(ens["base"], encoding="utf8") as fid:
+            base = yaml.safe_load(fid)
+    members = ens.get("members") or []
+    if not members:
+        logging.error("Ensemble without members")
+        raise SystemExit(1)
+    confs = []
+    for n, member in enumerate(members):
+        member = dict(member)
+        name = str(member.pop("name", f"member{n}"))
+        conf = base
+        if "file" in member:
+            with open(member.pop("file"), encoding="utf8") as fid:
+                conf = merge(conf, yaml.safe_load(fid))
+        confs.append((name, merge(conf, member)))
+    return confs
+
+
+def configure_ensemble(ensemble_stream) -> List[Tuple[str, Config]]:
+    """Configure the ensemble members and check compatibility"""
+    configs = []
+    for name, conf in member_confs(ensemble_stream):
+        logging.info(f"Configuring ensemble member {name}")
+        configs.append((name, configure(StringIO(yaml.safe_dump(conf)))))
+
+    name0, config0 = configs[0]
+    output_files = set()
+    for name, config in configs:
+        for item in SHARED_ITEMS + RUN_ITEMS:
+            if config[item] != config0[item]:
+                logging.error(f"Ensemble members {name0} and {name} differ in {item}")
+                raise SystemExit(1)
+        if config["parallel"]["workers"] > 1:
+            logging.error("Parallel workers are not supported in ensemble runs")
+            raise SystemExit(1)
+        if config["decomposition"]:
+            logging.error("Domain decomposition is not supported in ensemble runs")
+            raise SystemExit(1)
+        if config["output_file"]:
+            if config["output_file"] in output_files:
+                logging.error(f"Ensemble member {name} has no unique output file")
+                raise SystemExit(1)
+            output_files.add(config["output_file"])
+    return configs
+
+
+class Member:
+    """The model state, releaser and output of an ensemble member"""
+
+    def __init__(self, name: str, config: Config, grid: Grid) -> None:
+        from .main import init_output
+
+        logging.info(f"Initializing ensemble member {name}")
+        self.name = name
+        self.config = config
+        self.releaser = ParticleReleaser(config, grid)
+        self.state = State(config, grid)
+        self.out, self.concentration, self.checkpoint = init_output(
+            config, grid, self.releaser
+        )
+
+    def release(self, forcing: Forcing, step: int, memory: Any = None) -> None:
+        """Release new particles if scheduled, within the memory budget"""
+        if step in self.releaser.steps:
+            state = self.state
+            for hook in state.hooks.pre_release:
+                hook(state, forcing, step)
+            V = next(self.releaser)
+            if memory:
+                memory.check_release(state, len(V))
+            state.append(V, forcing)
+            for hook in state.hooks.post_release:
+                hook(state, forcing, step)
+
+    def write(self, grid: Grid, forcing: Forcing, step: int) -> None:
+        """Particle output, concentration and checkpoint"""
+        state = self.state
+        if self.out and step % self.config["output_period"] == 0:
+            with timer("output"):
+                self.out.write(state, grid)
+            for hook in state.hooks.post_output:
+                hook(state, forcing, step)
+        if self.concentration:
+            with timer("concentration"):
+                self.concentration.write(state, grid)
+        if self.checkpoint:
+            with timer("checkpoint"):
+                self.checkpoint.write(state, step)
+
+    def close(self) -> None:
+        if self.concentration:
+            self.concentration.close()
+
+
+class Ensemble:
+    """The ensemble members, sized by their total number of particles"""
+
+    def __init__(self, configs: List[Tuple[str, Config]], grid: Grid) -> None:
+        self.members = [Member(name, config, grid) for name, config in configs]
+
+    def __len__(self) -> int:
+        return sum(len(member.state) for member in self.members)
+
+    def components(self) -> Dict[str, Any]:
+        """The memory accounting components of the members"""
+        components = {}
+        for member in self.members:
+            components[f"{member.name}.state"] = member.state
+            components[f"{member.name}.release"] = member.releaser
+            components[f"{member.name}.output"] = member.out
+            components[f"{member.name}.conc"] = member.concentration
+        return components
+
+
+def main(ensemble_stream, loglevel=logging.INFO) -> None:
+    """Run an ensemble, with one forcing for all members"""
+
+    logging.getLogger().setLevel(loglevel)
+    configs = configure_ensemble(ensemble_stream)
+    config = configs[0][1]
+    timer.reset(record_steps=bool(config["timing"].get("step_file")))
+
+    grid = Grid(config)
+    forcing = Forcing(config, grid)
+    ensemble = Ensemble(configs, grid)
+    members = ensemble.members
+    progress = Progress(config) if config["progress"]["interval"] else None
+    memory = Memory(config) if config["memory"] else None
+
+    logging.info(f"Starting time loop, ensemble of {len(members)} members")
+    tic = time.perf_counter()
+    for step in range(config["numsteps"] + 1):
+
+        with timer("release"):
+            for member in members:
+                member.release(forcing, step, memory)
+
+        # --- Update forcing, once for the ensemble ---
+        for member in members:
+            for hook in member.state.hooks.pre_forcing:
+                hook(member.state, forcing, step)
+        with timer("forcing"):
+            forcing.update(step)
+        for member in members:
+            for hook in member.state.hooks.post_forcing:
+                hook(member.state, forcing, step)
+
+        for member in members:
+            member.write(grid, forcing, step)
+
+        if memory:
+            memory.update(
+                forcing=forcing.forcing, grid=grid.grid, **ensemble.components()
+            )
+
+        with timer("update"):
+            for member in members:
+                member.state.update(grid, forcing)
+
+        timer.end_step(step)
+        if progress:
+            progress.update(ensemble, step)  # type: ignore
+    timer.add("time loop", time.perf_counter() - tic)
+
+    forcing.close()
+    for member in members:
+        member.close()
+    if memory:
+        logging.info("Peak memory usage\n" + memory.report(memory.peak))
+    logging.info("Timing summary\n" + timer.summary())
+    if config["timing"].get("json_file"):
+        timer.write_json(config["timing"]["json_file"])
+    if config["timing"].get("step_file"):
+        timer.write_csv(config["timing"]["step_file"])
@@ -5,6 +5,11 @@ Main gridforce controller
 import os
 import sys
 import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ladim.timing import timer
 
 # from ladim.configuration import config
 
@@ -64,15 +69,62 @@ class Forcing:
         # self.steps = self.forcing.steps
         # self.U = self.forcing.U
         # self.V = self.forcing.V
+        self.start_threads(config)
+
+    def start_threads(self, config):
+        """Thread pool for chunked sampling, if more than one thread
+
+        NumPy releases the GIL in most of the sampling, so the
+        particle chunks are sampled concurrently. Only the sampling is
+        chunked, the tracker arithmetic runs on the full arrays.
+        A gridforce module may provide velocity_fields(tstep) and
+        sample_velocity(U, V, X, Y, Z), the fields are then
+        interpolated in time once for all chunks.
+        """
+        par = config.get("parallel", {})
+        threads = par.get("threads", 1)
+        self.chunk_size = par.get("chunk_size", 65536)
+        if threads > 1:
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+        else:
+            self.executor = None
+
+    def chunked(self, func, X, Y, Z, *args, **kwargs):
+        """Apply a sampling function by chunks on the thread pool"""
+        if self.executor is None or len(X) <= self.chunk_size:
+            return func(X, Y, Z, *args, **kwargs)
+        n = self.chunk_size
+        futures = [
+            self.executor.submit(
+                func, X[i : i + n], Y[i : i + n], Z[i : i + n], *args, **kwargs
+            )
+            for i in range(0, len(X), n)
+        ]
+        results = [future.result() for future in futures]
+        if isinstance(results[0], tuple):  # Velocity components
+            return tuple(np.concatenate(parts) for parts in zip(*results))
+        return np.concatenate(results)
 
     def update(self, t):
         return self.forcing.update(t)
 
     def velocity(self, X, Y, Z, tstep=0.0):
-        return self.forcing.velocity(X, Y, Z, tstep=tstep)
+        # One call per Runge-Kutta stage
+        with timer("update.tracker.advection.velocity"):
+            if self.executor is None or len(X) <= self.chunk_size:
+                return self.forcing.velocity(X, Y, Z, tstep=tstep)
+            if hasattr(self.forcing, "velocity_fields"):
+                # Interpolate the fields in time once, not per chunk
+                U, V = self.forcing.velocity_fields(tstep)
+                sample = self.forcing.sample_velocity
+                return self.chunked(lambda X, Y, Z: sample(U, V, X, Y, Z), X, Y, Z)
+            return self.chunked(self.forcing.velocity, X, Y, Z, tstep=tstep)
 
     def field(self, X, Y, Z, name):
-        return self.forcing.field(X, Y, Z, name)
+        return self.chunked(self.forcing.field, X, Y, Z, name)
 
     def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
         return self.forcing.close()
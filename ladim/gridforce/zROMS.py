@@ -16,6 +16,7 @@ import logging
 import numpy as np
 from netCDF4 import Dataset, num2date
 from ladim.sample import sample2D
+from ladim.timing import timer
 
 
 class Grid:
@@ -372,9 +373,10 @@ class Forcing:
             if t - 1 in self.steps:  # Need new fields
                 stepdiff = self.stepdiff[self.steps.index(t - 1)]
                 nextstep = t - 1 + stepdiff
-                self.Unew, self.Vnew = self._read_velocity(nextstep)
-                for name in self.ibm_forcing:
-                    self[name + "new"] = self._read_field(name, nextstep)
+                with timer("forcing.read"):
+                    self.Unew, self.Vnew = self._read_velocity(nextstep)
+                    for name in self.ibm_forcing:
+                        self[name + "new"] = self._read_field(name, nextstep)
                 if interpolate_velocity_in_time:
                     self.dU = (self.Unew - self.U) / stepdiff
                     self.dV = (self.Vnew - self.V) / stepdiff
@@ -383,12 +385,13 @@ class Forcing:
                         self["d" + name] = (self[name + "new"] - self[name]) / stepdiff
 
             # "Ordinary" time step (including self.steps+1)
-            if interpolate_velocity_in_time:
-                self.U += self.dU
-                self.V += self.dV
-            if interpolate_ibm_forcing_in_time:
-                for name in self.ibm_forcing:
-                    self[name] += self["d" + name]
+            with timer("forcing.interpolate"):
+                if interpolate_velocity_in_time:
+                    self.U += self.dU
+                    self.V += self.dV
+                if interpolate_ibm_forcing_in_time:
+                    for name in self.ibm_forcing:
+                        self[name] += self["d" + name]
 
     # --------------
 
@@ -452,24 +455,23 @@ class Forcing:
 
         self._nc.close()
 
-    # def sample_velocity(self, X, Y, Z, tstep=0, method='bilinear'):
     def velocity(self, X, Y, Z, tstep=0, method="bilinear"):
 
+        U, V = self.velocity_fields(tstep)
+        return self.sample_velocity(U, V, X, Y, Z, method=method)
+
+    def velocity_fields(self, tstep=0):
+        """Velocity fields interpolated in time, within the time step"""
+        if tstep < 0.001:
+            return self.U, self.V
+        return self.U + tstep * self.dU, self.V + tstep * self.dV
+
+    def sample_velocity(self, U, V, X, Y, Z, method="bilinear"):
+        """Sample given velocity fields at the particle positions"""
         i0 = self._grid.i0
         j0 = self._grid.j0
         K, A = vert_level(self._grid.z_levels, X - i0, Y - j0, Z)
-        if tstep < 0.001:
-            return sample3DUV(self.U, self.V, X - i0, Y - j0, K, A, method=method)
-        else:
-            return sample3DUV(
-                self.U + tstep * self.dU,
-                self.V + tstep * self.dV,
-                X - i0,
-                Y - j0,
-                K,
-                A,
-                method=method,
-            )
+        return sample3DUV(U, V, X - i0, Y - j0, K, A, method=method)
 
     # Simplify to grid cell
     def field(self, X, Y, Z, name):
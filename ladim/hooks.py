@@ -0,0 +1,86 @@
+"""Hooks into the LADiM time loop
+
+A hook module, given in the hooks section of the configuration,
+provides a class Hook, initiated with the configuration dictionary.
+The methods of Hook named by a hook point are called at that point of
+every time step with the arguments (state, forcing, step).
+
+Hook points:
+  pre_release, post_release    around the particle release
+  pre_forcing, post_forcing    around the forcing update
+  post_output                  after the particle output
+  pre_tracker, post_tracker    around the particle tracking
+  pre_ibm, post_ibm            around the IBM update
+
+Example, hook module counting the particles
+
+  class Hook:
+      def __init__(self, config):
+          self.counts = []
+
+      def post_release(self, state, forcing, step):
+          self.counts.append(len(state))
+
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import os
+import sys
+import importlib
+import logging
+from typing import Any, Callable, Dict, List
+
+HOOK_POINTS = [
+    "pre_release",
+    "post_release",
+    "pre_forcing",
+    "post_forcing",
+    "post_output",
+    "pre_tracker",
+    "post_tracker",
+    "pre_ibm",
+    "post_ibm",
+]
+
+Hook = Callable[[Any, Any, int], None]  # (state, forcing, step)
+
+
+class Hooks:
+    """Registry of the hooks
+
+    The hooks at a point are in the list with the point's name,
+    called in order by
+
+      for hook in hooks.post_release:
+          hook(state, forcing, step)
+
+    which costs next to nothing with no hooks registered.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.objects: List[Any] = []  # The Hook instances
+        for point in HOOK_POINTS:
+            setattr(self, point, [])
+        modules = config.get("hooks", {}).get("modules", [])
+        if modules:
+            # Allow hook modules in current directory
+            sys.path.insert(0, os.getcwd())
+        for module_name in modules:
+            logging.info(f"Initializing hook module {module_name}")
+            module = importlib.import_module(module_name)
+            obj = module.Hook(config)
+            self.objects.append(obj)
+            for point in HOOK_POINTS:
+                if hasattr(obj, point):
+                    self.register(point, getattr(obj, point))
+
+    def register(self, point: str, hook: Hook) -> None:
+        """Add a hook at a hook point"""
+        if point not in HOOK_POINTS:
+            logging.error(f"Unknown hook point: {point}")
+            raise SystemExit(1)
+        getattr(self, point).append(hook)
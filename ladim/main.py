@@ -12,6 +12,7 @@ Lagrangian Advection and Diffusion Model
 # ---------------------------------
 
 import sys
+import time
 import logging
 
 import ladim
@@ -19,7 +20,41 @@ from .configuration import configure
 from .gridforce import Grid, Forcing
 from .release import ParticleReleaser
 from .state import State
-from .output import OutPut
+from .timing import timer
+from .progress import Progress
+from .memory import Memory
+
+# The output components, and netCDF4, are imported when configured
+
+
+def init_output(config, grid, releaser):
+    """Initiate the particle output, concentration and checkpoints
+
+    Returns the three components, None for those not configured
+    """
+    if not config["output_file"]:
+        out = None
+    elif config["output_format"] == "zarr":
+        from .output import ZarrOutPut
+
+        out = ZarrOutPut(config, releaser)
+    else:
+        from .output import OutPut
+
+        out = OutPut(config, releaser)
+    if config["concentration"]:
+        from .concentration import Concentration
+
+        concentration = Concentration(config, grid)
+    else:
+        concentration = None
+    if config["checkpoint"]:
+        from .checkpoint import Checkpoint
+
+        checkpoint = Checkpoint(config, releaser)
+    else:
+        checkpoint = None
+    return out, concentration, checkpoint
 
 
 def main(config_stream, loglevel=logging.INFO):
@@ -34,49 +69,126 @@ def main(config_stream, loglevel=logging.INFO):
 
     # --- Configuration ---
     config = configure(config_stream)
+    timer.reset(record_steps=bool(config["timing"].get("step_file")))
 
-    # --- Initiate the grid and the forcing ---
+    # --- Initiate the grid ---
     grid = Grid(config)
-    forcing = Forcing(config, grid)
 
     # --- Initiate particle releaser ---
     releaser = ParticleReleaser(config, grid)
 
+    # --- Initiate the forcing, by the tiles if decomposed ---
+    if config["decomposition"]:
+        from .decomposition import Decomposition
+
+        decomposition = Decomposition(config, grid, releaser)
+        forcing = decomposition.forcing
+    else:
+        forcing = Forcing(config, grid)
+
     #  --- Initiate the model state ---
     state = State(config, grid)
+    if config["parallel"]["workers"] > 1:
+        from .parallel import ParticleParallel
+
+        state.parallel = ParticleParallel(config, grid, forcing, state)
+    elif config["decomposition"]:
+        state.parallel = decomposition
 
     # --- Initiate the output ---
-    out = OutPut(config, releaser)
+    out, concentration, checkpoint = init_output(config, grid, releaser)
     # out.write_particle_variables(releaser)
 
     # ==============
     # Main time loop
     # ==============
 
+    if config["progress"]["interval"]:
+        progress = Progress(config)
+    else:
+        progress = None
+
+    if config["memory"]:
+        memory = Memory(config)
+    else:
+        memory = None
+
+    hooks = state.hooks
     logging.info("Starting time loop")
+    tic = time.perf_counter()
     for step in range(config["numsteps"] + 1):
 
-
         # --- Particle release ---
         if step in releaser.steps:
-            V = next(releaser)
-            state.append(V, forcing)
+            for hook in hooks.pre_release:
+                hook(state, forcing, step)
+            with timer("release"):
+                V = next(releaser)
+                if memory:
+                    memory.check_release(state, len(V))
+                state.append(V, forcing)
+            for hook in hooks.post_release:
+                hook(state, forcing, step)
 
         # --- Update forcing ---
-        forcing.update(step)
+        for hook in hooks.pre_forcing:
+            hook(state, forcing, step)
+        with timer("forcing"):
+            forcing.update(step)
+        for hook in hooks.post_forcing:
+            hook(state, forcing, step)
 
         # --- Save to file ---
         # Save before or after update ???
-        if step % config["output_period"] == 0:
-            out.write(state, grid)
+        if out and step % config["output_period"] == 0:
+            with timer("output"):
+                out.write(state, grid)
+            for hook in hooks.post_output:
+                hook(state, forcing, step)
+        if concentration:
+            with timer("concentration"):
+                concentration.write(state, grid)
+        if checkpoint:
+            with timer("checkpoint"):
+                checkpoint.write(state, step)
+
+        # --- Memory accounting ---
+        if memory:
+            memory.update(
+                state=state,
+                forcing=forcing.forcing,
+                grid=grid.grid,
+                release=releaser,
+                output=out,
+                concentration=concentration,
+            )
 
         # --- Update the model state ---
-        state.update(grid, forcing)
+        with timer("update"):
+            state.update(grid, forcing)
+
+        timer.end_step(step)
+        if progress:
+            progress.update(state, step)
+    timer.add("time loop", time.perf_counter() - tic)
 
     # ========
     # Clean up
     # ========
 
     # TODO: should also close the releaser
+    if state.parallel:
+        state.parallel.close()
     forcing.close()
     # out.close()
+    if concentration:
+        concentration.close()
+
+    # --- Memory and timing reports ---
+    if memory:
+        logging.info("Peak memory usage\n" + memory.report(memory.peak))
+    logging.info("Timing summary\n" + timer.summary())
+    if config["timing"].get("json_file"):
+        timer.write_json(config["timing"]["json_file"])
+    if config["timing"].get("step_file"):
+        timer.write_csv(config["timing"]["step_file"])
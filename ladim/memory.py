@@ -0,0 +1,150 @@
+"""Memory accounting for LADiM
+
+Sums the bytes held in numpy arrays by the model components: the
+state, the forcing fields, the grid arrays, the particle releaser
+and the output buffers. Keeps track of the peak, logs the usage at a
+fixed wall clock interval and optionally stops the run when a memory
+budget is exceeded. The budget is checked before each particle
+release, from an estimate of the new state arrays, and after each
+time step from the measured usage.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import sys
+import time
+import logging
+from typing import Any, Dict, Optional, Set
+
+import numpy as np
+
+MB = 1024 * 1024
+
+
+def array_bytes(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """Bytes held by the numpy arrays of an object
+
+    Counts arrays that are attributes of the object, or values of
+    dictionary attributes. Arrays sharing memory are counted once
+    (within the seen set).
+    """
+    if obj is None:
+        return 0
+    if seen is None:
+        seen = set()
+    if isinstance(obj, dict):
+        values = list(obj.values())
+    else:
+        values = list(vars(obj).values())
+    nbytes = 0
+    for value in values:
+        if isinstance(value, dict):
+            values.extend(value.values())
+        elif isinstance(value, np.ndarray):
+            base = value
+            while isinstance(base.base, np.ndarray):
+                base = base.base
+            if id(base) not in seen:
+                seen.add(id(base))
+                nbytes += base.nbytes
+    return nbytes
+
+
+def memory_usage(**components: Any) -> Dict[str, int]:
+    """Bytes held by each of the components, and their total
+
+    Example:  memory_usage(state=state, forcing=forcing.forcing)
+    """
+    seen: Set[int] = set()
+    usage = {name: array_bytes(obj, seen) for name, obj in components.items()}
+    usage["total"] = sum(usage.values())
+    return usage
+
+
+def peak_rss(children: bool = False) -> int:
+    """Peak resident set size of the process in bytes, 0 if unknown
+
+    With children, the largest of the terminated child processes.
+    """
+    try:
+        import resource
+    except ImportError:  # Not on Windows
+        return 0
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else 1024 * maxrss
+
+
+class Memory:
+    """Tracks the memory of the model components
+
+    Configuration items, see configure_memory:
+      interval: wall clock seconds between memory logs, zero for none
+      budget: maximum number of bytes in the components, None for no limit
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        conf = config["memory"]
+        self.interval = conf["interval"]
+        self.budget = conf["budget"]
+        self.peak: Dict[str, int] = {}  # Largest usage per component
+        self.last_time = time.perf_counter()
+        self.last_total = 0  # Total at the last update
+
+    def check_release(self, state: Any, num_new: int) -> None:
+        """Stop before a release that would exceed the budget
+
+        Estimate: the last measured total with the releases since,
+        plus the new particles times the bytes per particle of the
+        state arrays.
+        """
+        if not self.budget:
+            return
+        names = ["pid"] + list(state.instance_variables)
+        per_particle = sum(np.asarray(state[name]).dtype.itemsize for name in names)
+        estimate = self.last_total + num_new * per_particle
+        if estimate > self.budget:
+            logging.critical(
+                f"Memory budget of {self.budget / MB:.3f} MB would be exceeded "
+                f"by releasing {num_new} particles, "
+                f"estimated {estimate / MB:.3f} MB"
+            )
+            raise SystemExit(5)
+        # Count the release, until the next measurement
+        self.last_total = estimate
+
+    def update(self, **components: Any) -> Dict[str, int]:
+        """Measure the components, update peak, log and check budget"""
+        usage = memory_usage(**components)
+        self.last_total = usage["total"]
+        for name, nbytes in usage.items():
+            self.peak[name] = max(nbytes, self.peak.get(name, 0))
+
+        if self.budget and usage["total"] > self.budget:
+            logging.critical(
+                f"Memory budget of {self.budget / MB:.1f} MB exceeded\n"
+                + self.report(usage)
+            )
+            raise SystemExit(5)
+
+        now = time.perf_counter()
+        if self.interval and now - self.last_time >= self.interval:
+            logging.info("Memory usage\n" + self.report(usage))
+            self.last_time = now
+        return usage
+
+    def report(self, usage: Dict[str, int]) -> str:
+        """Table of present and peak memory use per component"""
+        lines = [f"{'component':16s} {'MB':>10s} {'peak MB':>10s}"]
+        for name, nbytes in usage.items():
+            lines.append(
+                f"{name:16s} {nbytes / MB:10.3f} {self.peak.get(name, 0) / MB:10.3f}"
+            )
+        rss = peak_rss()
+        if rss:
+            lines.append(f"{'process peak':16s} {'':10s} {rss / MB:10.1f}")
+        return "\n".join(lines)
@@ -12,10 +12,12 @@ import datetime
 import re
 
 # from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, Optional, Sequence
 import numpy as np
-from netCDF4 import Dataset
+from netCDF4 import Dataset, default_fillvals
 
+from .utilities import inside_polygon
+from .timing import timer
 from .gridforce import Grid  # For mypy
 from .state import State  # For mypy
 from .release import ParticleReleaser  # For mypy
@@ -55,6 +57,27 @@ class OutPut:
         self.release = release
         self.num_output = config["num_output"]
         self.nc = None  # No open netCD file yet
+        self.text_arrays: Dict[str, np.ndarray] = {}  # Character arrays
+        # Storage options, only used with NetCDF4 formats
+        self.netcdf4 = config["output_format"].startswith("NETCDF4")
+        self.encoding = config.get("output_encoding", {})
+        self.nc_encoding = config.get("nc_encoding", {})
+        # Default chunk length along particle_instance,
+        # about one record of all particles, limited to 4 MB of float32
+        self.instance_chunksize = int(
+            min(max(release.total_particle_count, 1024), 2 ** 20)
+        )
+        # CF packing of instance variables as scaled integers
+        self.packing = {
+            name: packing_parameters(name, config["nc_attributes"][name])
+            for name in self.instance_variables
+            if is_packed(config["nc_attributes"][name])
+        }
+        # Subsampling of the particles written
+        self.subsample = config.get("output_subsample", {})
+        self.particle_selection = particle_selection(
+            self.subsample, release.total_particle_count
+        )
         # Indicator for lon/lat output
         self.lonlat = (
             "lat" in self.instance_variables or "lon" in self.instance_variables
@@ -88,7 +111,11 @@ class OutPut:
             self.nc = self._define_netcdf()
             logging.info(f"Opened output file: {self.nc.filepath()}")
 
-        pcount = len(state)  # Present number of particles
+        keep = self._select(state)
+        if keep is None:
+            pcount = len(state)  # Present number of particles
+        else:
+            pcount = int(np.count_nonzero(keep))  # Particles to write
         pstart = self.instance_count
 
         logging.debug(f"Writing {pcount} particles")
@@ -99,32 +126,120 @@ class OutPut:
 
         self.nc.variables["particle_count"][t] = pcount
 
-        # Compute lon, lat if needed
-        if self.lonlat:
-            lon, lat = grid.xy2ll(state.X, state.Y)
-
         start = pstart - self.pstart0
         end = pstart + pcount - self.pstart0
         # print("start, end = ", start, end)
-        for name in self.instance_variables:
-            if name == "lon":
-                self.nc.variables["lon"][start:end] = lon
-            elif name == "lat":
-                self.nc.variables["lat"][start:end] = lat
-            else:
-                self.nc.variables[name][start:end] = state[name]
+        for name, value in self._instance_values(state, grid, keep):
+            self.nc.variables[name][start:end] = value
 
         # Update counters
         # self.outcount += 1
         self.instance_count += pcount
 
         # Flush the data to the file
-        self.nc.sync()
+        with timer("output.sync"):
+            self.nc.sync()
 
         # Close final file
         if self.outcount == self.num_output - 1:
             self.nc.close()
 
+    # -----------------------------------------------
+    def _select(self, state: State) -> Optional[np.ndarray]:
+        """Boolean mask of the particles to write, None for all"""
+        if not self.subsample:
+            return None
+        X, Y = state.X, state.Y
+        keep = np.ones(len(state), dtype=bool)
+        if self.particle_selection is not None:
+            keep &= self.particle_selection[state.pid]
+        if "bbox" in self.subsample:
+            x0, x1, y0, y1 = self.subsample["bbox"]
+            keep &= (x0 <= X) & (X <= x1) & (y0 <= Y) & (Y <= y1)
+        if "polygon" in self.subsample:
+            keep &= inside_polygon(X, Y, self.subsample["polygon"])
+        return keep
+
+    # -----------------------------------------------
+    def _instance_values(
+        self, state: State, grid: Grid, keep: Optional[np.ndarray] = None
+    ) -> Iterator[Any]:
+        """Generate (name, values) of the instance variables to write
+
+        keep: optional boolean mask of the particles to write
+        """
+        # Compute lon, lat if needed
+        if self.lonlat:
+            if keep is None:
+                lon, lat = grid.xy2ll(state.X, state.Y)
+            else:
+                lon, lat = grid.xy2ll(state.X[keep], state.Y[keep])
+        for name in self.instance_variables:
+            if name == "lon":
+                value = lon
+            elif name == "lat":
+                value = lat
+            elif keep is None:
+                value = state[name]
+            else:
+                value = np.asarray(state[name])[keep]
+            if name in self.packing:
+                value = self._pack(name, value)
+            yield name, value
+
+    # -----------------------------------------------
+    def _pack(self, name: str, value: np.ndarray) -> np.ndarray:
+        """Pack values to scaled integers, clipping to valid range
+
+        Non-finite values are packed to the fill value.
+        """
+        scale_factor, add_offset, dtype = self.packing[name]
+        lo, hi = packed_range(dtype)
+        packed = np.round((np.asarray(value, dtype="f8") - add_offset) / scale_factor)
+        finite = np.isfinite(packed)
+        if not finite.all():
+            logging.warning(f"Packed output variable {name} not finite, set to fill")
+            packed[~finite] = 0
+        if packed.size and (packed.min() < lo or packed.max() > hi):
+            logging.warning(f"Packed output variable {name} out of range, clipped")
+        np.clip(packed, lo, hi, out=packed)
+        packed = packed.astype(dtype)
+        packed[~finite] = packed_fill(dtype)
+        return packed
+
+    # -----------------------------------------------
+    def _text(self, name: str, n: int) -> np.ndarray:
+        """Text particle variable as fixed width array, blank padded"""
+        values = self.release.particle_variables[name][:]
+        text = np.asarray(values, dtype=f"S{n}")  # Truncates
+        chars = text.view("u1").reshape(-1, n).copy()
+        chars[chars == 0] = ord(" ")
+        return chars.view(f"S{n}").ravel()
+
+    # -----------------------------------------------
+    def _encoding(
+        self, name: str, trailing: Sequence[int] = (), instance: bool = False
+    ) -> Dict[str, Any]:
+        """Storage arguments to createVariable for an output variable
+
+        Defaults from the encoding section, overridden by the
+        variable settings. Empty for NetCDF3 formats.
+        trailing: lengths of any extra dimensions (text variables)
+        """
+        if not self.netcdf4:
+            return dict()
+        encoding: Dict[str, Any] = dict(zlib=True)
+        encoding.update(self.encoding)
+        encoding.update(self.nc_encoding.get(name, {}))
+        if "chunksizes" in encoding:
+            chunks = list(encoding["chunksizes"])
+            if not instance:  # Fixed particle dimension
+                chunks[0] = min(chunks[0], max(self.release.total_particle_count, 1))
+            encoding["chunksizes"] = chunks[:1] + list(trailing)
+        elif instance:
+            encoding["chunksizes"] = [self.instance_chunksize]
+        return encoding
+
     # -----------------------------------------------
     def _define_netcdf(self) -> Dataset:
         """Define a NetCDF output file"""
@@ -174,14 +289,14 @@ class OutPut:
                     varname=name,
                     datatype="S1",
                     dimensions=("particle", lendimname),
-                    zlib=True,
+                    **self._encoding(name, [length]),
                 )
             else:  # Numeric
                 v = nc.createVariable(
                     varname=name,
                     datatype=self.config["nc_attributes"][name]["ncformat"],
                     dimensions=("particle",),
-                    zlib=True,
+                    **self._encoding(name),
                 )
             for attr, value in self.config["nc_attributes"][name].items():
                 if attr != "ncformat":
@@ -189,25 +304,24 @@ class OutPut:
 
         # Instance variables
         for name in self.config["output_instance"]:
+            encoding = self._encoding(name, instance=True)
+            if name in self.packing:  # Non-finite values packed to the fill value
+                encoding["fill_value"] = packed_fill(self.packing[name][2])
             v = nc.createVariable(
                 varname=name,
                 datatype=self.config["nc_attributes"][name]["ncformat"],
                 dimensions=("particle_instance",),
-                zlib=True,
+                **encoding,
             )
+            if name in self.packing:  # Packed explicitly by OutPut.write
+                v.set_auto_scale(False)
 
             for attr, value in self.config["nc_attributes"][name].items():
                 if attr != "ncformat":
                     setattr(v, attr, value)
 
         # --- Global attributes
-        # Burde ta f.eks. source fra setup
-        # hvis andre skulle bruke
-        nc.Conventions = "CF-1.5"
-        nc.institution = "Institute of Marine Research"
-        nc.source = "Lagrangian Advection and Diffusion Model, python version"
-        nc.history = "Created by pyladim"
-        nc.date = str(datetime.date.today())
+        nc.setncatts(global_attributes())
 
         logging.debug("Netcdf output file defined")
 
@@ -216,11 +330,11 @@ class OutPut:
             var = nc.variables[name]
             if var.datatype == np.dtype("S1"):  # Text
                 n = len(nc.dimensions[var.dimensions[-1]])
-                A = [
-                    list(s[:n].ljust(n))
-                    for s in self.release.particle_variables[name][:]
-                ]
-                var[:] = np.array(A)
+                # Character array, computed once for all output files
+                if name not in self.text_arrays:
+                    text = self._text(name, n)
+                    self.text_arrays[name] = text.view("S1").reshape(-1, n)
+                var[:] = self.text_arrays[name]
             else:  # Numeric
                 nc.variables[name][:] = self.release.particle_variables[name][:]
 
@@ -229,3 +343,226 @@ class OutPut:
         var[:] = self.instance_count
 
         return nc
+
+
+class ZarrOutPut(OutPut):
+    """Output to a Zarr directory store
+
+    Same ragged layout as the NetCDF output, in a single store.
+    The arrays are appended in chunks along the time and
+    particle_instance dimensions, compressed with Blosc.
+    Readable by xarray.open_zarr and postladim.ParticleFile.
+    """
+
+    def __init__(self, config: Dict[str, Any], release: ParticleReleaser) -> None:
+        try:
+            import zarr  # type: ignore
+            import numcodecs  # type: ignore
+        except ImportError:
+            logging.critical("Zarr output needs the zarr package")
+            raise SystemExit(1)
+        self._zarr = zarr
+        self._numcodecs = numcodecs
+
+        super().__init__(config, release)
+        if self.multi_file:
+            logging.warning("numrec is ignored with zarr output")
+            self.multi_file = False
+            self.filename = config["output_file"]
+            self.numrec = 999999
+        self.store = None  # No open store yet
+
+    # ----------------------------------------------
+    def write(self, state: State, grid: Grid) -> None:
+        """Append the model state to the Zarr store"""
+
+        # May skip initial output
+        if self.skip_output:
+            self.skip_output = False
+            return
+
+        self.outcount += 1
+        if self.store is None:
+            self.store = self._define_zarr()
+            logging.info(f"Opened output store: {self.filename}")
+
+        keep = self._select(state)
+        if keep is None:
+            pcount = len(state)
+        else:
+            pcount = int(np.count_nonzero(keep))
+        logging.debug(f"Writing {pcount} particles")
+
+        # Instance data before the count, consistent for concurrent readers
+        for name, value in self._instance_values(state, grid, keep):
+            array = self.store[name]
+            array.append(np.asarray(value, dtype=array.dtype))
+
+        tdelta = state.timestamp - self.config["reference_time"]
+        seconds = tdelta.astype("m8[s]").astype("int")
+        self.store["particle_count"].append([pcount])
+        self.store["time"].append([float(seconds)])
+        self.instance_count += pcount
+
+        # Final output, consolidate metadata for fast opening
+        if self.outcount == self.num_output - 1:
+            self._zarr.consolidate_metadata(self.store.store)
+
+    # -----------------------------------------------
+    def _compressor(self, name: str) -> Any:
+        """Blosc compressor from the encoding options"""
+        encoding = dict(self.encoding)
+        encoding.update(self.nc_encoding.get(name, {}))
+        if not encoding.get("zlib", True):
+            return None
+        Blosc = self._numcodecs.Blosc
+        shuffle = Blosc.SHUFFLE if encoding.get("shuffle", True) else Blosc.NOSHUFFLE
+        return Blosc(cname="lz4", clevel=encoding.get("complevel", 5), shuffle=shuffle)
+
+    def _chunks(self, name: str, default: int) -> int:
+        encoding = dict(self.encoding)
+        encoding.update(self.nc_encoding.get(name, {}))
+        return int(encoding.get("chunksizes", [default])[0])
+
+    # -----------------------------------------------
+    def _define_zarr(self) -> Any:
+        """Define the Zarr output store"""
+
+        logging.debug(f"Defining output zarr store: {self.filename}")
+        root = self._zarr.open_group(self.filename, mode="w")
+        attributes = self.config["nc_attributes"]
+
+        def create(name, dims, dtype, shape, chunks, attrs, fill_value=None):
+            array = root.create_dataset(
+                name,
+                shape=shape,
+                chunks=chunks,
+                dtype=dtype,
+                compressor=self._compressor(name),
+                fill_value=fill_value,  # Default None, zero is a valid value
+            )
+            array.attrs["_ARRAY_DIMENSIONS"] = dims
+            array.attrs.update(
+                {key: val for key, val in attrs.items() if key != "ncformat"}
+            )
+            return array
+
+        # Time records, appended one by one
+        timeref = str(self.config["reference_time"]).replace("T", " ")
+        time_attrs = dict(
+            long_name="time", standard_name="time", units=f"seconds since {timeref}"
+        )
+        create("time", ["time"], "f8", (0,), (1024,), time_attrs)
+        count_attrs = dict(
+            long_name="number of particles in a given timestep",
+            ragged_row_count="particle count at nth timestep",
+        )
+        create("particle_count", ["time"], "i4", (0,), (1024,), count_attrs)
+        offset_attrs = dict(long_name="particle instance offset for file")
+        create("instance_offset", [], "i4", (), None, offset_attrs)
+        root["instance_offset"][...] = self.instance_count
+
+        # Particle variables, written at once
+        num_particles = self.release.total_particle_count
+        for name in self.config["output_particle"]:
+            ncformat = attributes[name]["ncformat"]
+            values = self.release.particle_variables[name][:]
+            if ncformat[0] == "S":  # text
+                values = self._text(name, int(ncformat[1:]))
+                ncformat = values.dtype
+            chunks = min(self._chunks(name, num_particles), max(num_particles, 1))
+            array = create(
+                name,
+                ["particle"],
+                ncformat,
+                (num_particles,),
+                (chunks,),
+                attributes[name],
+            )
+            array[:] = values
+
+        # Instance variables
+        for name in self.config["output_instance"]:
+            create(
+                name,
+                ["particle_instance"],
+                attributes[name]["ncformat"],
+                (0,),
+                (self._chunks(name, self.instance_chunksize),),
+                attributes[name],
+                packed_fill(self.packing[name][2]) if name in self.packing else None,
+            )
+
+        root.attrs.update(global_attributes())
+        logging.debug("Zarr output store defined")
+        return root
+
+
+def global_attributes() -> Dict[str, str]:
+    """Global attributes of the output"""
+    # Burde ta f.eks. source fra setup
+    # hvis andre skulle bruke
+    return dict(
+        Conventions="CF-1.5",
+        institution="Institute of Marine Research",
+        source="Lagrangian Advection and Diffusion Model, python version",
+        history="Created by pyladim",
+        date=str(datetime.date.today()),
+    )
+
+
+def particle_selection(
+    subsample: Dict[str, Any], num_particles: int
+) -> Optional[np.ndarray]:
+    """Fixed selection of particles by pid, None for all
+
+    every: every k-th particle
+    fraction: fixed random fraction of the particles, with seed
+    """
+    if "every" not in subsample and "fraction" not in subsample:
+        return None
+    pids = np.arange(num_particles)
+    selected = np.ones(num_particles, dtype=bool)
+    if "every" in subsample:
+        selected &= pids % subsample["every"] == 0
+    if "fraction" in subsample:
+        rng = np.random.default_rng(subsample.get("seed", 0))
+        selected &= rng.random(num_particles) < subsample["fraction"]
+    return selected
+
+
+# -----------------------------------------------
+# CF packing utilities
+# -----------------------------------------------
+
+
+def is_packed(attributes: Dict[str, Any]) -> bool:
+    """True if the output attributes specify packed values"""
+    return "scale_factor" in attributes or "add_offset" in attributes
+
+
+def packing_parameters(name: str, attributes: Dict[str, Any]) -> Any:
+    """Scale factor, offset and integer type of a packed variable"""
+    dtype = np.dtype(attributes["ncformat"])
+    if dtype.kind not in "iu":
+        logging.error(f"Packed output variable {name} needs integer ncformat")
+        raise SystemExit(1)
+    scale_factor = attributes.get("scale_factor", 1.0)
+    add_offset = attributes.get("add_offset", 0.0)
+    return scale_factor, add_offset, dtype
+
+
+def packed_range(dtype: np.dtype) -> Any:
+    """Range of integer type, leaving out the default fill value"""
+    info = np.iinfo(dtype)
+    lo, hi = int(info.min), int(info.max)
+    fill = packed_fill(dtype)
+    if fill == hi:  # Unsigned types
+        return lo, hi - 1
+    # Signed types, fill value = min + 1
+    return fill + 1, hi
+
+
+def packed_fill(dtype: np.dtype) -> int:
+    """Fill value of integer type, used for non-finite values"""
+    return default_fillvals[np.dtype(dtype).str[1:]]
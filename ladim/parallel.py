@@ -0,0 +1,352 @@
+"""Particle parallel execution of LADiM
+
+The particles are independent in the tracker, the IBM and the
+boundary treatment. With a parallel section in the configuration,
+this per particle work is split over a number of worker processes,
+each moving its own slice of the particle arrays. The workers are
+stepped in lockstep with the main process, which does the release,
+forcing update, output and compaction as before.
+
+The grid and forcing arrays live once, in shared memory, and are
+seen by all workers. The forcing is updated in the main process only,
+arrays replaced by the update are copied into the shared memory
+before the workers are started at every time step. The particle
+arrays are also exchanged through shared memory, sized by the total
+number of particles.
+
+Apart from the random numbers in the diffusion, each worker having
+its own random stream, the results are identical to a serial run.
+
+Limitations:
+  Masked arrays in the grid and forcing are treated as static.
+  Array attributes added to the forcing after the start are not seen.
+  Hooks run in the main process, the pre_tracker and pre_ibm hooks
+  before the workers, post_tracker and post_ibm after.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import os
+import sys
+import atexit
+import pickle
+import logging
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .gridforce import Grid, Forcing
+from .state import State
+
+
+class Shared:
+    """Description of an array in shared memory"""
+
+    def __init__(self, block: str, shape: Tuple[int, ...], dtype: str) -> None:
+        self.block = block
+        self.shape = shape
+        self.dtype = dtype
+
+
+class Reference:
+    """Reference to another shared object, by key"""
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+
+
+def new_array(
+    shape: Tuple[int, ...], dtype: Any, blocks: List[shared_memory.SharedMemory]
+) -> Tuple[np.ndarray, Shared]:
+    """Array in a new shared memory block, appended to blocks"""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    blocks.append(shm)
+    A: np.ndarray = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return A, Shared(shm.name, shape, dtype.str)
+
+
+def attach(spec: Shared, blocks: List[shared_memory.SharedMemory]) -> np.ndarray:
+    """View of an existing shared array, the block is appended to blocks"""
+    # Workers share the resource tracker of the main process,
+    # the shared memory is unlinked there
+    shm = shared_memory.SharedMemory(name=spec.block)
+    blocks.append(shm)
+    return np.ndarray(spec.shape, dtype=spec.dtype, buffer=shm.buf)
+
+
+class SharedObject:
+    """An object with its array attributes in shared memory
+
+    Plain arrays are replaced by views into shared memory. In-place
+    updates are then seen directly by the workers, arrays replaced by
+    new ones are copied into the shared memory by sync.
+    Masked arrays get their data and mask in shared memory, but are
+    never synced.
+    """
+
+    def __init__(self, obj: Any, references: Dict[str, Any]) -> None:
+        self.obj = obj
+        self.references = references  # key -> other object
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.arrays: Dict[str, np.ndarray] = {}  # Plain arrays
+        self.masked: Dict[str, np.ndarray] = {}  # Masked arrays
+        self.specs: Dict[str, Any] = {}  # Picklable attributes
+        for name, value in vars(obj).items():
+            if type(value) is np.ndarray:
+                A, self.specs[name] = new_array(value.shape, value.dtype, self.blocks)
+                A[...] = value
+                self.arrays[name] = A
+                setattr(obj, name, A)
+            elif isinstance(value, np.ma.MaskedArray):
+                data, data_spec = new_array(value.shape, value.dtype, self.blocks)
+                data[...] = value.data
+                if value.mask is np.ma.nomask:
+                    mask_spec = None
+                    setattr(obj, name, np.ma.MaskedArray(data, copy=False))
+                else:
+                    mask, mask_spec = new_array(value.shape, bool, self.blocks)
+                    mask[...] = value.mask
+                    setattr(obj, name, np.ma.MaskedArray(data, mask=mask, copy=False))
+                self.masked[name] = getattr(obj, name)
+                self.specs[name] = (data_spec, mask_spec)
+            else:
+                self.specs[name] = self.picklable(name, value)
+
+    def picklable(self, name: str, value: Any) -> Any:
+        """Reference, the value itself if picklable, or None"""
+        for key, other in self.references.items():
+            if value is other:
+                return Reference(key)
+        try:
+            pickle.dumps(value)
+        except Exception:
+            logging.debug(f"Parallel: attribute {name} not passed to the workers")
+            return None
+        return value
+
+    def sync(self) -> None:
+        """Copy arrays replaced since last sync into shared memory"""
+        for name, A in self.arrays.items():
+            value = getattr(self.obj, name)
+            if value is not A:
+                A[...] = value
+                setattr(self.obj, name, A)
+
+    def spec(self) -> Tuple[type, Dict[str, Any]]:
+        """Description for rebuilding the object in a worker"""
+        return type(self.obj), self.specs
+
+    def close(self) -> None:
+        """Free the shared memory, after the workers are stopped"""
+        # Give the object its private arrays back
+        for name, A in list(self.arrays.items()) + list(self.masked.items()):
+            if getattr(self.obj, name) is A:
+                setattr(self.obj, name, A.copy())
+        self.arrays = {}
+        self.masked = {}
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+
+def rebuild(
+    spec: Tuple[type, Dict[str, Any]],
+    references: Dict[str, Any],
+    blocks: List[shared_memory.SharedMemory],
+) -> Any:
+    """Rebuild a shared object in a worker"""
+    cls, specs = spec
+    obj = cls.__new__(cls)
+    for name, value in specs.items():
+        if isinstance(value, Shared):
+            value = attach(value, blocks)
+        elif isinstance(value, tuple) and value and isinstance(value[0], Shared):
+            data_spec, mask_spec = value
+            data = attach(data_spec, blocks)
+            if mask_spec is None:
+                value = np.ma.MaskedArray(data, copy=False)
+            else:
+                value = np.ma.MaskedArray(data, mask=attach(mask_spec, blocks), copy=False)
+        elif isinstance(value, Reference):
+            value = references[value.key]
+        obj.__dict__[name] = value
+    return obj
+
+
+def worker(
+    conn: Any,
+    config: Dict[str, Any],
+    grid_spec: Tuple[type, Dict[str, Any]],
+    forcing_spec: Tuple[type, Dict[str, Any]],
+    buffer_specs: Dict[str, Shared],
+    seed: int,
+) -> None:
+    """Worker process, moves slices of the particles on request
+
+    Messages: (start, stop, step, timestep, timestamp) moves the
+    particles start:stop, replying None or an error text.
+    None stops the worker.
+    """
+    # Allow gridforce and IBM modules in current directory
+    sys.path.insert(0, os.getcwd())
+    blocks: List[shared_memory.SharedMemory] = []
+    grid = Grid.__new__(Grid)
+    grid.grid = rebuild(grid_spec, {}, blocks)
+    for name in ["xmin", "xmax", "ymin", "ymax"]:
+        setattr(grid, name, getattr(grid.grid, name))
+    forcing = Forcing.__new__(Forcing)
+    forcing.forcing = rebuild(forcing_spec, dict(grid=grid.grid), blocks)
+    forcing.start_threads(config)
+    buffers = {name: attach(spec, blocks) for name, spec in buffer_specs.items()}
+
+    np.random.seed(seed)
+    state = State(config, grid)
+    names = ["pid"] + state.instance_variables
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        start, stop, step, state.timestep, state.timestamp = message
+        try:
+            views = {name: buffers[name][start:stop] for name in names}
+            for name in names:
+                state[name] = views[name]
+            state.move(grid, forcing, step)
+            # Copy back variables replaced by new arrays
+            for name in state.instance_variables:
+                if state[name] is not views[name]:
+                    views[name][...] = state[name]
+            buffers["alive"][start:stop] = state.alive
+            conn.send(None)
+        except Exception:
+            conn.send(traceback.format_exc())
+
+    if forcing.executor:
+        forcing.executor.shutdown()
+    for shm in blocks:
+        shm.close()
+
+
+class ParticleParallel:
+    """Particle parallel update of the model state
+
+    Configuration item, see configure_parallel:
+      workers: number of worker processes
+
+    Usage, after creating the state:
+      state.parallel = ParticleParallel(config, grid, forcing, state)
+    """
+
+    def __init__(
+        self, config: Dict[str, Any], grid: Grid, forcing: Forcing, state: State
+    ) -> None:
+        self.num_workers = config["parallel"]["workers"]
+        logging.info(f"Starting {self.num_workers} worker processes")
+        self.capacity = config["total_particle_count"]
+
+        # Grid and forcing arrays to shared memory
+        self.grid = SharedObject(grid.grid, {})
+        self.forcing = SharedObject(forcing.forcing, dict(grid=grid.grid))
+
+        # Particle buffers
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.buffers: Dict[str, np.ndarray] = {}
+        buffer_specs: Dict[str, Shared] = {}
+        self.names = ["pid"] + state.instance_variables
+        for name in self.names + ["alive"]:
+            dtype = bool if name == "alive" else state[name].dtype
+            self.buffers[name], buffer_specs[name] = new_array(
+                (self.capacity,), dtype, self.blocks
+            )
+
+        # Workers read no warm start file and run no hooks
+        worker_config = dict(config, warm_start_file="", hooks={})
+        seed = config["parallel"]["seed"]
+        if seed is None:
+            seed = np.random.SeedSequence().entropy % 2 ** 32
+        # Fork when available, the ladim script can not be re-imported
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.connections = []
+        self.processes = []
+        for n in range(self.num_workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=worker,
+                args=(
+                    child_conn,
+                    worker_config,
+                    self.grid.spec(),
+                    self.forcing.spec(),
+                    buffer_specs,
+                    (seed + n) % 2 ** 32,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        atexit.register(self.close)
+
+    def update(self, state: State, step: int) -> None:
+        """Move the particles with the workers
+
+        state.timestep and state.timestamp should be advanced
+        """
+        self.forcing.sync()
+        n = len(state)
+        if n > self.capacity:
+            logging.critical(f"More particles, {n}, than the parallel capacity")
+            raise SystemExit(1)
+        for name in self.names:
+            self.buffers[name][:n] = state[name]
+
+        bounds = np.linspace(0, n, self.num_workers + 1).astype(int)
+        busy = []
+        for conn, start, stop in zip(self.connections, bounds[:-1], bounds[1:]):
+            if stop > start:
+                conn.send((start, stop, step, state.timestep, state.timestamp))
+                busy.append(conn)
+        errors = [error for error in (conn.recv() for conn in busy) if error]
+        if errors:
+            logging.critical("Error in parallel worker\n" + errors[0])
+            raise SystemExit(1)
+
+        for name in state.instance_variables:
+            state[name] = self.buffers[name][:n].copy()
+        state.alive = self.buffers["alive"][:n].copy()
+
+    def close(self) -> None:
+        """Stop the workers and free the shared memory"""
+        if not self.processes:
+            return
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.grid.close()
+        self.forcing.close()
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+        self.buffers = {}
+
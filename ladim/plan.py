@@ -0,0 +1,182 @@
+"""Run planner for LADiM
+
+Estimates the size of a simulation without running it: particle
+numbers, memory use of the state and forcing, output file sizes and
+the number of forcing frames to read. Only the configuration, the
+release file, the grid and the time axis of the forcing files are
+read, not the forcing fields.
+
+Command line usage:
+
+  ladim --plan ladim.yaml
+
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import os
+import sys
+import importlib
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .configuration import Config, configure
+from .release import ParticleReleaser
+
+MB = 1024 * 1024
+
+
+def plan(config: Config) -> Dict[str, Any]:
+    """Estimate the size of a configured simulation"""
+
+    # Allow gridforce module in current directory
+    sys.path.insert(0, os.getcwd())
+    gridforce_module = importlib.import_module(config["gridforce"]["module"])
+    grid = gridforce_module.Grid(config)
+    releaser = ParticleReleaser(config, grid)
+
+    numsteps = config["numsteps"]
+    live = live_particles(releaser.steps, releaser.particles_released, numsteps)
+    P: Dict[str, Any] = dict(
+        numsteps=numsteps,
+        total_particles=int(releaser.total_particle_count),
+        release_steps=len(releaser.steps),
+        peak_particles=int(live.max()),
+    )
+
+    # Model state, pid and instance variables
+    ibm_variables = config.get("ibm_variables", [])
+    num_instance = 3 + len(
+        [var for var in ibm_variables if var not in config["particle_variables"]]
+    )
+    P["state_bytes"] = 8 * (1 + num_instance) * P["peak_particles"]
+
+    # Forcing, velocity and ibm forcing fields in memory
+    # (present, next and time derivative)
+    num_fields = 2 + len(config.get("ibm_forcing", []))
+    try:
+        cells = grid.imax * grid.jmax * getattr(grid, "N", 1)
+        P["forcing_bytes"] = 3 * 8 * num_fields * cells
+        P["frame_bytes"] = 4 * num_fields * cells  # Single precision on file
+    except AttributeError:  # Unknown grid size
+        P["forcing_bytes"] = None
+        P["frame_bytes"] = None
+    P["forcing_frames"] = forcing_frames(gridforce_module, config)
+
+    if config["output_file"]:
+        P["output_files"] = output_sizes(config, live, P["total_particles"])
+    else:
+        P["output_files"] = []
+    return P
+
+
+def live_particles(
+    release_steps: np.ndarray, particles_released: List[int], numsteps: int
+) -> np.ndarray:
+    """Number of particles at each time step, ignoring particle loss
+
+    particles_released[0] is the number of particles at start,
+    particles_released[i+1] is the number released at release_steps[i]
+    """
+    released = np.zeros(numsteps + 1, dtype=np.int64)
+    steps = np.asarray(release_steps, dtype=int)
+    count = np.asarray(particles_released[1:], dtype=np.int64)
+    np.add.at(released, steps[steps <= numsteps], count[steps <= numsteps])
+    released[0] += particles_released[0]
+    return released.cumsum()
+
+
+def output_sizes(config: Config, live: np.ndarray, total: int) -> List[int]:
+    """Estimated sizes of the (uncompressed) output files in bytes"""
+
+    def itemsize(name: str) -> int:
+        return np.dtype(config["nc_attributes"][name]["ncformat"]).itemsize
+
+    instance_bytes = sum(itemsize(name) for name in config["output_instance"])
+    particle_bytes = total * sum(itemsize(name) for name in config["output_particle"])
+
+    # Particles in the output records
+    counts = live[:: config["output_period"]][: config["num_output"]]
+    if config["skip_initial"]:
+        counts = counts[1:]
+    subsample = config.get("output_subsample", {})
+    factor = subsample.get("fraction", 1.0) / subsample.get("every", 1)
+    counts = factor * counts
+
+    numrec = config["output_numrec"] or len(counts)
+    sizes = []
+    for i in range(0, len(counts), max(numrec, 1)):
+        records = counts[i : i + numrec]
+        # time and particle_count in every record
+        nbytes = 12 * len(records) + instance_bytes * records.sum()
+        sizes.append(int(nbytes + particle_bytes))
+    return sizes
+
+
+def forcing_frames(gridforce_module: Any, config: Config) -> Any:
+    """Number of forcing time frames to read, None if unknown
+
+    Uses the file scanning of ROMS type forcing, reading only the times
+    """
+    Forcing = gridforce_module.Forcing
+    try:
+        files = Forcing.find_files(config["gridforce"])
+        all_frames, num_frames = Forcing.scan_file_times(files)
+        steps, _, _ = Forcing.forcing_steps(config, files, all_frames, num_frames)
+    except (AttributeError, KeyError):
+        return None
+    steps = np.array(steps)
+    if len(steps) == 0:
+        return None
+    # Last frame before start (at start if none) to first frame after stop
+    first = steps[steps < 0].max() if np.any(steps < 0) else 0
+    if np.any(steps >= config["numsteps"]):
+        last = steps[steps >= config["numsteps"]].min()
+    else:
+        logging.warning("The forcing does not cover the end of the simulation")
+        last = steps.max()
+    return int(np.count_nonzero((first <= steps) & (steps <= last)))
+
+
+def report(P: Dict[str, Any]) -> str:
+    """Text report of the planned simulation"""
+
+    def size(nbytes: Any) -> str:
+        if nbytes is None:
+            return "unknown"
+        if nbytes < MB:
+            return f"{nbytes / 1024:.1f} kB"
+        return f"{nbytes / MB:.1f} MB"
+
+    lines = [
+        f"{'time steps':28s}: {P['numsteps']}",
+        f"{'release times':28s}: {P['release_steps']}",
+        f"{'total particles':28s}: {P['total_particles']}",
+        f"{'peak live particles':28s}: {P['peak_particles']} (no particle loss)",
+        f"{'state memory':28s}: {size(P['state_bytes'])}",
+        f"{'forcing memory':28s}: {size(P['forcing_bytes'])}",
+        f"{'forcing frames to read':28s}: {P['forcing_frames'] or 'unknown'}",
+        f"{'forcing data per frame':28s}: {size(P['frame_bytes'])}",
+    ]
+    files = P["output_files"]
+    if files:
+        lines.append(f"{'output files':28s}: {len(files)}")
+        lines.append(f"{'largest output file':28s}: {size(max(files))}")
+        lines.append(f"{'total output':28s}: {size(sum(files))} (uncompressed)")
+    else:
+        lines.append(f"{'output files':28s}: none")
+    return "\n".join(lines)
+
+
+def main(config_stream: Any, loglevel: int = logging.WARNING) -> Dict[str, Any]:
+    """Configure and print the plan of a simulation"""
+    logging.getLogger().setLevel(loglevel)
+    config = configure(config_stream)
+    P = plan(config)
+    print(report(P))
+    return P
@@ -0,0 +1,76 @@
+"""Progress reporting for LADiM
+
+Logs the progress of the run at a fixed wall clock interval:
+simulated time per wall time, particle steps per second, number of
+live particles, fraction of wall time waiting for forcing input,
+and the estimated time of completion.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import time
+import logging
+import datetime
+from typing import Any, Dict
+
+from .state import State  # For mypy
+from .timing import timer
+
+
+class Progress:
+    """Periodic progress reporter
+
+    Configuration item, see configure_progress:
+      interval: wall clock seconds between reports
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.interval = config["progress"]["interval"]
+        self.numsteps = config["numsteps"]
+        self.dt = config["dt"]
+        self.start = time.perf_counter()
+        # Values at last report
+        self.last_time = self.start
+        self.last_step = 0
+        self.last_read = 0.0
+        self.particle_steps = 0  # Since last report
+
+    def update(self, state: State, step: int) -> None:
+        """Count the particles moved, report if interval has passed"""
+        self.particle_steps += len(state)
+        now = time.perf_counter()
+        if now - self.last_time < self.interval:
+            return
+        self.report(state, step + 1, now)
+
+    def report(self, state: State, steps_done: int, now: float) -> str:
+        """Log the progress since last report"""
+        wall = now - self.last_time
+        steps = steps_done - self.last_step
+        read = timer.total.get("forcing.read", 0.0)
+        rate = (steps_done / (now - self.start)) if now > self.start else 0.0
+        if rate > 0:
+            eta = datetime.datetime.now() + datetime.timedelta(
+                seconds=(self.numsteps + 1 - steps_done) / rate
+            )
+            eta_text = eta.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            eta_text = "unknown"
+        text = (
+            f"Progress: step {steps_done - 1}/{self.numsteps}"
+            f" ({100 * steps_done / (self.numsteps + 1):.1f}%),"
+            f" speed {steps * self.dt / wall:.1f}x real time,"
+            f" {self.particle_steps / wall:.3g} particle steps/s,"
+            f" {len(state)} particles,"
+            f" forcing read {100 * (read - self.last_read) / wall:.1f}%,"
+            f" ETA {eta_text}"
+        )
+        logging.info(text)
+        self.last_time = now
+        self.last_step = steps_done
+        self.last_read = read
+        self.particle_steps = 0
+        return text
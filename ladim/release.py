@@ -13,19 +13,20 @@
 
 import logging
 import numpy as np
-import pandas as pd
-from typing import Iterator, List
-
-from netCDF4 import Dataset
+from typing import Iterator, List, TYPE_CHECKING
 
 from .utilities import ingrid
 from .configuration import Config
 
+# pandas is imported when reading the release file, for fast startup
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 # from .gridforce import Grid
 
 
-def mylen(df: pd.DataFrame) -> int:
+def mylen(df: "pd.DataFrame") -> int:
     """Number of rows in a DataFrame,
 
     A workaround for len() which does not
@@ -43,6 +44,8 @@ class ParticleReleaser(Iterator):
 
     def __init__(self, config: Config, grid) -> None:
 
+        import pandas as pd
+
         start_time = pd.to_datetime(config["start_time"])
         stop_time = pd.to_datetime(config["stop_time"])
 
@@ -161,6 +164,10 @@ class ParticleReleaser(Iterator):
         if config["start"] == "warm":
             A = A[A.index > start_time]
 
+        # Optional end of release window, used by time-segmented runs
+        if config.get("release_stop_time") is not None:
+            A = A[A.index < pd.to_datetime(config["release_stop_time"])]
+
         # Compute which timestep the release should happen
         timediff = A["release_time"] - config['start_time']
         dt = np.timedelta64(config["dt"], 's')
@@ -195,9 +202,15 @@ class ParticleReleaser(Iterator):
 
         # Get particle data from  warm start
         if config["start"] == "warm":
+            from netCDF4 import Dataset
+            from .checkpoint import is_checkpoint
+
             with Dataset(config["warm_start_file"]) as f:
-                # warm_particle_count = len(f.dimensions['particle'])
-                warm_particle_count = np.max(f.variables["pid"][:]) + 1
+                if is_checkpoint(f):
+                    warm_particle_count = f.particle_count
+                else:
+                    # warm_particle_count = len(f.dimensions['particle'])
+                    warm_particle_count = np.max(f.variables["pid"][:]) + 1
                 for name in config["particle_variables"]:
                     pvars[name] = f.variables[name][:warm_particle_count]
         else:
@@ -233,7 +246,7 @@ class ParticleReleaser(Iterator):
         self._index = 0  # Index of next release
         self._particle_count = warm_particle_count
 
-    def __next__(self) -> pd.DataFrame:
+    def __next__(self) -> "pd.DataFrame":
         """Perform the next particle release
 
            Return a DataFrame with the release info,
@@ -241,6 +254,8 @@ class ParticleReleaser(Iterator):
 
         """
 
+        import pandas as pd
+
         # This should not happen
         if self._index >= len(self.times):
             raise StopIteration
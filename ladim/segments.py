@@ -0,0 +1,240 @@
+"""Time-segmented parallel runs of LADiM
+
+Long simulations where the particles live a limited time, for
+instance multi-year hindcasts of fish larvae or salmon lice, are split
+into segments that run concurrently. Each segment releases the
+particles of its release window, and follows them for the maximum
+particle lifetime after the window. The segment outputs are then
+merged into one output file, with a common time axis and consecutive
+particle identifiers.
+
+Configuration, added to an ordinary configuration file
+
+  segments:
+      # Length of the release window of each segment
+      length: [30, D]
+      # Maximum particle lifetime
+      lifetime: [21, D]
+      # Number of segments running at the same time
+      processes: 4
+
+The merged output is identical to a single run, as long as the
+particles are gone (removed by the IBM or out of the grid) within
+the lifetime. Particles are not followed beyond the end of their
+segment. The diffusion random numbers differ between the segments.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import yaml
+
+from .configuration import configure
+
+Config = Dict[str, Any]
+Segment = Tuple[np.datetime64, np.datetime64, Any]  # start, stop, release stop
+
+
+def segment_times(config: Config) -> List[Segment]:
+    """Start, stop and release stop time of the segments
+
+    The release stop of the last segment is None, releasing up to
+    the simulation stop time.
+    """
+    length = np.timedelta64(config["segments"]["length"], "s")
+    lifetime = np.timedelta64(config["segments"]["lifetime"], "s")
+    start_time = config["start_time"]
+    stop_time = config["stop_time"]
+    segments = []
+    start = start_time
+    while start < stop_time:
+        end = start + length  # End of release window
+        stop = min(end + lifetime, stop_time)
+        segments.append((start, stop, end if end < stop_time else None))
+        start = end
+    return segments
+
+
+def segment_filename(filename: str, n: int) -> str:
+    """Output file name of segment n"""
+    root, ext = os.path.splitext(filename)
+    return f"{root}_segment{n:03d}{ext}"
+
+
+def segment_conf(conf: Dict[str, Any], config: Config, n: int, segment: Segment):
+    """Raw configuration of segment n"""
+    start, stop, release_stop = segment
+    conf = dict(conf)
+    conf.pop("segments")
+    conf.pop("checkpoint", None)
+    conf["time_control"] = dict(
+        conf["time_control"],
+        start_time=str(start),
+        stop_time=str(stop),
+        # Common reference, for time and release time
+        reference_time=str(config["reference_time"]),
+    )
+    if release_stop is not None:
+        conf["time_control"]["release_stop_time"] = str(release_stop)
+    conf["files"] = dict(
+        conf["files"], output_file=segment_filename(config["output_file"], n)
+    )
+    conf["progress"] = dict(interval=0)
+    return conf
+
+
+def run_segment(conf_text: str) -> None:
+    """Run a segment, in a separate process"""
+    from .main import main
+
+    main(StringIO(conf_text), loglevel=logging.WARNING)
+
+
+def merge_output(filenames: List[str], output_file: str) -> None:
+    """Merge segment output files
+
+    The time axis is the union of the segment times. The particle
+    identifiers of a segment are offset by the number of particles
+    in the previous segments.
+    """
+    from netCDF4 import Dataset
+
+    inputs = [Dataset(fname) for fname in filenames]
+    for nc in inputs:
+        nc.set_auto_maskandscale(False)
+    nc0 = inputs[0]
+    times = [nc.variables["time"][:] for nc in inputs]
+    counts = [nc.variables["particle_count"][:] for nc in inputs]
+    offsets = [np.concatenate(([0], np.cumsum(count))) for count in counts]
+    num_particles = [len(nc.dimensions["particle"]) for nc in inputs]
+    pid_offsets = np.concatenate(([0], np.cumsum(num_particles)))
+    all_times = np.unique(np.concatenate(times))
+
+    instance_names = []
+    particle_names = []
+    for name, var in nc0.variables.items():
+        if var.dimensions == ("particle_instance",):
+            instance_names.append(name)
+        elif var.dimensions[:1] == ("particle",):
+            particle_names.append(name)
+
+    out = Dataset(output_file, mode="w", format=nc0.data_model)
+    out.set_auto_maskandscale(False)
+    for name, dim in nc0.dimensions.items():
+        if name == "particle":
+            size = int(pid_offsets[-1])
+        elif name == "time":
+            size = len(all_times)
+        else:
+            size = None if dim.isunlimited() else len(dim)
+        out.createDimension(name, size)
+    for name, var in nc0.variables.items():
+        filters = var.filters() or {}
+        v = out.createVariable(
+            name,
+            var.datatype,
+            var.dimensions,
+            zlib=filters.get("zlib", False),
+            complevel=filters.get("complevel", 4),
+            shuffle=filters.get("shuffle", True),
+        )
+        v.setncatts({key: var.getncattr(key) for key in var.ncattrs()})
+    out.setncatts({key: nc0.getncattr(key) for key in nc0.ncattrs()})
+
+    # Particle variables, segment by segment
+    for name in particle_names:
+        var = out.variables[name]
+        for nc, p0, p1 in zip(inputs, pid_offsets[:-1], pid_offsets[1:]):
+            var[p0:p1] = nc.variables[name][:]
+
+    # Instance variables, record by record
+    out.variables["time"][:] = all_times
+    out.variables["instance_offset"].assignValue(0)
+    instance = 0
+    for k, t in enumerate(all_times):
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in instance_names}
+        count = 0
+        for nc, time, offset, pid_offset in zip(inputs, times, offsets, pid_offsets):
+            (index,) = np.nonzero(time == t)
+            if len(index) == 0:
+                continue
+            i0, i1 = offset[index[0]], offset[index[0] + 1]
+            count += i1 - i0
+            for name in instance_names:
+                values = nc.variables[name][i0:i1]
+                if name == "pid":
+                    values = values + pid_offset
+                parts[name].append(values)
+        if count:
+            for name in instance_names:
+                values = np.concatenate(parts[name])
+                out.variables[name][instance : instance + count] = values
+        out.variables["particle_count"][k] = count
+        instance += count
+
+    out.close()
+    for nc in inputs:
+        nc.close()
+
+
+def main(config_stream, loglevel=logging.INFO) -> None:
+    """Run the segments in parallel and merge the output"""
+
+    logging.getLogger().setLevel(loglevel)
+    conf = yaml.safe_load(config_stream)
+    config = configure(StringIO(yaml.safe_dump(conf)))
+    if not config["segments"]:
+        logging.error("No segments section in the configuration")
+        raise SystemExit(1)
+    if config["start"] == "warm":
+        logging.error("Warm start is not supported in segmented runs")
+        raise SystemExit(1)
+    if not config["output_file"] or config["output_format"] == "zarr":
+        logging.error("Segmented runs need netCDF particle output")
+        raise SystemExit(1)
+    if config["output_numrec"] or config["concentration"]:
+        logging.error("Segmented runs need a single output file, no concentration")
+        raise SystemExit(1)
+
+    segments = segment_times(config)
+    texts = [
+        yaml.safe_dump(segment_conf(conf, config, n, segment))
+        for n, segment in enumerate(segments)
+    ]
+    filenames = [
+        segment_filename(config["output_file"], n) for n in range(len(segments))
+    ]
+    for n, (start, stop, release_stop) in enumerate(segments):
+        logging.info(f"Segment {n}: {start} - {stop}, release stop {release_stop}")
+
+    # Fork when available, the ladim script can not be re-imported
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+    processes = config["segments"]["processes"]
+    logging.info(f"Running {len(segments)} segments, {processes} at a time")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(run_segment, text) for text in texts]
+        for n, future in enumerate(futures):
+            try:
+                future.result()
+            except BaseException as error:
+                logging.critical(f"Segment {n} failed: {error!r}")
+                raise SystemExit(1)
+            logging.info(f"Segment {n} finished")
+
+    logging.info(f"Merging segment output to {config['output_file']}")
+    merge_output(filenames, config["output_file"])
+    for fname in filenames:
+        os.remove(fname)
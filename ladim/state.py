@@ -9,9 +9,10 @@ import logging
 from typing import Any, Dict, Sized  # mypy
 
 import numpy as np
-from netCDF4 import Dataset, num2date
 
 from .tracker import Tracker
+from .timing import timer
+from .hooks import Hooks
 from .gridforce import Grid, Forcing
 
 # ------------------------
@@ -60,6 +61,12 @@ class State(Sized):
         else:
             self.ibm = None
 
+        # Hooks into the time loop
+        self.hooks = Hooks(config)
+
+        # Particle parallel update, set by main if configured
+        self.parallel: Any = None
+
         # self.num_particles = len(self.X)
         self.nnew = 0  # Modify with warm start?
 
@@ -94,21 +101,59 @@ class State(Sized):
     def update(self, grid: Grid, forcing: Forcing) -> None:
         """Update the model state to the next timestep"""
 
-        # From physics all particles are alive
-        # self.alive = np.ones(len(self), dtype="bool")
-        self.alive = grid.ingrid(self.X, self.Y)
-
+        step = self.timestep
         self.timestep += 1
         self.timestamp += np.timedelta64(self.dt, "s")
-        self.track.move_particles(grid, forcing, self)
+
+        if self.parallel:
+            # Particle work by the worker processes, see parallel.py
+            for hook in self.hooks.pre_tracker + self.hooks.pre_ibm:
+                hook(self, forcing, step)
+            with timer("update.parallel"):
+                self.parallel.update(self, step)
+            for hook in self.hooks.post_tracker + self.hooks.post_ibm:
+                hook(self, forcing, step)
+        else:
+            self.move(grid, forcing, step)
+
         # logging.info(
         #        "Model time = {}".format(self.timestamp.astype('M8[h]')))
         if self.timestamp.astype("int") % 3600 == 0:  # New hour
             logging.info("Model time = {}".format(self.timestamp.astype("M8[h]")))
 
+        # Compactify by removing dead particles
+        # Could have a switch to avoid this if no deaths
+        with timer("update.compact"):
+            self.pid = self.pid[self.alive]
+            for key in self.instance_variables:
+                self[key] = self[key][self.alive]
+
+    def move(self, grid: Grid, forcing: Forcing, step: int) -> None:
+        """Move the particles, update the IBM and the alive flags
+
+        The per particle part of the update, independent between
+        particles. Timestep and timestamp should be advanced.
+        """
+
+        # From physics all particles are alive
+        # self.alive = np.ones(len(self), dtype="bool")
+        self.alive = grid.ingrid(self.X, self.Y)
+
+        for hook in self.hooks.pre_tracker:
+            hook(self, forcing, step)
+        with timer("update.tracker"):
+            self.track.move_particles(grid, forcing, self)
+        for hook in self.hooks.post_tracker:
+            hook(self, forcing, step)
+
         # Update the IBM
         if self.ibm:
-            self.ibm.update_ibm(grid, self, forcing)
+            for hook in self.hooks.pre_ibm:
+                hook(self, forcing, step)
+            with timer("update.ibm"):
+                self.ibm.update_ibm(grid, self, forcing)
+            for hook in self.hooks.post_ibm:
+                hook(self, forcing, step)
 
         # Extension, allow inactive particles (not moved next time)
         if "active" in self.ibm_variables:
@@ -126,15 +171,12 @@ class State(Sized):
         I = self.Z > H
         self.Z[I] = 0.99 * H[I]
 
-        # Compactify by removing dead particles
-        # Could have a switch to avoid this if no deaths
-        self.pid = self.pid[self.alive]
-        for key in self.instance_variables:
-            self[key] = self[key][self.alive]
-
     def warm_start(self, config: Config, grid: Grid) -> None:
         """Perform a warm (re)start"""
 
+        from netCDF4 import Dataset, num2date
+        from .checkpoint import is_checkpoint, read_checkpoint
+
         warm_start_file = config["warm_start_file"]
         try:
             f = Dataset(warm_start_file)
@@ -142,6 +184,12 @@ class State(Sized):
             logging.critical(f"Can not open warm start file: {warm_start_file}")
             raise SystemExit(1)
 
+        if is_checkpoint(f):
+            logging.info("Reading checkpoint file")
+            with f:
+                read_checkpoint(self, f, config)
+            return
+
         logging.info("Reading warm start file")
         # Using last record in file
         tvar = f.variables["time"]
@@ -0,0 +1,103 @@
+"""Timing instrumentation for LADiM
+
+Cumulative wall time and number of calls of named phases of the
+model run. The phases are timed by the module level timer,
+
+  with timer("forcing.read"):
+      ...
+
+where a dotted name is a sub-phase. Optionally the time per phase
+is also recorded for every time step.
+"""
+
+# ------------------------------------
+# Bjørn Ådlandsvik <bjorn@imr.no>
+# Institute of Marine Research
+# ------------------------------------
+
+import csv
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+
+class Timer:
+    """Cumulative wall time and call counts of named phases"""
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self, record_steps: bool = False) -> None:
+        """Clear the timings"""
+        self.total: Dict[str, float] = {}  # Seconds
+        self.calls: Dict[str, int] = {}
+        self.record_steps = record_steps
+        self.steps: List[Dict[str, Any]] = []  # Per time step
+        self._step: Dict[str, float] = {}  # Present time step
+
+    @contextmanager
+    def __call__(self, name: str) -> Iterator[None]:
+        """Time a phase"""
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - tic)
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add a call of a phase"""
+        self.total[name] = self.total.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.record_steps:
+            self._step[name] = self._step.get(name, 0.0) + seconds
+
+    def end_step(self, step: int) -> None:
+        """Finish the time step, only needed for the per step record"""
+        if self.record_steps:
+            self._step["step"] = step
+            self.steps.append(self._step)
+            self._step = {}
+
+    def summary(self, total: str = "time loop") -> str:
+        """Table of the phases, sub-phases indented below their parent"""
+        reference = self.total.get(total, sum(self.total.values()))
+        lines = [
+            f"{'phase':36s} {'calls':>8s} {'seconds':>10s} {'ms/call':>10s} {'%':>6s}"
+        ]
+        names = sorted(self.total, key=lambda name: (name == total, name))
+        for name in names:
+            depth = name.count(".")
+            label = "  " * depth + name.split(".")[-1]
+            seconds = self.total[name]
+            calls = self.calls[name]
+            percent = 100 * seconds / reference if reference > 0 else 0.0
+            lines.append(
+                f"{label:36s} {calls:8d} {seconds:10.3f}"
+                f" {1000 * seconds / calls:10.3f} {percent:6.1f}"
+            )
+        return "\n".join(lines)
+
+    def write_json(self, filename: str) -> None:
+        """Write the cumulative timings as JSON"""
+        report = {
+            name: dict(calls=self.calls[name], seconds=self.total[name])
+            for name in sorted(self.total)
+        }
+        with open(filename, mode="w") as fid:
+            json.dump(report, fid, indent=2)
+
+    def write_csv(self, filename: str) -> None:
+        """Write the timings per time step as CSV"""
+        names = sorted({name for row in self.steps for name in row} - {"step"})
+        with open(filename, mode="w", newline="") as fid:
+            writer = csv.writer(fid)
+            writer.writerow(["step"] + names)
+            for row in self.steps:
+                writer.writerow(
+                    [row["step"]] + [f"{row.get(name, 0.0):.6f}" for name in names]
+                )
+
+
+# The timer used by the model components
+timer = Timer()
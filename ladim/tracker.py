@@ -13,6 +13,7 @@ from typing import Any, Tuple
 import numpy as np
 
 from .gridforce import Grid, Forcing
+from .timing import timer
 
 # from .state import State   # Circular import
 from .configuration import Config
@@ -57,13 +58,15 @@ class Tracker:
 
         # --- Advection ---
         if self.advect:
-            Uadv, Vadv = self.advect(forcing, state)
+            with timer("update.tracker.advection"):
+                Uadv, Vadv = self.advect(forcing, state)
             U += Uadv
             V += Vadv
 
         # --- Diffusion ---
         if self.diffusion:
-            Udiff, Vdiff = self.diffuse()
+            with timer("update.tracker.diffusion"):
+                Udiff, Vdiff = self.diffuse()
             U += Udiff
             V += Vdiff
 
@@ -25,3 +25,24 @@ def ingrid(x: float, y: float, subgrid: List[int]) -> bool:
     """Check if position (x, y) is in a subgrid"""
     i0, i1, j0, j1 = subgrid
     return (i0 <= x) & (x <= i1 - 1) & (j0 <= y) & (y <= j1 - 1)
+
+
+def inside_polygon(x: np.ndarray, y: np.ndarray, polygon: Any) -> np.ndarray:
+    """Check if positions (x, y) are inside a polygon
+
+    polygon: sequence of vertices [x, y], closing edge implied
+
+    Vectorized ray casting, even-odd rule
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    px, py = np.asarray(polygon, dtype=float).T
+    inside = np.zeros(x.shape, dtype=bool)
+    for i in range(len(px)):
+        x0, y0 = px[i - 1], py[i - 1]
+        x1, y1 = px[i], py[i]
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xcross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (x < xcross)
+    return inside
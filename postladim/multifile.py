@@ -0,0 +1,177 @@
+"""LADiM output split in several files, seen as one dataset
+
+With output_numrec > 0, LADiM writes the output to a sequence of
+files, name_0000.nc, name_0001.nc, ..., each with its own time
+records and particle instances. A MultiDataset presents them with
+global time and particle instance indexing, as one ragged array.
+
+The time and particle counts of all the files are read at start.
+Otherwise the files are opened on demand, with at most max_open
+files open at a time, the least recently used being closed.
+Selections by time, or by a time range, open only the files needed.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+
+class MultiDataset:
+    """Several LADiM output files as one dataset
+
+    Mimics the parts of xarray.Dataset used by ParticleFile.
+    Instance variables are MultiVariables, read on demand, other
+    variables are taken from the first file.
+    """
+
+    def __init__(self, filenames: Sequence[str], max_open: int = 16) -> None:
+        if not filenames:
+            raise FileNotFoundError("No particle files")
+        self.filenames = list(filenames)
+        self.max_open = max(1, max_open)
+        self._open: "OrderedDict[int, xr.Dataset]" = OrderedDict()
+
+        # Time and counts of all files, in time order
+        times = []
+        counts = []
+        for k in range(len(self.filenames)):
+            ds = self.dataset(k)
+            times.append(ds.time.values)
+            counts.append(ds.particle_count.values)
+        order = sorted(range(len(times)), key=lambda k: times[k][:1].tolist())
+        self.close()
+        self.filenames = [self.filenames[k] for k in order]
+        times = [times[k] for k in order]
+        counts = [counts[k] for k in order]
+
+        # Global time and instance offsets of the files
+        self.time_offset = np.cumsum([0] + [len(t) for t in times])
+        self.instance_offset = np.cumsum([0] + [int(c.sum()) for c in counts])
+
+        first = self.dataset(0)
+        time = np.concatenate(times)
+        self.time = xr.DataArray(
+            time, coords=dict(time=time), dims=("time",), name="time"
+        )
+        self.time.attrs.update(first.time.attrs)
+        self.particle_count = xr.DataArray(
+            np.concatenate(counts),
+            coords=dict(time=time),
+            dims=("time",),
+            name="particle_count",
+        )
+        self.attrs: Dict[str, Any] = dict(first.attrs)
+        self.variables: List[str] = list(first.variables)
+        self.instance_names = [
+            name for name in first.variables if "particle_instance" in first[name].dims
+        ]
+        self._variables: Dict[str, Any] = {}
+
+    def dataset(self, k: int) -> xr.Dataset:
+        """File number k, opened if needed"""
+        if k in self._open:
+            self._open.move_to_end(k)
+            return self._open[k]
+        ds = xr.open_dataset(self.filenames[k])
+        self._open[k] = ds
+        while len(self._open) > self.max_open:
+            _, old = self._open.popitem(last=False)
+            old.close()
+        return ds
+
+    def files(self, i0: int, i1: int) -> List[Tuple[int, int, int]]:
+        """Files with particle instances i0:i1, with local limits"""
+        offset = self.instance_offset
+        k0 = int(np.searchsorted(offset, i0, side="right")) - 1
+        parts = []
+        for k in range(max(k0, 0), len(self.filenames)):
+            if offset[k] >= i1:
+                break
+            a, b = max(i0, offset[k]), min(i1, offset[k + 1])
+            if b > a:
+                parts.append((k, a - offset[k], b - offset[k]))
+        return parts
+
+    def __getitem__(self, name: str) -> Any:
+        if name == "time":
+            return self.time
+        if name == "particle_count":
+            return self.particle_count
+        if name not in self._variables:
+            if name in self.instance_names:
+                self._variables[name] = MultiVariable(self, name)
+            else:  # Particle variables are the same in all files
+                self._variables[name] = self.dataset(0)[name].load()
+        return self._variables[name]
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name not in self.__dict__.get("variables", []):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self) -> None:
+        for ds in self._open.values():
+            ds.close()
+        self._open = OrderedDict()
+
+
+class MultiVariable:
+    """Instance variable across files, read on demand
+
+    Indexed by global particle instance, by an integer, a slice
+    with step 1 or an increasing integer array. The values are read
+    into memory as a DataArray along particle_instance.
+    """
+
+    dims = ("particle_instance",)
+
+    def __init__(self, mds: MultiDataset, name: str) -> None:
+        self.mds = mds
+        self.name = name
+        first = mds.dataset(0)[name]
+        self.dtype = first.dtype
+        self.attrs = dict(first.attrs)
+
+    def __len__(self) -> int:
+        return int(self.mds.instance_offset[-1])
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return (len(self),)
+
+    @property
+    def values(self) -> np.ndarray:
+        return np.asarray(self[:])
+
+    def _dataarray(self, values: np.ndarray) -> xr.DataArray:
+        return xr.DataArray(values, dims=self.dims, name=self.name, attrs=self.attrs)
+
+    def __getitem__(self, index: Any) -> xr.DataArray:
+        if isinstance(index, (int, np.integer)):
+            i = int(index) + len(self) if index < 0 else int(index)
+            if not 0 <= i < len(self):
+                raise IndexError(f"particle instance {index} out of range")
+            k, a, _ = self.mds.files(i, i + 1)[0]
+            return self.mds.dataset(k)[self.name][a].load()
+        if isinstance(index, slice):
+            i0, i1, step = index.indices(len(self))
+            if step != 1:
+                raise IndexError("step > 1 is not allowed")
+            parts = [np.empty(0, dtype=self.dtype)]
+            for k, a, b in self.mds.files(i0, i1):
+                parts.append(self.mds.dataset(k)[self.name][a:b].values)
+            return self._dataarray(np.concatenate(parts))
+        # Integer array
+        index = np.asarray(index, dtype=np.int64)
+        values = np.empty(len(index), dtype=self.dtype)
+        offset = self.mds.instance_offset
+        files = np.searchsorted(offset, index, side="right") - 1
+        for k in np.unique(files):
+            (sel,) = np.nonzero(files == k)
+            var = self.mds.dataset(int(k))[self.name]
+            values[sel] = var[index[sel] - offset[k]].values
+        return self._dataarray(values)
+
+    def __array__(self, dtype: Any = None) -> np.ndarray:
+        return np.asarray(self[:], dtype=dtype)
@@ -1,10 +1,14 @@
+import os
+import glob
 from collections import namedtuple
 import datetime
-from typing import Any, List, Dict, Union, Optional
+from typing import Any, List, Dict, Sequence, Union, Optional
 import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
 from .variable import InstanceVariable, ParticleVariable, arraystr
+from .pidindex import PidIndex
+from .multifile import MultiDataset
 
 
 Timetype = Union[str, np.datetime64, datetime.datetime]
@@ -73,16 +77,41 @@ class Time:
 
 
 class ParticleFile:
-    def __init__(self, filename: str) -> None:
-        ds = xr.open_dataset(filename)
+    """Particle file from LADiM
+
+    The filename may also be a glob pattern or a list of files, for
+    output split by output_numrec. The files are then presented as
+    one, opened on demand with at most max_open_files open at a time.
+
+    The pid index, for selection by particle, is built on first use.
+    With an index_file, typically a .npz file next to the particle
+    file, the index is saved there and reused by later sessions.
+    """
+
+    def __init__(
+        self,
+        filename: Union[str, Sequence[str]],
+        index_file: Optional[str] = None,
+        max_open_files: int = 16,
+    ) -> None:
+        filenames = particle_files(filename)
+        if len(filenames) > 1:
+            ds = MultiDataset(filenames, max_open=max_open_files)
+            filenames = ds.filenames  # In time order
+        elif is_zarr(filenames[0]):
+            ds = xr.open_zarr(filenames[0])
+        else:
+            ds = xr.open_dataset(filenames[0])
         self.ds = ds
+        self.filenames = filenames
         # End and start of segment with particles at a given time
         self.count = ds.particle_count.values
         self.end = self.count.cumsum()
         self.start = self.end - self.count
         self.num_times = len(self.count)
         self.time = Time(ds.time)
-        self.num_particles = int(ds.pid.max()) + 1  # Number of particles
+        self.index = PidIndex(ds.pid, self.count, cache_file=index_file)
+        self._raw: Dict[str, Any] = {}
 
         # Extract instance and particle variables from the netCDF file
         self.instance_variables: List["InstanceVariable"] = []
@@ -92,32 +121,154 @@ class ParticleFile:
             if "particle_instance" in self.ds[var].dims:
                 self.instance_variables.append(var)
                 self.variables[var] = InstanceVariable(
-                    self.ds[var], self.ds.pid, self.ds.time, self.count
+                    self.ds[var], self.ds.pid, self.ds.time, self.count, self.index
                 )
             elif "particle" in self.ds[var].dims:
                 self.particle_variables.append(var)
                 self.variables[var] = ParticleVariable(self.ds[var])
 
+    @property
+    def num_particles(self) -> int:
+        """Number of particles, largest pid + 1"""
+        return len(self.index.indptr) - 1
+
     # For convenience
     def position(self, time: int) -> Position:
         return Position(self.X[time], self.Y[time])
 
+    def _raw_variable(self, var: str) -> Any:
+        """Underlying array of an instance variable, without coordinates"""
+        if var not in self._raw:
+            if isinstance(self.ds, MultiDataset):
+                self._raw[var] = self.ds[var]
+            else:
+                self._raw[var] = self.ds[var].variable
+        return self._raw[var]
+
+    def raw(self, var: str, time: int) -> np.ndarray:
+        """Values of an instance variable at a time index, as numpy array
+
+        Lightweight alternative to pf[var][time], without the xarray
+        coordinates. The values are decoded as with xarray.
+        """
+        if time < 0:
+            time += self.num_times
+        if not 0 <= time < self.num_times:
+            raise IndexError(f"time index {time} out of range")
+        return np.asarray(self._raw_variable(var)[self.start[time] : self.end[time]])
+
+    def positions(
+        self,
+        t0: int = 0,
+        t1: Optional[int] = None,
+        variables: Sequence[str] = ("X", "Y"),
+    ) -> List[Any]:
+        """Particle distributions for time indices t0:t1
+
+        Each variable is read once for the whole time range, the
+        distribution at a time is a tuple of numpy views into these
+        arrays, Position(X, Y) with the default variables.
+        """
+        t0, t1, step = slice(t0, t1).indices(self.num_times)
+        if step != 1 or t1 <= t0:
+            return []
+        i0, i1 = self.start[t0], self.end[t1 - 1]
+        arrays = [np.asarray(self._raw_variable(var)[i0:i1]) for var in variables]
+        bounds = self.end[t0 : t1 - 1] - i0
+        frames = zip(*(np.split(A, bounds) for A in arrays))
+        if tuple(variables) == ("X", "Y"):
+            return [Position(*frame) for frame in frames]
+        return list(frames)
+
     # For backwards compability
     # Could define ParticleDataset (from file)
     # This could slice and take trajectories og that
     # Could improve speed by computing X and Y at same time
     def trajectory(self, pid: int) -> Trajectory:
-        # mypy barks on these two
-        # X = self["X"].sel(pid=pid)
-        # Y = self["Y"].sel(pid=pid)
-        X = InstanceVariable(self.ds["X"], self.ds.pid, self.ds.time, self.count).sel(
-            pid=pid
-        )
-        Y = InstanceVariable(self.ds["Y"], self.ds.pid, self.ds.time, self.count).sel(
-            pid=pid
-        )
+        X = self.variables["X"].sel(pid=pid)  # type: ignore
+        Y = self.variables["Y"].sel(pid=pid)  # type: ignore
         return Trajectory(X, Y)
 
+    def trajectories(
+        self,
+        pids: Any,
+        variables: Optional[List[str]] = None,
+        ragged: bool = False,
+        chunk_size: int = 1_000_000,
+    ) -> xr.Dataset:
+        """Trajectories of many particles, in one pass over the file
+
+        pids: particle identifiers, distinct
+        variables: instance variables, default = all except pid
+        ragged: CF contiguous ragged array result instead of dense
+        chunk_size: number of particle instances read at a time
+
+        Dense result: variables with dimensions (time, pid), NaN when
+        the particle is not present.
+        Ragged result: the instances of each particle contiguous and
+        ordered in time, dimensions trajectory and obs, with rowSize,
+        time(obs) and the variables(obs), as written by transpose.
+
+        Memory use is given by the selection and the chunk size,
+        not the size of the file.
+        """
+        pids = np.asarray(pids, dtype=np.int64).ravel()
+        if len(np.unique(pids)) < len(pids):
+            raise ValueError("The particle identifiers must be distinct")
+        if variables is None:
+            variables = [var for var in self.instance_variables if var != "pid"]
+        sorter = np.argsort(pids)
+        sorted_pids = pids[sorter]
+        # Nothing to read without a selection
+        num_instances = int(self.end[-1]) if self.num_times and len(pids) else 0
+
+        dense: Dict[str, np.ndarray] = {}
+        if not ragged:
+            for var in variables:
+                dtype = _float(self.ds[var].dtype)
+                dense[var] = np.full((self.num_times, len(pids)), np.nan, dtype=dtype)
+        columns: List[np.ndarray] = [np.array([], dtype=np.int64)]
+        tindex: List[np.ndarray] = [np.array([], dtype=np.int64)]
+        values: Dict[str, List[np.ndarray]] = {
+            var: [np.array([], dtype=self.ds[var].dtype)] for var in variables
+        }
+
+        for i0 in range(0, num_instances, chunk_size):
+            i1 = min(i0 + chunk_size, num_instances)
+            pid = self.ds.pid[i0:i1].values
+            k = np.minimum(np.searchsorted(sorted_pids, pid), len(pids) - 1)
+            (rows,) = np.nonzero(sorted_pids[k] == pid)
+            if len(rows) == 0:
+                continue
+            col = sorter[k[rows]]
+            tidx = np.searchsorted(self.end, i0 + rows, side="right")
+            for var in variables:
+                V = self.ds[var][i0:i1].values[rows]
+                if ragged:
+                    values[var].append(V)
+                else:
+                    dense[var][tidx, col] = V
+            if ragged:
+                columns.append(col)
+                tindex.append(tidx)
+
+        if not ragged:
+            coords = dict(time=self.time.da.values, pid=pids)
+            data_vars = {var: (("time", "pid"), dense[var]) for var in variables}
+            return xr.Dataset(data_vars, coords=coords)
+
+        col = np.concatenate(columns)
+        # Stable sort, the instances are read in time order
+        order = np.argsort(col, kind="stable")
+        time = self.time.da.values[np.concatenate(tindex)[order]]
+        data_vars = {
+            "rowSize": (("trajectory",), np.bincount(col, minlength=len(pids))),
+            "time": (("obs",), time),
+        }
+        for var in variables:
+            data_vars[var] = (("obs",), np.concatenate(values[var])[order])
+        return xr.Dataset(data_vars, coords=dict(trajectory=pids))
+
     # Obsolete
     def particle_count(self, time: int) -> int:
         return self.count[time]
@@ -162,3 +313,26 @@ class ParticleFile:
 # ----------------------
 # Utility functions
 # ---------------------
+
+
+def _float(dtype: Any) -> Any:
+    """Float type for a dense array with NaN for missing values"""
+    return dtype if np.issubdtype(dtype, np.floating) else np.float64
+
+
+def particle_files(filename: Union[str, Sequence[str]]) -> List[str]:
+    """List of particle files from a file name, glob pattern or list"""
+    if not isinstance(filename, (str, os.PathLike)):
+        filenames = [str(fname) for fname in filename]
+    elif any(c in str(filename) for c in "*?["):
+        filenames = sorted(glob.glob(str(filename)))
+    else:
+        filenames = [str(filename)]
+    if not filenames:
+        raise FileNotFoundError(f"No particle files matching {filename}")
+    return filenames
+
+
+def is_zarr(filename: str) -> bool:
+    """True if filename is a Zarr directory store"""
+    return str(filename).rstrip("/").endswith(".zarr") or os.path.isdir(filename)
@@ -0,0 +1,93 @@
+import os
+from typing import Optional, Tuple
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+
+class PidIndex:
+    """Inverted index from particle identifier to particle instances
+
+    Compressed sparse row layout, with one row per pid value:
+    the instances of particle p are instance[indptr[p]:indptr[p+1]],
+    at the time indices time_index[indptr[p]:indptr[p+1]], both
+    increasing with time.
+
+    The index is built on first use, reading the pid variable once.
+    With a cache file, the index is saved there and reused as long
+    as the particle counts of the file are unchanged.
+    """
+
+    def __init__(
+        self, pid: xr.DataArray, pcount: np.ndarray, cache_file: Optional[str] = None
+    ) -> None:
+        self.pid = pid
+        self.count = np.asarray(pcount, dtype=np.int64)
+        self.cache_file = cache_file
+        self._indptr: Optional[np.ndarray] = None
+        self._instance: Optional[np.ndarray] = None
+        self._time_index: Optional[np.ndarray] = None
+        self._particles: Optional[np.ndarray] = None
+
+    def _build(self) -> None:
+        """Build the index or read it from the cache file"""
+        if self.cache_file and os.path.exists(self.cache_file):
+            with np.load(self.cache_file) as cache:
+                if np.array_equal(cache["count"], self.count):
+                    self._indptr = cache["indptr"]
+                    self._instance = cache["instance"]
+                    self._time_index = cache["time_index"]
+                    return
+
+        pid = np.asarray(self.pid).astype(np.int64)
+        time_index = np.repeat(np.arange(len(self.count)), self.count)
+        # Stable sort keeps the time order within each particle
+        instance = np.argsort(pid, kind="stable")
+        num_rows = int(pid.max()) + 1 if len(pid) else 0
+        indptr = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pid, minlength=num_rows), out=indptr[1:])
+        self._indptr = indptr
+        self._instance = instance
+        self._time_index = time_index[instance]
+
+        if self.cache_file:
+            np.savez(
+                self.cache_file,
+                count=self.count,
+                indptr=self._indptr,
+                instance=self._instance,
+                time_index=self._time_index,
+            )
+
+    @property
+    def indptr(self) -> np.ndarray:
+        if self._indptr is None:
+            self._build()
+        return self._indptr
+
+    @property
+    def instance(self) -> np.ndarray:
+        if self._instance is None:
+            self._build()
+        return self._instance
+
+    @property
+    def time_index(self) -> np.ndarray:
+        if self._time_index is None:
+            self._build()
+        return self._time_index
+
+    @property
+    def particles(self) -> np.ndarray:
+        """The distinct pid values in the file, sorted"""
+        if self._particles is None:
+            self._particles = np.nonzero(np.diff(self.indptr))[0]
+        return self._particles
+
+    def rows(self, pid: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Instance and time indices of a particle, empty if not present"""
+        indptr = self.indptr
+        if not 0 <= pid < len(indptr) - 1:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+        i0, i1 = indptr[pid], indptr[pid + 1]
+        return self.instance[i0:i1], self.time_index[i0:i1]
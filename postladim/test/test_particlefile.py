@@ -119,6 +119,23 @@ def test_position(particle_file):
         assert all(Y == pf.Y[2])
 
 
+def test_raw(particle_file):
+    with ParticleFile(particle_file) as pf:
+        X = pf.raw("X", 2)
+        assert isinstance(X, np.ndarray)
+        assert list(X) == [2, 22]
+        assert list(pf.raw("pid", -1)) == [2]
+        with pytest.raises(IndexError):
+            pf.raw("X", 4)
+        frames = pf.positions(1, 4)
+        assert len(frames) == 3
+        for t, (X, Y) in zip(range(1, 4), frames):
+            assert np.all(X == pf.X[t]) and np.all(Y == pf.Y[t])
+        assert len(pf.positions()) == 4
+        (Z,), _ = pf.positions(2, variables=["pid"])
+        assert list(Z) == [0, 2]
+
+
 def test_trajectory(particle_file):
     with ParticleFile(particle_file) as pf:
         X, Y = pf.trajectory(2)
@@ -129,3 +146,151 @@ def test_trajectory(particle_file):
         assert all(traj.time == pf.time[:-1])
         assert all(traj.X == pf.X.sel(pid=0))
         assert all(traj.Y == pf.Y.sel(pid=0))
+
+
+def test_pid_index(particle_file):
+    """The inverted pid index, also from a cache file"""
+    index_file = "test_index.npz"
+    try:
+        with ParticleFile(particle_file, index_file=index_file) as pf:
+            assert list(pf.index.indptr) == [0, 3, 4, 6]
+            instance, times = pf.index.rows(2)
+            assert list(instance) == [4, 5] and list(times) == [2, 3]
+            assert len(pf.index.rows(3)[0]) == 0
+        assert os.path.exists(index_file)
+        with ParticleFile(particle_file, index_file=index_file) as pf:
+            assert list(pf.index.time_index) == [0, 1, 2, 1, 2, 3]
+            X, Y = pf.trajectory(2)
+            assert all(X == [22, 23])
+            assert pf.X[3, 2] == 23
+            assert np.isnan(pf.X[3, 0])
+            # Negative time index
+            assert pf.X[-1, 2] == 23
+            assert pf.X[-2, 0] == 2
+            assert np.isnan(pf.X[-1, 0])
+            with pytest.raises(IndexError):
+                pf.X[-5, 0]
+            assert pf.index.particles is pf.index.particles  # Cached
+    finally:
+        os.remove(index_file)
+
+
+def test_trajectories(particle_file):
+    with ParticleFile(particle_file) as pf:
+        D = pf.trajectories([2, 0], chunk_size=2)
+        assert D.X.dims == ("time", "pid")
+        assert list(D.pid) == [2, 0]
+        assert np.all(D.X[:, 0][2:] == [22, 23])
+        assert np.all(np.isnan(D.X[:2, 0]))
+        assert np.all(D.Y[:3, 1] == pf.Y.sel(pid=0))
+        R = pf.trajectories([2, 0], variables=["X"], ragged=True, chunk_size=4)
+        assert list(R.rowSize) == [2, 3]
+        assert list(R.X) == [22, 23, 0, 1, 2]
+        assert np.all(R.time[:2].values == pf.time[2:].values)
+        assert "Y" not in R
+        with pytest.raises(ValueError):
+            pf.trajectories([1, 1])
+
+
+def test_multifile(particle_file):
+    """Files split in time, as with output_numrec"""
+    fnames = ["multi_0000.nc", "multi_0001.nc"]
+    with Dataset(particle_file) as src:
+        count = src.variables["particle_count"][:]
+        offset = np.concatenate(([0], np.cumsum(count)))
+        for fname, (t0, t1) in zip(fnames, [(0, 2), (2, 4)]):
+            i0, i1 = offset[t0], offset[t1]
+            with Dataset(fname, mode="w") as nc:
+                nc.createDimension("particle", 3)
+                nc.createDimension("particle_instance", None)
+                nc.createDimension("time", t1 - t0)
+                for name, var in src.variables.items():
+                    v = nc.createVariable(name, var.dtype, var.dimensions)
+                    v.setncatts({a: var.getncattr(a) for a in var.ncattrs()})
+                    if var.dimensions == ("time",):
+                        v[:] = var[t0:t1]
+                    elif var.dimensions == ("particle_instance",):
+                        v[:] = var[i0:i1]
+                    else:
+                        v[:] = var[:]
+    try:
+        with ParticleFile(particle_file) as pf0:
+            X0 = pf0.X.full()
+        # Glob pattern or list of files, in any order
+        for arg in ["multi_*.nc", fnames[::-1]]:
+            with ParticleFile(arg, max_open_files=1) as pf:
+                assert pf.filenames == fnames
+                assert pf.num_times == 4
+                assert list(pf.count) == [1, 2, 2, 1]
+                assert pf.time[3] == np.datetime64("1970-01-01 03")
+                assert pf.num_particles == 3
+                assert all(pf.X[2] == [2, 22])
+                assert all(pf.pid[1] == [0, 1])
+                assert all(pf.X[1:3].da == [1, 11, 2, 22])
+                assert [list(X) for X, Y in pf.positions(1, 3)] == [[1, 11], [2, 22]]
+                assert all(pf.X.sel(pid=0) == [0, 1, 2])
+                assert pf.X[3, 2] == 23
+                X, Y = pf.trajectory(2)
+                assert all(Y == [9, 10])
+                assert np.array_equal(pf.X.full(), X0, equal_nan=True)
+                assert all(pf.location_id == np.array([10000, 10001, 10002]))
+                assert len(pf.ds._open) == 1
+                assert "num_times: 4" in repr(pf)
+    finally:
+        for fname in fnames:
+            os.remove(fname)
+    with pytest.raises(FileNotFoundError):
+        ParticleFile("no_such_file_*.nc")
+
+
+def test_packed():
+    """CF-packed instance variables are decoded"""
+    pfile = "packed.nc"
+    with Dataset(pfile, mode="w") as nc:
+        nc.createDimension("particle", 2)
+        nc.createDimension("particle_instance", None)
+        nc.createDimension("time", 2)
+        v = nc.createVariable("time", "f8", ("time",))
+        v.units = "seconds since 1970-01-01 00:00:00"
+        nc.createVariable("particle_count", "i", ("time",))
+        nc.createVariable("pid", "i", ("particle_instance",))
+        v = nc.createVariable("X", "i4", ("particle_instance",))
+        v.scale_factor = 0.001
+        nc.createVariable("Y", "f4", ("particle_instance",))
+        v = nc.createVariable("Z", "i2", ("particle_instance",))
+        v.scale_factor = 0.01
+        v.add_offset = 100.0
+        nc.variables["time"][:] = [0, 3600]
+        nc.variables["particle_count"][:] = [1, 2]
+        nc.variables["pid"][:] = [0, 0, 1]
+        nc.variables["X"][:] = [1.5, 2.25, 3.125]
+        nc.variables["Y"][:] = [1, 2, 3]
+        nc.variables["Z"][:] = [5.0, 10.0, 20.0]
+
+    with ParticleFile(pfile) as pf:
+        assert np.allclose(pf.X[1], [2.25, 3.125])
+        assert np.allclose(pf.Z[0], 5.0)
+        assert np.allclose(pf.trajectory(0).X, [1.5, 2.25])
+    os.remove(pfile)
+
+
+def test_zarr(particle_file):
+    """Reading a Zarr store"""
+    pytest.importorskip("zarr")
+    import shutil
+    import xarray as xr
+
+    store = "test.zarr"
+    with xr.open_dataset(particle_file) as ds:
+        ds.to_zarr(store, mode="w")
+    try:
+        with ParticleFile(store) as pf:
+            assert pf.num_times == 4
+            assert list(pf.count) == [1, 2, 2, 1]
+            assert pf.time[3] == np.datetime64("1970-01-01 03")
+            assert sorted(pf.instance_variables) == ["X", "Y", "pid"]
+            assert list(pf.pid[2]) == [0, 2]
+            X, Y = pf.trajectory(2)
+            assert all(X == [22, 23])
+    finally:
+        shutil.rmtree(store)
@@ -0,0 +1,63 @@
+import os
+import pytest
+
+import numpy as np
+from netCDF4 import Dataset
+
+from postladim.transpose import transpose, particle_blocks
+
+
+@pytest.fixture(scope="module")
+def particle_file():
+    # Small particle file, with a particle never written
+    #
+    #  0   -   -   -
+    #  1  11   -   -
+    #  2   -  22   -
+    #  -   -  23   -
+    #
+    pfile = "transpose_test.nc"
+    with Dataset(pfile, mode="w") as nc:
+        nc.createDimension("particle", 4)
+        nc.createDimension("particle_instance", None)
+        nc.createDimension("time", 4)
+        v = nc.createVariable("time", "f8", ("time",))
+        v.units = "seconds since 1970-01-01 00:00:00"
+        nc.createVariable("particle_count", "i", ("time",))
+        nc.createVariable("location_id", "i", ("particle",))
+        nc.createVariable("pid", "i", ("particle_instance",))
+        nc.createVariable("X", "f4", ("particle_instance",))
+        v = nc.createVariable("Z", "i2", ("particle_instance",))
+        v.scale_factor = 0.5
+        nc.variables["time"][:] = 3600 * np.arange(4)
+        nc.variables["particle_count"][:] = [1, 2, 2, 1]
+        nc.variables["location_id"][:] = [10000, 10001, 10002, 10003]
+        nc.variables["pid"][:] = [0, 0, 1, 0, 2, 2]
+        nc.variables["X"][:] = [0, 1, 11, 2, 22, 23]
+        nc.variables["Z"][:] = [0, 0.5, 5.5, 1, 11, 11.5]
+    yield pfile
+    os.remove(pfile)
+
+
+@pytest.mark.parametrize("max_instances", [1, 2, 100])
+def test_transpose(particle_file, max_instances):
+    tfile = "transpose_traj.nc"
+    transpose(particle_file, tfile, max_instances=max_instances)
+    with Dataset(tfile) as nc:
+        assert nc.featureType == "trajectory"
+        assert list(nc.variables["rowSize"][:]) == [3, 1, 2, 0]
+        assert list(nc.variables["trajectory"][:]) == [0, 1, 2, 3]
+        assert list(nc.variables["X"][:]) == [0, 1, 2, 11, 22, 23]
+        assert list(nc.variables["time"][:]) == [0, 3600, 7200, 3600, 7200, 10800]
+        # Packing kept
+        assert nc.variables["Z"].dtype == np.int16
+        assert list(nc.variables["Z"][:]) == [0, 0.5, 1, 5.5, 11, 11.5]
+        assert list(nc.variables["location_id"][:]) == [10000, 10001, 10002, 10003]
+        assert "pid" not in nc.variables
+    os.remove(tfile)
+
+
+def test_blocks():
+    row_size = np.array([3, 1, 2, 0, 5, 1])
+    assert list(particle_blocks(row_size, 4)) == [0, 2, 4, 5, 6]
+    assert list(particle_blocks(row_size, 100)) == [0, 6]
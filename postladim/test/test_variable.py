@@ -176,6 +176,36 @@ def test_full(particle_file):
         assert V[3, 2] == 23
 
 
+def test_full_backends(particle_file):
+    with ParticleFile(particle_file) as pf:
+        V = pf.X.full()
+        V32 = pf.X.full(dtype=np.float32)
+        assert V32.dtype == np.float32
+        assert np.array_equal(V32.values, V.values, equal_nan=True)
+        assert list(V.pid) == [0, 1, 2]
+        # Time slice, without particle 1
+        W = pf.X[2:4].full()
+        assert list(W.pid) == [0, 2]
+        assert W[1, 1] == 23 and np.isnan(W[1, 0])
+
+
+def test_full_dask(particle_file):
+    pytest.importorskip("dask")
+    with ParticleFile(particle_file) as pf:
+        V = pf.X.full(backend="dask", chunks=3)
+        assert V.data.chunks[0] == (3, 1)
+        assert np.array_equal(V.values, pf.X.full().values, equal_nan=True)
+
+
+def test_full_sparse(particle_file):
+    pytest.importorskip("scipy")
+    with ParticleFile(particle_file) as pf:
+        S = pf.X.full(backend="sparse", dtype=np.float32)
+        assert S.shape == (4, 3)
+        assert S.nnz == 6
+        assert S.toarray()[3, 2] == 23
+
+
 def test_particle_variable(particle_file):
     """Two particle variables, start_time and location_id"""
     with ParticleFile(particle_file) as pf:
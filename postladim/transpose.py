@@ -0,0 +1,215 @@
+"""Transpose LADiM output to trajectory-major layout
+
+The LADiM output is time-major, an indexed ragged array where the
+particles present at a time are contiguous. For per-particle
+analysis, this module writes a CF contiguous ragged array
+representation of the trajectories (featureType = trajectory),
+where the instances of a particle are contiguous and ordered in time:
+
+  rowSize(trajectory)       number of instances of the particle
+  trajectory(trajectory)    particle identifier, pid
+  time(obs)                 time of the instance
+  X(obs), Y(obs), ...       the instance variables
+
+The instances of particle pid are obs[start:start + rowSize[pid]]
+with start = sum(rowSize[:pid]).
+
+The transposition runs out-of-core: the particles are divided in
+blocks with a bounded number of instances, and each block is
+gathered from the input file and written contiguously. Memory use
+is given by the block size, not the file size.
+
+Command line usage:
+
+  python -m postladim.transpose out.nc traj.nc --max_instances 10000000
+
+"""
+
+import argparse
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np  # type: ignore
+from netCDF4 import Dataset  # type: ignore
+
+
+def transpose(
+    input_file: str,
+    output_file: str,
+    variables: Optional[Sequence[str]] = None,
+    max_instances: int = 10_000_000,
+    format: str = "NETCDF4",
+) -> None:
+    """Write a trajectory-major copy of a LADiM output file
+
+    input_file: LADiM output file
+    output_file: name of the trajectory file
+    variables: instance variables to include, default = all
+    max_instances: maximum number of instances in memory at a time
+    format: NetCDF format of the trajectory file
+    """
+
+    with Dataset(input_file) as src:
+        src.set_auto_maskandscale(False)  # Copy packed data as is
+        count = src.variables["particle_count"][:].astype(np.int64)
+        end = count.cumsum()
+        start = end - count
+        pid_var = src.variables["pid"]
+        num_particles = src.dimensions["particle"].size
+        if variables is None:
+            variables = [
+                name
+                for name, var in src.variables.items()
+                if var.dimensions == ("particle_instance",) and name != "pid"
+            ]
+
+        # Pass 1: number of instances of each particle
+        row_size = np.zeros(num_particles, dtype=np.int64)
+        for t in range(len(count)):
+            pids = pid_var[start[t] : end[t]]
+            row_size += np.bincount(pids, minlength=num_particles)
+        offset = np.concatenate(([0], row_size.cumsum()))
+        blocks = particle_blocks(row_size, max_instances)
+        logging.info(f"Transposing in {len(blocks) - 1} blocks")
+
+        # Pass 2: For each time, start of the blocks in the sorted pids
+        block_index = np.empty((len(count), len(blocks)), dtype=np.int64)
+        for t in range(len(count)):
+            pids = pid_var[start[t] : end[t]]
+            block_index[t] = start[t] + np.searchsorted(pids, blocks)
+
+        with Dataset(output_file, mode="w", format=format) as dst:
+            _define_trajectory_file(src, dst, variables, row_size)
+            times = src.variables["time"][:]
+
+            # Pass 3: gather and write the blocks
+            for b in range(len(blocks) - 1):
+                p0, p1 = blocks[b], blocks[b + 1]
+                size = offset[p1] - offset[p0]
+                if size == 0:
+                    continue
+                fill = np.zeros(p1 - p0, dtype=np.int64)  # Instances so far
+                position = np.empty(size, dtype=np.int64)
+                buffers = {
+                    name: np.empty(size, dtype=src.variables[name].dtype)
+                    for name in variables
+                }
+                time_buffer = np.empty(size, dtype=times.dtype)
+                # Map from input order to trajectory order
+                n = 0
+                segments = []
+                for t in range(len(count)):
+                    i0, i1 = block_index[t, b], block_index[t, b + 1]
+                    if i1 == i0:
+                        continue
+                    q = pid_var[i0:i1] - p0
+                    pos = offset[p0 + q] - offset[p0] + fill[q]
+                    fill[q] += 1
+                    position[n : n + i1 - i0] = pos
+                    time_buffer[pos] = times[t]
+                    segments.append((i0, i1, n))
+                    n += i1 - i0
+                for name in variables:
+                    var = src.variables[name]
+                    buf = buffers[name]
+                    for i0, i1, n in segments:
+                        buf[position[n : n + i1 - i0]] = var[i0:i1]
+                    dst.variables[name][offset[p0] : offset[p1]] = buf
+                dst.variables["time"][offset[p0] : offset[p1]] = time_buffer
+                logging.debug(f"Block {b}: particles {p0}-{p1}, {size} instances")
+
+
+def particle_blocks(row_size: np.ndarray, max_instances: int) -> np.ndarray:
+    """Divide the particles in blocks with bounded number of instances
+
+    Returns the block limits, pid values [0, ..., num_particles].
+    A single particle with more instances gets a block of its own.
+    """
+    offset = np.concatenate(([0], np.cumsum(row_size)))
+    num_particles = len(row_size)
+    limits: List[int] = [0]
+    p = 0
+    while p < num_particles:
+        # Last particle limit within the bound
+        q = int(np.searchsorted(offset, offset[p] + max_instances, side="right")) - 1
+        p = min(max(q, p + 1), num_particles)
+        limits.append(p)
+    return np.array(limits)
+
+
+def _define_trajectory_file(
+    src: Dataset, dst: Dataset, variables: Sequence[str], row_size: np.ndarray
+) -> None:
+    """Define the contiguous ragged array trajectory file"""
+    dst.createDimension("trajectory", len(row_size))
+    dst.createDimension("obs", int(row_size.sum()))
+
+    v = dst.createVariable("trajectory", "i4", ("trajectory",))
+    v.long_name = "particle identifier"
+    v.cf_role = "trajectory_id"
+    v[:] = np.arange(len(row_size))
+
+    v = dst.createVariable("rowSize", "i4", ("trajectory",))
+    v.long_name = "number of instances of the particle"
+    v.sample_dimension = "obs"
+    v[:] = row_size
+
+    tvar = src.variables["time"]
+    v = dst.createVariable("time", tvar.dtype, ("obs",), zlib=True)
+    v.setncatts({a: tvar.getncattr(a) for a in tvar.ncattrs()})
+
+    for name in variables:
+        var = src.variables[name]
+        v = dst.createVariable(name, var.dtype, ("obs",), zlib=True)
+        v.set_auto_maskandscale(False)
+        attrs = {a: var.getncattr(a) for a in var.ncattrs() if a != "_FillValue"}
+        v.setncatts(attrs)
+
+    # Particle variables, indexed by pid
+    for name, var in src.variables.items():
+        if var.dimensions[:1] == ("particle",):
+            dims = ("trajectory",) + var.dimensions[1:]
+            for dim in var.dimensions[1:]:
+                if dim not in dst.dimensions:
+                    dst.createDimension(dim, src.dimensions[dim].size)
+            v = dst.createVariable(name, var.dtype, dims, zlib=True)
+            v.set_auto_maskandscale(False)
+            attrs = {a: var.getncattr(a) for a in var.ncattrs() if a != "_FillValue"}
+            v.setncatts(attrs)
+            v[:] = var[:]
+
+    attrs = {a: src.getncattr(a) for a in src.ncattrs()}
+    attrs["featureType"] = "trajectory"
+    attrs["history"] = attrs.get("history", "") + ", transposed by postladim"
+    dst.setncatts(attrs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Transpose LADiM output to trajectory-major layout"
+    )
+    parser.add_argument("input_file", help="LADiM output file")
+    parser.add_argument("output_file", help="Trajectory file")
+    parser.add_argument(
+        "-v", "--variables", nargs="+", help="Instance variables, default = all"
+    )
+    parser.add_argument(
+        "--max_instances",
+        type=int,
+        default=10_000_000,
+        help="Maximum number of instances in memory",
+    )
+    parser.add_argument("--format", default="NETCDF4", help="NetCDF format")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    transpose(
+        args.input_file,
+        args.output_file,
+        variables=args.variables,
+        max_instances=args.max_instances,
+        format=args.format,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from typing import Any, List, Dict, Union, Optional
 import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
+from .pidindex import PidIndex
+
 Timetype = Union[str, np.datetime64, datetime.datetime]
 Array = Union[np.ndarray, xr.DataArray]
 
@@ -14,6 +16,7 @@ class InstanceVariable:
         pid: xr.DataArray,
         ptime: xr.DataArray,
         pcount: np.ndarray,
+        index: Optional[PidIndex] = None,
     ) -> None:
         self.da = data
         self.pid = pid
@@ -22,8 +25,17 @@ class InstanceVariable:
         self.end = self.count.cumsum()
         self.start = self.end - self.count
         self.num_times = len(self.time)
-        self.particles = np.unique(self.pid)
-        self.num_particles = len(self.particles)  # Number of distinct particles
+        # Inverted pid index, may be shared with other variables
+        self.index = index if index is not None else PidIndex(pid, pcount)
+
+    @property
+    def particles(self) -> np.ndarray:
+        return self.index.particles
+
+    @property
+    def num_particles(self) -> int:
+        """Number of distinct particles"""
+        return len(self.particles)
 
     # @property
     # def end(self) -> np.ndarray:
@@ -64,27 +76,36 @@ class InstanceVariable:
         )
 
     def _sel_time_value(self, time_val: Timetype) -> xr.DataArray:
-        idx = self.time.get_index("time").get_loc(time_val)
-        return self._sel_time_index(idx)
+        return self._sel_time_index(self._time_index_of(time_val))
+
+    def _time_index_of(self, time_val: Timetype) -> int:
+        if isinstance(time_val, xr.DataArray):
+            time_val = time_val.values
+        return self.time.get_index("time").get_loc(time_val)
 
     def _sel_pid_value(self, pid: int) -> xr.DataArray:
         """Selection based on single pid value"""
-        # Burde få en pid-koordinat også
-        data = []
-        times = []
-        for t_idx in range(self.num_times):
-            try:
-                data.append(self._sel_time_index(t_idx).sel(pid=pid))
-                times.append(t_idx)
-            except KeyError:
-                pass
-        # Bedre, på forhånd sjekk om pid > maximum
-        if not data:
+        instance, times = self.index.rows(pid)
+        if len(instance) == 0:
             raise KeyError(f"No such pid = {pid}")
+        data = np.asarray(self.da[instance])
         V = xr.DataArray(data, coords={"time": self.time[times]}, dims=("time",))
         V["pid"] = pid
         return V
 
+    def _sel_time_pid_index(self, n: int, pid: int) -> xr.DataArray:
+        """Selection by time index and pid value"""
+        if n < 0:
+            n += self.num_times
+        if not 0 <= n < self.num_times:
+            raise IndexError(f"time index out of range, num_times={self.num_times}")
+        instance, times = self.index.rows(pid)
+        k = np.searchsorted(times, n)
+        if k == len(times) or times[k] != n:
+            raise KeyError(f"No pid = {pid} at time index {n}")
+        V = self.da[int(instance[k])]
+        return V.assign_coords(time=self.time[n], pid=pid)
+
     # def isel(self, *, time: Optional[int] = None) -> xr.DataArray:
     #     if time is not None:
     #         return self._sel_time_index(time)
@@ -102,21 +123,74 @@ class InstanceVariable:
         if time is not None and pid is None:
             return self._sel_time_value(time)
         if time is not None and pid is not None:
-            return self._sel_time_value(time).sel(pid=pid)
+            return self._sel_time_pid_index(self._time_index_of(time), pid)
         # No arguments
         raise ValueError("Need 1 or 2 arguments")
 
-    # Do something like dask if the array gets to big
-    def full(self) -> xr.DataArray:
-        """Return a full DataArray"""
-        data = np.empty((self.num_times, self.num_particles))
-        data[:, :] = np.nan
-        for n in range(self.num_times):
-            data[n, self.pid[self.start[n] : self.end[n]]] = self._sel_time_index(n)
-        # coords = dict(time=self.time, pid=self.particles)
-        coords = [("time", self.time), ("pid", self.particles)]
-        V = xr.DataArray(data=data, coords=coords, dims=("time", "pid"))
-        return V
+    def _dense_block(self, n0: int, n1: int, dtype: Any) -> np.ndarray:
+        """Dense (time, pid) block for time indices n0:n1, NaN if missing"""
+        if n1 <= n0:
+            return np.empty((0, self.num_particles), dtype=dtype)
+        i0, i1 = self.start[n0], self.end[n1 - 1]
+        rows = np.repeat(np.arange(n1 - n0), self.count[n0:n1])
+        cols = np.searchsorted(self.particles, np.asarray(self.pid[i0:i1]))
+        data = np.full((n1 - n0, self.num_particles), np.nan, dtype=dtype)
+        data[rows, cols] = np.asarray(self.da[i0:i1])
+        return data
+
+    def full(
+        self,
+        dtype: Any = np.float64,
+        backend: str = "dense",
+        chunks: Optional[int] = None,
+    ) -> Any:
+        """Return the variable on (time, pid), as a full DataArray
+
+        dtype: float type of the result, float32 halves the memory
+        backend: "dense", "dask" or "sparse"
+        chunks: time steps per dask chunk, default about 16 M values
+
+        The dense result is a DataArray with NaN where a particle
+        is missing. With dask, it is computed chunk by chunk on
+        demand, so the full array need not fit in memory.
+        The sparse result is a scipy.sparse COO matrix, rows are time
+        indices, columns index the particles array, and missing values
+        are not stored. Neither dask nor scipy are required by postladim.
+        """
+        coords = [("time", self.time.values), ("pid", self.particles)]
+        if backend == "dense":
+            data = self._dense_block(0, self.num_times, dtype)
+            return xr.DataArray(data=data, coords=coords, dims=("time", "pid"))
+
+        if backend == "dask":
+            try:
+                import dask  # type: ignore
+                import dask.array as darray  # type: ignore
+            except ImportError:
+                raise ImportError("full with dask backend needs the dask package")
+            if chunks is None:
+                chunks = max(1, 2 ** 24 // max(1, self.num_particles))
+            blocks = []
+            for n0 in range(0, self.num_times, chunks):
+                n1 = min(n0 + chunks, self.num_times)
+                block = dask.delayed(self._dense_block)(n0, n1, dtype)
+                shape = (n1 - n0, self.num_particles)
+                blocks.append(darray.from_delayed(block, shape=shape, dtype=dtype))
+            data = darray.concatenate(blocks, axis=0)
+            return xr.DataArray(data=data, coords=coords, dims=("time", "pid"))
+
+        if backend == "sparse":
+            try:
+                from scipy import sparse  # type: ignore
+            except ImportError:
+                raise ImportError("full with sparse backend needs the scipy package")
+            rows = np.repeat(np.arange(self.num_times), self.count)
+            cols = np.searchsorted(self.particles, np.asarray(self.pid))
+            values = np.asarray(self.da, dtype=dtype)
+            shape = (self.num_times, self.num_particles)
+            return sparse.coo_matrix((values, (rows, cols)), shape=shape)
+
+        raise ValueError(f"Unknown backend {backend}")
 
     # More complicated typing
     # def __getitem__(self, index: Union[int, slice]) -> xr.DataArray:
@@ -131,7 +205,7 @@ class InstanceVariable:
             time_idx, pid = index
             if 0 <= pid < self.num_particles:
                 try:
-                    v = self._sel_time_index(time_idx).sel(pid=pid)
+                    v = self._sel_time_pid_index(time_idx, pid)
                 except KeyError:
                     # Også håndtere v != floatpf.
                     v = np.nan
@@ -193,7 +267,10 @@ def itemstr(v: Array) -> str:
 
 def arraystr(A: Array) -> str:
     """Pretty print array"""
-    B = np.asarray(A).ravel()
-    if len(B) <= 3:
-        return " ".join([itemstr(v) for v in B])
-    return " ".join([itemstr(B[0]), itemstr(B[1]), "...", itemstr(B[-1])])
+    if np.ndim(A) > 1:
+        A = np.asarray(A).ravel()
+    if len(A) <= 3:
+        return " ".join([itemstr(v) for v in np.asarray(A)])
+    # Only read the items shown
+    B = [np.asarray(A[i])[()] for i in [0, 1, -1]]
+    return " ".join([itemstr(B[0]), itemstr(B[1]), "...", itemstr(B[2])])
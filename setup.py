@@ -9,6 +9,6 @@ setup(
     author="Bjørn Ådlandsvik",
     author_email="bjorn@imr.no",
     packages=["ladim", "postladim", "ladim.ibms", "ladim.gridforce"],
-    scripts=["scripts/ladim"],
+    scripts=["scripts/ladim", "scripts/ladim_transpose"],
     requires=["numpy", "yaml", "netCDF4", "pandas"],
 )
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from ladim.checkpoint import Checkpoint, is_checkpoint, checkpoint_time, read_checkpoint
+from ladim.configuration import configure_checkpoint
+
+
+class Release:
+    """Particle releaser after two releases"""
+
+    def __init__(self):
+        self._index = 2
+        self._particle_count = 4
+        self.particle_variables = dict(
+            release_time=np.array([0.0, 0.0, 3600.0, 3600.0, 7200.0]),
+            farm=np.array(["Alpha", "Bo", "Cee", "Dublin", "Eh"], dtype=object),
+        )
+
+
+class State:
+    """Minimal model state"""
+
+    def __init__(self):
+        self.instance_variables = ["X", "Y", "Z", "age"]
+        self.pid = np.array([1, 2, 3])
+        self.X = np.array([10.1, 11.2, 12.3])
+        self.Y = np.array([20.1, 21.2, 22.3])
+        self.Z = np.array([1.0, 2.0, 3.0])
+        self.age = np.array([7200.0, 3600.0, 3600.0])
+        self.timestamp = np.datetime64("2000-01-01T02", "s")
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.pid)
+
+
+@pytest.fixture
+def filename():
+    fname = "test_checkpoint.nc"
+    yield fname
+    if os.path.exists(fname):
+        os.remove(fname)
+
+
+def test_restore(filename):
+    """State and random generator are restored exactly"""
+    config = dict(checkpoint=dict(file=filename, period=2), dt=3600)
+    checkpoint = Checkpoint(config, Release())
+    state = State()
+    checkpoint.write(state, step=1)  # Not a checkpoint step
+    assert not os.path.exists(filename)
+    np.random.seed(5)
+    checkpoint.write(state, step=2)
+    expected = np.random.normal(size=10)
+
+    np.random.seed(6)
+    new = State()
+    for name in ["pid"] + new.instance_variables:
+        new[name] = None
+    with Dataset(filename) as nc:
+        assert is_checkpoint(nc)
+        assert checkpoint_time(nc) == state.timestamp
+        assert nc.particle_count == 4
+        assert list(nc.variables["farm"][:]) == ["Alpha", "Bo", "Cee", "Dublin"]
+        read_checkpoint(new, nc, config)
+    assert np.all(np.random.normal(size=10) == expected)
+    assert np.all(new.pid == state.pid)
+    for name in state.instance_variables:
+        assert np.all(new[name] == state[name])
+
+
+def test_configure():
+    config = dict(dt=600)
+    assert configure_checkpoint({}, config) == {}
+    D = configure_checkpoint(
+        dict(checkpoint=dict(file="restart.nc", period=[1, "h"])), config
+    )
+    assert D == dict(file="restart.nc", period=6)
+    with pytest.raises(SystemExit):
+        configure_checkpoint(dict(checkpoint=dict(file="restart.nc")), config)
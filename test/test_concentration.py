@@ -0,0 +1,119 @@
+import os
+from io import StringIO
+
+import numpy as np
+import pytest
+import yaml
+from netCDF4 import Dataset
+
+from ladim.configuration import configure_concentration
+from ladim.concentration import Concentration
+
+
+class Grid:
+    xmin, xmax, ymin, ymax = 0.0, 4.0, 0.0, 2.0
+
+
+class State:
+    def __init__(self, step, X, Y, super, age):
+        self.timestep = step
+        self.timestamp = np.datetime64("2000-01-01", "s") + step * np.timedelta64(
+            600, "s"
+        )
+        self.X = np.array(X, dtype=float)
+        self.Y = np.array(Y, dtype=float)
+        self.super = np.array(super, dtype=float)
+        self.age = np.array(age, dtype=float)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def make_config(**args):
+    conc = dict(
+        output_file="test_conc.nc",
+        period=2,
+        sample_period=1,
+        weight=None,
+        filters={},
+        statistic="mean",
+        format="NETCDF4",
+    )
+    conc.update(args)
+    return dict(concentration=conc, reference_time=np.datetime64("2000-01-01", "s"))
+
+
+@pytest.fixture
+def cleanup():
+    yield
+    os.remove("test_conc.nc")
+
+
+def test_count(cleanup):
+    """Plain counts averaged over the period"""
+    grid = Grid()
+    C = Concentration(make_config(), grid)
+    assert C.shape == (3, 5)
+    C.write(State(0, [0, 1.2, 0.9, 10], [0, 2, 2, 0], [1, 1, 1, 1], [0] * 4), grid)
+    C.write(State(1, [1], [2], [1], [0]), grid)
+    C.write(State(2, [4], [0], [1], [0]), grid)
+    C.close()
+    with Dataset("test_conc.nc") as nc:
+        assert list(nc.variables["time"][:]) == [300, 1200]
+        conc = nc.variables["conc"][:]
+        assert conc.shape == (2, 3, 5)
+        assert conc[0, 0, 0] == 0.5
+        assert conc[0, 2, 1] == 1.5  # Particle outside ignored
+        assert conc[0].sum() == 2.0
+        assert conc[1, 0, 4] == 1.0
+        assert nc.variables["conc"].cell_methods == "time: mean"
+
+
+def test_weight_filter(cleanup):
+    """Weighted sum with age filter and sampling"""
+    config = make_config(
+        weight="super",
+        filters=dict(age=[40, 170]),
+        statistic="sum",
+        sample_period=2,
+        period=4,
+    )
+    grid = Grid()
+    C = Concentration(config, grid)
+    for step in range(4):
+        state = State(step, [1, 2, 3], [1, 1, 1], [10, 20, 30], [30, 50, 170])
+        C.write(state, grid)
+    C.close()
+    with Dataset("test_conc.nc") as nc:
+        conc = nc.variables["conc"][:]
+        assert conc.shape == (1, 3, 5)
+        assert conc[0, 1, 2] == 40  # Two samples of weight 20
+        assert conc[0].sum() == 40
+        assert nc.variables["conc"].units == "super per grid cell"
+        assert nc.variables["conc"].filter_age == "[40, 170)"
+
+
+def test_configure():
+    conf = yaml.safe_load(
+        StringIO(
+            """
+        concentration:
+            output_file: conc.nc
+            period: [24, h]
+            sample_period: [1, h]
+            weight: super
+            filters: {age: [40, null]}
+    """
+        )
+    )
+    D = configure_concentration(conf, dict(dt=600, numsteps=1000))
+    assert D["period"] == 144
+    assert D["sample_period"] == 6
+    assert D["filters"] == dict(age=[40, None])
+    assert D["statistic"] == "mean"
+    assert configure_concentration({}, dict(dt=600, numsteps=1000)) == {}
+    D = configure_concentration(
+        dict(concentration=dict(output_file="c.nc")), dict(dt=600, numsteps=1000)
+    )
+    assert D["period"] == 1001
+    assert D["sample_period"] == 1
@@ -0,0 +1,208 @@
+import numpy as np
+import pytest
+
+from ladim.configuration import configure_decomposition
+from ladim.decomposition import (
+    Decomposition,
+    balanced_bounds,
+    owner,
+    tile_limits,
+)
+from ladim import gridforce
+from ladim.state import State
+
+# This module is also the gridforce module, Grid and Forcing classes
+
+
+class Grid:
+    """ROMS-type grid with subgrid, 30 x 10 cells"""
+
+    def __init__(self, config):
+        limits = config["gridforce"].get("subgrid", [1, 31, 1, 11])
+        self.i0, self.i1, self.j0, self.j1 = limits
+        self.xmin, self.xmax = float(self.i0), float(self.i1 - 1)
+        self.ymin, self.ymax = float(self.j0), float(self.j1 - 1)
+        self.H = np.full((self.j1 - self.j0, self.i1 - self.i0), 100.0)
+
+    def sample_metric(self, X, Y):
+        return np.full(len(X), 1000.0), np.full(len(X), 1000.0)
+
+    def sample_depth(self, X, Y):
+        return self.H[Y.round().astype(int) - self.j0, X.round().astype(int) - self.i0]
+
+    def ingrid(self, X, Y):
+        return (
+            (self.xmin + 0.5 < X)
+            & (X < self.xmax - 0.5)
+            & (self.ymin + 0.5 < Y)
+            & (Y < self.ymax - 0.5)
+        )
+
+    def atsea(self, X, Y):
+        return np.ones(len(X), dtype=bool)
+
+
+class Forcing:
+    """Velocity on the subgrid, changing in time"""
+
+    def __init__(self, config, grid):
+        self.grid = grid
+        # Time steps from 2000-01-01, also after a rebalance
+        start = config["start_time"] - np.datetime64("2000-01-01T00", "s")
+        self.step0 = int(start.astype("m8[s]").astype(int)) // config["dt"]
+        self.time = self.step0
+        ii = np.arange(grid.i0, grid.i1)
+        self.U = 0.1 + 0.01 * ii
+
+    def update(self, step):
+        self.time = self.step0 + step
+
+    def velocity(self, X, Y, Z, tstep=0.0):
+        U = self.U[X.round().astype(int) - self.grid.i0] * (1 + 0.1 * self.time)
+        return U, 0.2 * U
+
+    def field(self, X, Y, Z, name):
+        return self.U[X.round().astype(int) - self.grid.i0]
+
+    def close(self):
+        pass
+
+
+class Release:
+    def __init__(self, X):
+        self._B = [dict(X=X, mult=np.ones(len(X), dtype=int))]
+
+
+config = dict(
+    warm_start_file="",
+    start_time=np.datetime64("2000-01-01T00", "s"),
+    dt=3600,
+    numsteps=10,
+    ibm_module="",
+    ibm_variables=[],
+    ibm_forcing=[],
+    particle_variables=[],
+    advection="RK4",
+    diffusion=False,
+    gridforce=dict(module=__name__.split(".")[-1]),
+    decomposition=dict(tiles=3, halo=4, rebalance=0),
+)
+
+
+def test_bounds():
+    X = np.concatenate((np.full(10, 5.0), np.linspace(10, 20, 20)))
+    bounds = balanced_bounds(X, 3, 1, 31)
+    assert bounds[0] == 1 and bounds[-1] == 31
+    assert np.all(np.diff(bounds) >= 1)
+    counts = np.bincount(owner(X, bounds), minlength=3)
+    assert max(counts) - min(counts) <= 2
+    # All particles in one point, tiles still one cell wide
+    bounds = balanced_bounds(np.full(10, 5.0), 3, 1, 31)
+    assert list(bounds) == [1, 5, 6, 31]
+    assert list(balanced_bounds(np.array([]), 2, 1, 31)) == [1, 16, 31]
+
+
+def test_tile_limits():
+    limits = tile_limits(np.array([1, 10, 20, 31]), 4, [1, 31, 1, 11])
+    assert limits == [[1, 14, 1, 11], [6, 24, 1, 11], [16, 31, 1, 11]]
+
+
+def test_owner():
+    bounds = np.array([1, 10, 20, 31])
+    X = np.array([1.0, 9.99, 10.0, 19.5, 20.0, 30.0])
+    assert list(owner(X, bounds)) == [0, 0, 1, 1, 2, 2]
+
+
+def test_decomposition_as_serial():
+    grid = gridforce.Grid(config)
+    serial_forcing = gridforce.Forcing(config, grid)
+
+    X = np.linspace(2.0, 25.0, 40)
+    Y = np.linspace(2.0, 9.0, 40)
+    decomposition = Decomposition(config, grid, Release(X))
+    forcing = decomposition.forcing
+    try:
+        F = serial_forcing.forcing.field(X, Y, X, "temp")
+        assert np.all(forcing.field(X, Y, X, "temp") == F)
+        serial = State(config, grid)
+        state = State(config, grid)
+        state.parallel = decomposition
+        for st in [serial, state]:
+            st.pid = np.arange(40)
+            st.X, st.Y, st.Z = X.copy(), Y.copy(), np.full(40, 10.0)
+        for step in range(4):
+            serial_forcing.update(step)
+            serial.update(grid, serial_forcing)
+            forcing.update(step)
+            state.update(grid, forcing)
+            for name in ["pid", "X", "Y", "Z"]:
+                assert np.all(state[name] == serial[name])
+        assert len(state) < 40  # Some have left the grid
+    finally:
+        forcing.close()
+
+
+def test_rebalance_as_serial():
+    """Rebalancing every second step, same result as serial"""
+    grid = gridforce.Grid(config)
+    serial_forcing = gridforce.Forcing(config, grid)
+
+    X = np.linspace(2.0, 14.0, 40)
+    Y = np.linspace(2.0, 9.0, 40)
+    conf = dict(config, decomposition=dict(tiles=3, halo=4, rebalance=2))
+    decomposition = Decomposition(conf, grid, Release(X))
+    forcing = decomposition.forcing
+    bounds = [list(decomposition.bounds)]
+    try:
+        serial = State(conf, grid)
+        state = State(conf, grid)
+        state.parallel = decomposition
+        for st in [serial, state]:
+            st.pid = np.arange(40)
+            st.X, st.Y, st.Z = X.copy(), Y.copy(), np.full(40, 10.0)
+        for step in range(8):
+            serial_forcing.update(step)
+            serial.update(grid, serial_forcing)
+            forcing.update(step)
+            state.update(grid, forcing)
+            bounds.append(list(decomposition.bounds))
+            for name in ["pid", "X", "Y", "Z"]:
+                assert np.all(state[name] == serial[name])
+        # The tiles have followed the particles
+        assert bounds[-1] != bounds[0]
+        assert len({str(b) for b in bounds}) > 2
+    finally:
+        forcing.close()
+
+
+def test_halo_check():
+    """Particles moving out of the halo stop the run"""
+    grid = gridforce.Grid(config)
+    X = np.linspace(2.0, 25.0, 40)
+    # About 2 grid cells per time step
+    narrow = dict(config, dt=4 * 3600, decomposition=dict(tiles=3, halo=2, rebalance=0))
+    decomposition = Decomposition(narrow, grid, Release(X))
+    forcing = decomposition.forcing
+    try:
+        state = State(narrow, grid)
+        state.parallel = decomposition
+        state.pid = np.arange(40)
+        state.X, state.Y, state.Z = X.copy(), np.full(40, 5.0), np.full(40, 10.0)
+        with pytest.raises(SystemExit):
+            for step in range(4):
+                forcing.update(step)
+                state.update(grid, forcing)
+    finally:
+        forcing.close()
+
+
+def test_configure():
+    conf = dict(decomposition=dict(tiles=4, rebalance=[1, "D"]))
+    cfg = dict(dt=3600, parallel=dict(workers=1))
+    assert configure_decomposition({}, cfg) == {}
+    D = configure_decomposition(conf, cfg)
+    assert D == dict(tiles=4, halo=10, rebalance=24)
+    with pytest.raises(SystemExit):
+        configure_decomposition(dict(decomposition=dict(halo=1)), cfg)
+    with pytest.raises(SystemExit):
+        configure_decomposition(conf, dict(dt=3600, parallel=dict(workers=2)))
@@ -0,0 +1,69 @@
+from io import StringIO
+
+import pytest
+
+from ladim.ensemble import merge, member_confs
+
+
+def test_merge():
+    base = dict(files=dict(particle_release_file="a.rls", output_file="a.nc"), dt=600)
+    overlay = dict(files=dict(output_file="b.nc"), numerics=dict(diffusion=1.0))
+    merged = merge(base, overlay)
+    assert merged == dict(
+        files=dict(particle_release_file="a.rls", output_file="b.nc"),
+        dt=600,
+        numerics=dict(diffusion=1.0),
+    )
+    # Base unchanged
+    assert base["files"]["output_file"] == "a.nc"
+
+
+def test_member_confs(tmp_path):
+    base = tmp_path / "base.yaml"
+    base.write_text("files: {particle_release_file: a.rls, output_file: a.nc}\n")
+    overlay = tmp_path / "deep.yaml"
+    overlay.write_text("particle_release: {Z: 50}\nfiles: {output_file: c.nc}\n")
+    ensemble = StringIO(
+        f"base: {base}\n"
+        "members:\n"
+        "  - name: one\n"
+        "  - files: {output_file: b.nc}\n"
+        f"  - file: {overlay}\n"
+        "    files: {output_file: d.nc}\n"
+    )
+    confs = member_confs(ensemble)
+    assert [name for name, conf in confs] == ["one", "member1", "member2"]
+    assert [conf["files"]["output_file"] for name, conf in confs] == [
+        "a.nc",
+        "b.nc",
+        "d.nc",
+    ]
+    assert confs[2][1]["particle_release"] == dict(Z=50)
+    assert confs[2][1]["files"]["particle_release_file"] == "a.rls"
+
+
+def test_no_members():
+    with pytest.raises(SystemExit):
+        member_confs(StringIO("members: []\n"))
+
+
+def test_run_settings_common(monkeypatch):
+    """Members must agree on the run settings, not silently dropped"""
+    from pathlib import Path
+    from ladim.ensemble import configure_ensemble
+
+    example = Path(__file__).parent.parent / "examples" / "obstacle"
+    monkeypatch.chdir(example)
+    members = (
+        "base: ladim.yaml\n"
+        "members:\n"
+        "  - files: {output_file: a.nc}\n"
+        "    memory: {budget: 100}\n"
+        "  - files: {output_file: b.nc}\n"
+        "    memory: {budget: %s}\n"
+    )
+    configs = configure_ensemble(StringIO(members % 100))
+    budgets = [config["memory"]["budget"] for name, config in configs]
+    assert budgets == [100 * 2 ** 20] * 2
+    with pytest.raises(SystemExit):
+        configure_ensemble(StringIO(members % 200))
@@ -0,0 +1,47 @@
+import pytest
+
+from ladim.configuration import configure_hooks
+from ladim.hooks import Hooks, HOOK_POINTS
+
+HOOK_MODULE = """
+class Hook:
+    def __init__(self, config):
+        self.label = config["hooks"]["label"]
+        self.calls = []
+
+    def post_release(self, state, forcing, step):
+        self.calls.append((self.label, "post_release", step))
+
+    def pre_tracker(self, state, forcing, step):
+        self.calls.append((self.label, "pre_tracker", step))
+"""
+
+
+def test_no_hooks():
+    hooks = Hooks({})
+    for point in HOOK_POINTS:
+        assert getattr(hooks, point) == []
+
+
+def test_register():
+    hooks = Hooks(dict(hooks={}))
+    calls = []
+    hooks.register("post_forcing", lambda state, forcing, step: calls.append(step))
+    for step in range(3):
+        for hook in hooks.post_forcing:
+            hook(None, None, step)
+    assert calls == [0, 1, 2]
+    with pytest.raises(SystemExit):
+        hooks.register("post_everything", print)
+
+
+def test_module(tmp_path, monkeypatch):
+    (tmp_path / "myhook.py").write_text(HOOK_MODULE)
+    monkeypatch.chdir(tmp_path)
+    config = dict(hooks=configure_hooks(dict(hooks=dict(module="myhook", label="A"))))
+    assert config["hooks"] == dict(modules=["myhook"], label="A")
+    hooks = Hooks(config)
+    assert len(hooks.post_release) == len(hooks.pre_tracker) == 1
+    assert hooks.pre_release == []
+    hooks.post_release[0](None, None, 4)
+    assert hooks.objects[0].calls == [("A", "post_release", 4)]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from ladim.configuration import configure_memory
+from ladim.memory import Memory, array_bytes, memory_usage
+
+
+class Forcing:
+    def __init__(self):
+        self.U = np.zeros((10, 20))  # 1600 bytes
+        self.Unew = self.U  # Same array
+        self.dU = self.U[:5]  # View
+        self.ibm_forcing = ["temp"]
+        self.fields = dict(temp=np.zeros(100, dtype="f4"))  # 400 bytes
+        self.N = 10
+
+
+class State:
+    def __init__(self, n):
+        self.pid = np.arange(n, dtype="i8")
+        self.X = np.zeros(n)
+        self.instance_variables = ["X"]
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def test_array_bytes():
+    assert array_bytes(Forcing()) == 2000
+    assert array_bytes(None) == 0
+
+
+def test_usage_shared():
+    state = State(100)
+    usage = memory_usage(state=state, alias=state, forcing=Forcing())
+    assert usage == dict(state=1600, alias=0, forcing=2000, total=3600)
+
+
+def test_budget():
+    memory = Memory(dict(memory=dict(interval=0, budget=2000)))
+    memory.update(state=State(100))
+    memory.update(state=State(50))
+    assert memory.peak["state"] == 1600
+    with pytest.raises(SystemExit):
+        memory.update(state=State(200))
+
+
+def test_release_budget():
+    """Stop before a release exceeding the budget, 16 bytes per particle"""
+    memory = Memory(dict(memory=dict(interval=0, budget=2000)))
+    state = State(100)
+    memory.update(state=state)
+    memory.check_release(state, 20)
+    # The estimate includes the release above
+    with pytest.raises(SystemExit):
+        memory.check_release(state, 6)
+
+
+def test_configure():
+    assert configure_memory({}) == {}
+    assert configure_memory(dict(memory=None)) == dict(interval=60, budget=None)
+    D = configure_memory(dict(memory=dict(budget=2.5, interval=10)))
+    assert D == dict(interval=10, budget=2621440)
@@ -0,0 +1,312 @@
+import os
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from ladim.configuration import check_encoding
+from ladim.output import OutPut
+
+
+class Release:
+    """Minimal particle releaser"""
+
+    def __init__(self, total_particle_count):
+        self.total_particle_count = total_particle_count
+        self.particle_variables = dict(
+            release_time=np.zeros(total_particle_count),
+        )
+
+
+class State:
+    """Minimal model state"""
+
+    def __init__(self, pid, timestamp):
+        self.pid = np.asarray(pid)
+        self.X = 10.0 + self.pid
+        self.Y = 20.0 + self.pid
+        self.Z = 5.0 + 0 * self.pid
+        self.timestep = 0
+        self.timestamp = np.datetime64(timestamp, "s")
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __len__(self):
+        return len(self.pid)
+
+
+def make_config(filename, **args):
+    config = dict(
+        output_file=filename,
+        output_instance=["pid", "X", "Y", "Z"],
+        output_particle=["release_time"],
+        output_format="NETCDF3_64BIT_OFFSET",
+        output_numrec=0,
+        skip_initial=False,
+        dt=3600,
+        num_output=2,
+        reference_time=np.datetime64("2000-01-01", "s"),
+        nc_attributes=dict(
+            release_time=dict(ncformat="f8", units="seconds since 2000-01-01"),
+            pid=dict(ncformat="i4", long_name="particle identifier"),
+            X=dict(ncformat="f4"),
+            Y=dict(ncformat="f4"),
+            Z=dict(ncformat="f4"),
+        ),
+    )
+    config.update(args)
+    return config
+
+
+def write_two_records(config, total=5, output_class=OutPut):
+    out = output_class(config, Release(total))
+    out.write(State([0, 1, 2], "2000-01-01T00"), grid=None)
+    out.write(State([0, 2, 3, 4], "2000-01-01T01"), grid=None)
+
+
+@pytest.fixture
+def filename():
+    fname = "test_output.nc"
+    yield fname
+    if os.path.exists(fname):
+        os.remove(fname)
+
+
+def test_netcdf3(filename):
+    """Default NetCDF3 output is unchanged by the encoding options"""
+    config = make_config(filename, output_encoding=dict(complevel=9))
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        assert nc.file_format == "NETCDF3_64BIT_OFFSET"
+        assert list(nc.variables["particle_count"][:]) == [3, 4]
+        assert list(nc.variables["pid"][:]) == [0, 1, 2, 0, 2, 3, 4]
+        assert np.all(nc.variables["X"][:] == [10, 11, 12, 10, 12, 13, 14])
+
+
+def test_netcdf4_default(filename):
+    """Compression and one-record chunking by default"""
+    config = make_config(filename, output_format="NETCDF4")
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        X = nc.variables["X"]
+        assert X.filters()["zlib"]
+        assert X.chunking() == [1024]
+        assert np.all(X[:] == [10, 11, 12, 10, 12, 13, 14])
+
+
+def test_netcdf4_encoding(filename):
+    """Global defaults and per variable encoding"""
+    config = make_config(
+        filename,
+        output_format="NETCDF4",
+        output_encoding=dict(complevel=2, shuffle=False, chunksizes=[100]),
+        nc_encoding=dict(
+            X=dict(complevel=6, shuffle=True, least_significant_digit=2),
+            Y=dict(zlib=False, chunksizes=[3], fletcher32=True),
+        ),
+    )
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        X = nc.variables["X"]
+        assert X.filters()["complevel"] == 6
+        assert X.filters()["shuffle"]
+        assert X.chunking() == [100]
+        assert X.least_significant_digit == 2
+        Y = nc.variables["Y"]
+        assert not Y.filters()["zlib"]
+        assert Y.filters()["fletcher32"]
+        assert Y.chunking() == [3]
+        Z = nc.variables["Z"]
+        assert Z.filters()["complevel"] == 2
+        assert not Z.filters()["shuffle"]
+        # Chunks of the particle dimension limited by number of particles
+        assert nc.variables["release_time"].chunking() == [5]
+        assert np.all(nc.variables["Y"][:] == [20, 21, 22, 20, 22, 23, 24])
+
+
+def test_netcdf4_no_particles(filename):
+    """Chunk size of the particle dimension at least one"""
+    config = make_config(
+        filename, output_format="NETCDF4", output_encoding=dict(chunksizes=[100])
+    )
+    out = OutPut(config, Release(0))
+    out.write(State([], "2000-01-01T00"), grid=None)
+    with Dataset(filename) as nc:
+        assert list(nc.variables["particle_count"][:1]) == [0]
+        assert nc.variables["release_time"].chunking() == [1]
+
+
+def test_check_encoding():
+    assert check_encoding("X", None) == {}
+    assert check_encoding("X", dict(chunksize=10)) == dict(chunksizes=[10])
+    with pytest.raises(SystemExit):
+        check_encoding("X", dict(compression_level=3))
+    with pytest.raises(SystemExit):
+        check_encoding("encoding", [1, 2])
+
+
+def test_packed(filename):
+    """Positions packed as scaled integers"""
+    attrs = make_config(filename)["nc_attributes"]
+    attrs["X"] = dict(ncformat="i4", scale_factor=0.001)
+    attrs["Z"] = dict(ncformat="u2", scale_factor=0.01, add_offset=-1.0)
+    config = make_config(filename, output_format="NETCDF4", nc_attributes=attrs)
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        X = nc.variables["X"]
+        Z = nc.variables["Z"]
+        assert X.dtype == np.int32
+        assert Z.dtype == np.uint16
+        assert np.allclose(X[:], [10, 11, 12, 10, 12, 13, 14])
+        assert np.allclose(Z[:], 5.0)
+        X.set_auto_scale(False)
+        Z.set_auto_scale(False)
+        assert list(X[:3]) == [10000, 11000, 12000]
+        assert np.all(Z[:] == 600)
+
+
+def test_packed_clipping(filename):
+    """Out of range values are clipped, avoiding the fill value"""
+    attrs = make_config(filename)["nc_attributes"]
+    attrs["X"] = dict(ncformat="i2", scale_factor=0.0001)
+    attrs["Y"] = dict(ncformat="u2", scale_factor=1.0, add_offset=21.0)
+    config = make_config(filename, output_format="NETCDF4", nc_attributes=attrs)
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        X = nc.variables["X"]
+        Y = nc.variables["Y"]
+        X.set_auto_scale(False)
+        Y.set_auto_scale(False)
+        assert np.all(X[:] == 32767)
+        assert list(Y[:3]) == [0, 0, 1]
+
+
+def test_packed_nan(filename):
+    """Non-finite values are packed to the fill value"""
+    attrs = make_config(filename)["nc_attributes"]
+    attrs["X"] = dict(ncformat="i2", scale_factor=0.01)
+    attrs["Y"] = dict(ncformat="i4", scale_factor=0.01)
+    config = make_config(filename, output_format="NETCDF4", nc_attributes=attrs)
+    out = OutPut(config, Release(3))
+    state = State([0, 1, 2], "2000-01-01T00")
+    state.X = np.array([np.nan, 1.0, np.inf])
+    state.Y = np.array([2.0, np.nan, -np.inf])
+    out.write(state, grid=None)
+    with Dataset(filename) as nc:
+        X = nc.variables["X"]
+        Y = nc.variables["Y"]
+        assert X._FillValue == -32767
+        assert Y._FillValue == -2147483647
+        assert list(X[:].mask) == [True, False, True]
+        assert list(Y[:].mask) == [False, True, True]
+        assert np.allclose(X[1], 1.0)
+        assert np.allclose(Y[0], 2.0)
+
+
+def test_packed_float():
+    """Packing requires integer format"""
+    attrs = make_config("dummy.nc")["nc_attributes"]
+    attrs["X"] = dict(ncformat="f4", scale_factor=0.001)
+    with pytest.raises(SystemExit):
+        OutPut(make_config("dummy.nc", nc_attributes=attrs), Release(5))
+
+
+def test_zarr():
+    """Zarr store with the same ragged layout"""
+    zarr = pytest.importorskip("zarr")
+    import shutil
+    from ladim.output import ZarrOutPut
+
+    store = "test_output.zarr"
+    attrs = make_config(store)["nc_attributes"]
+    attrs["Z"] = dict(ncformat="i2", scale_factor=0.01)
+    config = make_config(
+        store,
+        output_format="zarr",
+        nc_attributes=attrs,
+        nc_encoding=dict(X=dict(chunksizes=[2])),
+    )
+    write_two_records(config, output_class=ZarrOutPut)
+    try:
+        root = zarr.open_consolidated(store)
+        assert list(root["particle_count"][:]) == [3, 4]
+        assert list(root["time"][:]) == [0, 3600]
+        assert list(root["pid"][:]) == [0, 1, 2, 0, 2, 3, 4]
+        assert list(root["X"][:]) == [10, 11, 12, 10, 12, 13, 14]
+        assert root["X"].chunks == (2,)
+        assert root["Y"].chunks == (1024,)
+        assert list(root["Z"][:2]) == [500, 500]
+        assert root["Z"].fill_value == -32767
+        assert root["Z"].attrs["scale_factor"] == 0.01
+        assert root["pid"].attrs["_ARRAY_DIMENSIONS"] == ["particle_instance"]
+        assert len(root["release_time"]) == 5
+    finally:
+        shutil.rmtree(store)
+
+
+def test_subsample_every(filename):
+    """Every second particle, particle_count reflects the written ones"""
+    config = make_config(filename, output_subsample=dict(every=2))
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        assert list(nc.variables["particle_count"][:]) == [2, 3]
+        assert list(nc.variables["pid"][:]) == [0, 2, 0, 2, 4]
+        assert np.all(nc.variables["X"][:] == [10, 12, 10, 12, 14])
+
+
+def test_subsample_fraction(filename):
+    """Random fraction, fixed selection of particles"""
+    config = make_config(filename, output_subsample=dict(fraction=0.5, seed=1))
+    out = OutPut(config, Release(1000))
+    selected = out.particle_selection
+    assert 400 < selected.sum() < 600
+    out.write(State(np.arange(1000), "2000-01-01T00"), grid=None)
+    out.write(State(np.arange(0, 1000, 3), "2000-01-01T01"), grid=None)
+    with Dataset(filename) as nc:
+        count = nc.variables["particle_count"][:]
+        pid = nc.variables["pid"][:]
+        assert count[0] == selected.sum()
+        assert list(pid[: count[0]]) == list(np.flatnonzero(selected))
+        assert np.all(selected[pid[count[0] :]])
+
+
+def test_subsample_region(filename):
+    """Bounding box and polygon"""
+    config = make_config(
+        filename,
+        output_subsample=dict(
+            bbox=[10.5, 20, 0, 100], polygon=[[0, 0], [13.5, 0], [13.5, 50], [0, 50]]
+        ),
+    )
+    write_two_records(config)
+    with Dataset(filename) as nc:
+        assert list(nc.variables["particle_count"][:]) == [2, 2]
+        assert list(nc.variables["pid"][:]) == [1, 2, 2, 3]
+
+
+def test_text_variable():
+    """Text particle variable, blank padded and truncated, in split files"""
+    attrs = make_config("text.nc")["nc_attributes"]
+    attrs["farm"] = dict(ncformat="S4", long_name="farm name")
+    config = make_config(
+        "text.nc", output_particle=["farm"], output_numrec=1, nc_attributes=attrs
+    )
+    release = Release(5)
+    release.particle_variables["farm"] = np.array(
+        ["Alpha", "Bo", "Cee", "Dublin", ""], dtype=object
+    )
+    out = OutPut(config, release)
+    out.write(State([0, 1, 2], "2000-01-01T00"), grid=None)
+    out.write(State([0, 2, 3, 4], "2000-01-01T01"), grid=None)
+    try:
+        for fname in ["text_0000.nc", "text_0001.nc"]:
+            with Dataset(fname) as nc:
+                farm = nc.variables["farm"]
+                assert farm.dimensions == ("particle", "len_farm")
+                farm.set_auto_chartostring(False)
+                names = [b"".join(row).decode() for row in farm[:]]
+                assert names == ["Alph", "Bo  ", "Cee ", "Dubl", "    "]
+    finally:
+        for fname in ["text_0000.nc", "text_0001.nc"]:
+            os.remove(fname)
@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+from ladim.configuration import configure_parallel
+from ladim.gridforce import Grid, Forcing
+from ladim.parallel import ParticleParallel, SharedObject, rebuild
+from ladim.state import State
+
+
+class GridModule:
+    """Gridforce grid, 20 x 10 cells with a masked depth array"""
+
+    def __init__(self):
+        self.xmin, self.xmax = 0.0, 19.0
+        self.ymin, self.ymax = 0.0, 9.0
+        self.H = np.ma.MaskedArray(np.linspace(10, 200, 200).reshape(10, 20))
+        self.dx = np.full((10, 20), 1000.0)
+
+    def sample_metric(self, X, Y):
+        return self.dx[Y.astype(int), X.astype(int)], np.full(len(X), 1000.0)
+
+    def sample_depth(self, X, Y):
+        return self.H[Y.astype(int), X.astype(int)]
+
+    def ingrid(self, X, Y):
+        return (self.xmin <= X) & (X <= self.xmax) & (self.ymin <= Y) & (Y <= self.ymax)
+
+    def atsea(self, X, Y):
+        return np.ones(len(X), dtype=bool)
+
+
+class ForcingModule:
+    """Gridforce forcing, the velocity array is replaced by update"""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.U = np.linspace(0.1, 0.5, 200).reshape(10, 20)
+        self.steps = [0]
+
+    def update(self, step):
+        self.U = self.U * 1.1
+
+    def velocity(self, X, Y, Z, tstep=0.0):
+        U = self.U[Y.astype(int), X.astype(int)]
+        return U, 0.2 * U
+
+    def close(self):
+        pass
+
+
+config = dict(
+    warm_start_file="",
+    start_time=np.datetime64("2000-01-01T00"),
+    dt=3600,
+    ibm_module="",
+    ibm_variables=[],
+    particle_variables=[],
+    advection="RK4",
+    diffusion=False,
+    total_particle_count=50,
+    parallel=dict(workers=3, seed=1, threads=2, chunk_size=10),
+)
+
+
+def model():
+    grid = Grid.__new__(Grid)
+    grid.grid = GridModule()
+    for name in ["xmin", "xmax", "ymin", "ymax"]:
+        setattr(grid, name, getattr(grid.grid, name))
+    forcing = Forcing.__new__(Forcing)
+    forcing.forcing = ForcingModule(grid.grid)
+    forcing.start_threads(config)
+    state = State(config, grid)
+    state.pid = np.arange(50)
+    state.X = np.linspace(1.0, 18.0, 50)
+    state.Y = np.linspace(1.0, 8.0, 50)
+    state.Z = np.linspace(0.0, 300.0, 50)
+    return grid, forcing, state
+
+
+def test_shared_object():
+    grid = GridModule()
+    forcing = ForcingModule(grid)
+    U = forcing.U.copy()
+    shared = SharedObject(forcing, dict(grid=grid))
+    blocks = []
+    copy = rebuild(shared.spec(), dict(grid="the grid"), blocks)
+    assert copy.grid == "the grid"
+    assert copy.steps == [0]
+    assert np.all(copy.U == U)
+    # In-place change is seen directly, new array after sync
+    forcing.U += 1
+    assert np.all(copy.U == U + 1)
+    forcing.update(0)
+    assert np.all(copy.U == U + 1)
+    shared.sync()
+    assert np.all(copy.U == 1.1 * (U + 1))
+    for shm in blocks:
+        shm.close()
+    shared.close()
+    assert np.all(forcing.U == 1.1 * (U + 1))
+
+
+def test_shared_masked():
+    grid = GridModule()
+    grid.H[0, 0] = np.ma.masked
+    shared = SharedObject(grid, {})
+    blocks = []
+    copy = rebuild(shared.spec(), {}, blocks)
+    assert isinstance(copy.H, np.ma.MaskedArray)
+    assert copy.H.mask[0, 0] and not copy.H.mask[0, 1]
+    assert np.all(copy.H[1:] == grid.H[1:])
+    for shm in blocks:
+        shm.close()
+    shared.close()
+
+
+def test_parallel_as_serial():
+    grid, forcing, serial = model()
+    pgrid, pforcing, state = model()
+    state.parallel = ParticleParallel(config, pgrid, pforcing, state)
+    try:
+        for step in range(4):
+            forcing.update(step)
+            serial.update(grid, forcing)
+            pforcing.update(step)
+            state.update(pgrid, pforcing)
+            assert len(state) == len(serial)
+            for name in ["pid", "X", "Y", "Z"]:
+                assert np.all(state[name] == serial[name])
+        assert state.timestamp == serial.timestamp
+        assert len(state) < 50  # Some particles have left the grid
+    finally:
+        state.parallel.close()
+
+
+def test_threads():
+    """Chunked sampling on a thread pool"""
+    grid, forcing, state = model()
+    U0, V0 = forcing.velocity(state.X, state.Y, state.Z, tstep=0.5)
+    forcing.start_threads(dict(parallel=dict(threads=3, chunk_size=7)))
+    U, V = forcing.velocity(state.X, state.Y, state.Z, tstep=0.5)
+    assert np.all(U == U0) and np.all(V == V0)
+    forcing.close()
+
+
+def test_threads_velocity_fields():
+    """Fields interpolated in time once, shared by the chunks"""
+    grid, forcing, state = model()
+    U0, V0 = forcing.velocity(state.X, state.Y, state.Z, tstep=0.5)
+    calls = []
+
+    def velocity_fields(tstep):
+        calls.append(tstep)
+        return forcing.forcing.U, None
+
+    def sample_velocity(U, V, X, Y, Z):
+        return forcing.forcing.velocity(X, Y, Z)
+
+    forcing.forcing.velocity_fields = velocity_fields
+    forcing.forcing.sample_velocity = sample_velocity
+    forcing.start_threads(dict(parallel=dict(threads=3, chunk_size=7)))
+    U, V = forcing.velocity(state.X, state.Y, state.Z, tstep=0.5)
+    assert calls == [0.5]
+    assert np.all(U == U0) and np.all(V == V0)
+    forcing.close()
+    assert forcing.executor is None
+
+
+def test_configure():
+    D = configure_parallel({})
+    assert D == dict(workers=1, seed=None, threads=1, chunk_size=65536)
+    D = configure_parallel(dict(parallel=dict(workers=4, seed=42, threads=2)))
+    assert D == dict(workers=4, seed=42, threads=2, chunk_size=65536)
+    with pytest.raises(SystemExit):
+        configure_parallel(dict(parallel=dict(workers=0)))
+    with pytest.raises(SystemExit):
+        configure_parallel(dict(parallel=dict(chunk_size=1.5)))
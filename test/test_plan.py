@@ -0,0 +1,62 @@
+import numpy as np
+
+from ladim.plan import live_particles, output_sizes, forcing_frames
+
+
+def test_live_particles():
+    """Warm start particles and releases, releases after stop ignored"""
+    live = live_particles(np.array([0, 2, 9]), [5, 10, 20, 40], numsteps=4)
+    assert list(live) == [15, 15, 35, 35, 35]
+
+
+def test_output_sizes():
+    config = dict(
+        output_instance=["pid", "X"],
+        output_particle=["release_time"],
+        nc_attributes=dict(
+            pid=dict(ncformat="i4"), X=dict(ncformat="f4"), release_time=dict(ncformat="f8")
+        ),
+        output_period=2,
+        num_output=3,
+        skip_initial=False,
+        output_numrec=2,
+    )
+    live = np.array([10, 10, 20, 20, 30])
+    sizes = output_sizes(config, live, total=30)
+    assert sizes == [2 * 12 + 8 * 30 + 240, 12 + 8 * 30 + 240]
+    config.update(output_numrec=0, skip_initial=True, output_subsample=dict(every=2))
+    assert output_sizes(config, live, total=30) == [2 * 12 + 8 * 25 + 240]
+
+
+class Forcing:
+    """ROMS type forcing with hourly frames, ten minute time step"""
+
+    @staticmethod
+    def find_files(config):
+        return ["file_0001.nc", "file_0002.nc"]
+
+    @staticmethod
+    def scan_file_times(files):
+        return None, None
+
+    @staticmethod
+    def forcing_steps(config, files, all_frames, num_frames):
+        return list(range(-12, 100, 6)), None, None
+
+
+class Module:
+    Forcing = Forcing
+
+
+def test_forcing_frames():
+    config = dict(gridforce={}, numsteps=30)
+    # Frames at steps -6, 0, ..., 30
+    assert forcing_frames(Module, config) == 7
+    config["numsteps"] = 31
+    assert forcing_frames(Module, config) == 8
+    # Forcing ending before the simulation, frames -6, 0, ..., 96
+    config["numsteps"] = 200
+    assert forcing_frames(Module, config) == 18
+    # Unknown for forcing without file scanning
+    Module.Forcing = object
+    assert forcing_frames(Module, config) is None
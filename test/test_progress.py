@@ -0,0 +1,40 @@
+from io import StringIO
+
+import numpy as np
+import yaml
+
+from ladim.configuration import configure_progress
+from ladim.progress import Progress
+from ladim.timing import timer
+
+
+class State:
+    def __init__(self, n):
+        self.X = np.zeros(n)
+
+    def __len__(self):
+        return len(self.X)
+
+
+def test_report():
+    timer.reset()
+    progress = Progress(dict(progress=dict(interval=10), numsteps=99, dt=600))
+    state = State(1000)
+    start = progress.start
+    for step in range(20):
+        progress.update(state, step)  # Too early for a report
+    assert progress.particle_steps == 20000
+    timer.add("forcing.read", 2.0)
+    text = progress.report(state, 20, start + 10.0)
+    assert "step 19/99 (20.0%)" in text
+    assert "speed 1200.0x real time" in text  # 20 steps of 10 min in 10 s
+    assert "2e+03 particle steps/s" in text
+    assert "forcing read 20.0%" in text
+    assert progress.particle_steps == 0
+    timer.reset()
+
+
+def test_configure():
+    assert configure_progress({}) == dict(interval=60)
+    conf = yaml.safe_load(StringIO("progress:\n    interval: 0\n"))
+    assert configure_progress(conf) == dict(interval=0)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from ladim.configuration import configure_segments
+from ladim.segments import segment_times, merge_output
+
+
+def test_segment_times():
+    config = dict(
+        start_time=np.datetime64("2000-01-01T00", "s"),
+        stop_time=np.datetime64("2000-01-11T00", "s"),
+        segments=dict(length=4 * 86400, lifetime=3 * 86400),
+    )
+    segments = segment_times(config)
+    assert [str(start) for start, stop, release_stop in segments] == [
+        "2000-01-01T00:00:00",
+        "2000-01-05T00:00:00",
+        "2000-01-09T00:00:00",
+    ]
+    assert str(segments[0][1]) == "2000-01-08T00:00:00"
+    assert str(segments[0][2]) == "2000-01-05T00:00:00"
+    # Last segment, up to stop time and no release stop
+    assert segments[-1][1:] == (config["stop_time"], None)
+
+
+def write_segment(fname, times, counts, pid, num_particles):
+    with Dataset(fname, mode="w") as nc:
+        nc.createDimension("particle", num_particles)
+        nc.createDimension("particle_instance", None)
+        nc.createDimension("time", len(times))
+        v = nc.createVariable("time", "f8", ("time",))
+        v.units = "seconds since 2000-01-01"
+        v[:] = times
+        nc.createVariable("instance_offset", "i", ())
+        nc.createVariable("particle_count", "i4", ("time",))[:] = counts
+        nc.createVariable("release_time", "f8", ("particle",))[:] = np.arange(
+            num_particles
+        )
+        nc.createVariable("pid", "i4", ("particle_instance",))[:] = pid
+        nc.createVariable("X", "f4", ("particle_instance",))[:] = 10 + np.array(pid)
+
+
+def test_merge(tmp_path):
+    seg0 = str(tmp_path / "seg0.nc")
+    seg1 = str(tmp_path / "seg1.nc")
+    merged = str(tmp_path / "merged.nc")
+    write_segment(seg0, [0, 3600, 7200], [1, 2, 1], [0, 0, 1, 1], 2)
+    write_segment(seg1, [3600, 7200, 10800], [1, 2, 1], [0, 0, 1, 1], 2)
+    merge_output([seg0, seg1], merged)
+    with Dataset(merged) as nc:
+        assert np.all(nc.variables["time"][:] == [0, 3600, 7200, 10800])
+        assert np.all(nc.variables["particle_count"][:] == [1, 3, 3, 1])
+        assert np.all(nc.variables["pid"][:] == [0, 0, 1, 2, 1, 2, 3, 3])
+        assert np.all(nc.variables["X"][:] == [10, 10, 11, 10, 11, 10, 11, 11])
+        assert np.all(nc.variables["release_time"][:] == [0, 1, 0, 1])
+        assert nc.variables["time"].units == "seconds since 2000-01-01"
+
+
+def test_configure():
+    config = dict(dt=600, output_file="out.nc", output_period=6)
+    assert configure_segments({}, config) == {}
+    conf = dict(segments=dict(length=[2, "h"], lifetime=[1, "D"]))
+    D = configure_segments(conf, config)
+    assert D == dict(length=7200, lifetime=86400, processes=1)
+    conf = dict(segments=dict(length=[90, "m"], lifetime=[1, "D"]))
+    with pytest.raises(SystemExit):  # Not multiple of output period
+        configure_segments(conf, config)
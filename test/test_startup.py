@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+# Cold import and configuration in a fresh interpreter
+SCRIPT = """
+import sys, time, logging
+tic = time.perf_counter()
+import ladim
+from ladim.configuration import configure
+logging.disable()
+with open({config!r}) as fid:
+    configure(fid)
+print(time.perf_counter() - tic)
+print(*[m for m in ["pandas", "netCDF4", "xarray"] if m in sys.modules])
+"""
+
+CONFIG = os.path.join(
+    os.path.dirname(__file__), "..", "examples", "obstacle", "ladim.yaml"
+)
+
+
+def test_startup():
+    """Configuration does not load pandas or netCDF4"""
+    script = SCRIPT.format(config=CONFIG)
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    seconds, modules = result.stdout.split("\n")[:2]
+    assert modules == ""
+    # About 0.1 s, 0.35 s with pandas and netCDF4
+    assert float(seconds) < 1.0
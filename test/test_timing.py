@@ -0,0 +1,39 @@
+import csv
+import json
+import time
+
+from ladim.timing import Timer
+
+
+def test_timer(tmp_path):
+    timer = Timer()
+    timer.reset(record_steps=True)
+    for step in range(3):
+        with timer("update"):
+            for _ in range(4):
+                with timer("update.velocity"):
+                    time.sleep(0.001)
+        if step == 1:
+            with timer("output"):
+                pass
+        timer.end_step(step)
+    timer.add("time loop", 1.0)
+
+    assert timer.calls == {"update.velocity": 12, "update": 3, "output": 1, "time loop": 1}
+    assert timer.total["update"] >= timer.total["update.velocity"] >= 0.012
+
+    lines = timer.summary().split("\n")
+    assert lines[1].split()[:2] == ["output", "1"]
+    assert lines[3].split()[:2] == ["velocity", "12"]  # Indented sub-phase
+    assert lines[-1].split()[-1] == "100.0"
+
+    timer.write_json(tmp_path / "timing.json")
+    with open(tmp_path / "timing.json") as fid:
+        assert json.load(fid)["update.velocity"]["calls"] == 12
+
+    timer.write_csv(tmp_path / "timing.csv")
+    with open(tmp_path / "timing.csv") as fid:
+        rows = list(csv.reader(fid))
+    assert rows[0] == ["step", "output", "update", "update.velocity"]
+    assert len(rows) == 4
+    assert float(rows[1][1]) == 0.0  # No output at step 0
@@ -1,5 +1,5 @@
 import numpy as np
-from ladim.utilities import timestep2stamp, timestamp2step
+from ladim.utilities import timestep2stamp, timestamp2step, inside_polygon
 
 config = dict(dt=600, start_time=np.datetime64("2017-02-10 20"))
 
@@ -17,3 +17,18 @@ def test_stamp2step() -> None:
     timestamp = np.datetime64("2017-02-10 20:50")
     step = timestamp2step(config, timestamp)
     assert step == answer
+
+
+def test_inside_polygon():
+    # Non-convex polygon, an L-shape
+    polygon = [[0, 0], [4, 0], [4, 1], [1, 1], [1, 3], [0, 3]]
+    x = np.array([0.5, 3.5, 3.5, 0.5, 2.0, -1.0])
+    y = np.array([0.5, 0.5, 2.0, 2.5, 0.2, 0.5])
+    assert list(inside_polygon(x, y, polygon)) == [
+        True,
+        True,
+        False,
+        True,
+        True,
+        False,
+    ]